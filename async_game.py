@@ -0,0 +1,208 @@
+"""Games whose decisions are awaited, for agents that answer asynchronously.
+
+``take_turn_async`` and ``play_game_async`` play a ``MachiKoroGame`` on an
+event loop, awaiting the ``AsyncPolicy`` of a seat at every decision, so
+one loop can interleave thousands of games whose agents are remote
+services or batched model calls (``play_games_async``). Seats may also hold
+ordinary ``Policy`` objects, which are asked directly; a game whose seats
+are all ordinary policies is played by the synchronous ``take_turn``.
+
+Decisions of the turn itself (dice, reroll, purchase, tech startup) are
+awaited between the steps of ``play_turn``. Decisions taken while cards
+activate come from inside ``activate_cards``, which cannot wait: the turn
+stops there, the answer is awaited, and the turn is played again from its
+start with the game and its ``GameRandom`` as they were, every answer given
+so far (awaited or not) handed back in order without asking again. Events
+and recorded decisions are held back until a turn is through, so they are
+seen once.
+"""
+
+import asyncio
+import inspect
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+from events import GameOverEvent
+from game import MachiKoroGame
+from policy import AsyncPolicy, Decision, Policy
+from rng import GameRandom
+
+Agent = Union[Policy, AsyncPolicy]
+
+
+def is_async_agent(agent: Agent) -> bool:
+    return inspect.iscoroutinefunction(agent.choose)
+
+
+class _Pending(Exception):
+    """Raised from a seat when its decision has to be awaited."""
+
+    def __init__(self, decision: Decision):
+        super().__init__(decision.kind)
+        self.decision = decision
+
+
+class _Seat:
+    """Stands in for a seat's agent while an async turn is played."""
+
+    def __init__(self, turn: "_AsyncTurn", agent: Agent):
+        self.turn = turn
+        self.agent = agent
+        self.is_async = is_async_agent(agent)
+
+    def choose(self, decision: Decision) -> Any:
+        if not self.is_async and self.turn.position not in self.turn.answers:
+            # asked once: agents may keep state or draw from sources of
+            # their own, so a turn played again is given the same answer
+            self.turn.keep(self.agent.choose(decision))
+        return self.turn.answer(decision)
+
+
+class _HeldEvents:
+    def __init__(self):
+        self.events: List[Any] = []
+
+    def emit(self, event: Any) -> None:
+        self.events.append(event)
+
+
+class _HeldDecisions:
+    def __init__(self):
+        self.decisions: List[Tuple[Decision, Any]] = []
+
+    def record(self, decision: Decision, choice: Any) -> None:
+        self.decisions.append((decision, choice))
+
+    def end_turn(self) -> None:
+        pass
+
+
+class _AsyncTurn:
+    def __init__(self, game: MachiKoroGame, agents: Sequence[Agent]):
+        self.game = game
+        self.agents = agents
+        self.seats = [_Seat(self, agent) for agent in agents]
+        # answers[i] is the answer to the turn's i-th decision, with the
+        # game's random source as the agent left it
+        self.answers: Dict[int, Tuple[Any, GameRandom]] = {}
+        self.position = 0
+
+    def keep(self, choice: Any) -> None:
+        self.answers[self.position] = (choice, self.game.rng.copy())
+
+    def answer(self, decision: Decision) -> Any:
+        if self.position not in self.answers:
+            raise _Pending(decision)
+        choice, rng = self.answers[self.position]
+        self.position += 1
+        self.game.rng = rng.copy()
+        return choice
+
+    async def wait_for(self, decision: Decision) -> None:
+        self.keep(await self.agents[decision.player_id].choose(decision))
+
+    async def play(self) -> Optional[str]:
+        game = self.game
+        policies, events, recorder = game.policies, game.events, game.recorder
+        snapshot, rng = game.snapshot(), game.rng.copy()
+        profiler = game.profiler
+        # only the attempt that gets through the turn is timed
+        timed = profiler.checkpoint() if profiler is not None else None
+        game.policies = self.seats
+        try:
+            while True:
+                held_events = _HeldEvents() if events is not None else None
+                held_decisions = _HeldDecisions() if recorder is not None else None
+                game.events, game.recorder = held_events, held_decisions
+                self.position = 0
+                try:
+                    purchase = await self._attempt()
+                except _Pending as pending:
+                    await self.wait_for(pending.decision)
+                    game.restore(snapshot)
+                    game.rng = rng.copy()
+                    if profiler is not None:
+                        profiler.rewind(timed)
+                    continue
+                break
+        finally:
+            game.policies, game.events, game.recorder = policies, events, recorder
+        if held_events is not None:
+            for event in held_events.events:
+                events.emit(event)
+        if held_decisions is not None:
+            for decision, choice in held_decisions.decisions:
+                recorder.record(decision, choice)
+            recorder.end_turn()
+        return purchase
+
+    async def _attempt(self) -> Optional[str]:
+        game = self.game
+        turn = game.play_turn()
+        seats = self.seats
+        try:
+            decision = next(turn)
+            while True:
+                is_async = seats[decision.player_id].is_async
+                if is_async and self.position not in self.answers:
+                    await self.wait_for(decision)
+                # through the seat, like every other decision
+                decision = turn.send(game._choose(decision))
+        except StopIteration as stop:
+            return stop.value
+
+
+async def take_turn_async(
+    game: MachiKoroGame, agents: Optional[Sequence[Agent]] = None
+) -> Optional[str]:
+    """``take_turn``, awaiting the decisions of ``agents`` (the game's
+    policies by default)."""
+    agents = game.policies if agents is None else agents
+    if not any(is_async_agent(agent) for agent in agents):
+        policies = game.policies
+        game.policies = list(agents)
+        try:
+            purchase = game.take_turn()
+        finally:
+            game.policies = policies
+        # let the other games on the loop go on
+        await asyncio.sleep(0)
+        return purchase
+    return await _AsyncTurn(game, agents).play()
+
+
+async def play_game_async(
+    game: MachiKoroGame,
+    agents: Optional[Sequence[Agent]] = None,
+    max_turns: Optional[int] = None,
+) -> int:
+    """Play ``game`` to the end; returns the winner, -1 if it was stopped
+    by ``max_turns``."""
+    is_game_over, winner = game.is_game_over()
+    while not is_game_over:
+        if max_turns is not None and game.current_turn >= max_turns:
+            return -1
+        await take_turn_async(game, agents)
+        is_game_over, winner = game.is_game_over()
+    if game.events is not None:
+        game.events.emit(GameOverEvent(game.current_turn, winner))
+    return winner
+
+
+async def play_games_async(
+    games: Sequence[MachiKoroGame],
+    agents: Optional[Sequence[Sequence[Agent]]] = None,
+    max_turns: Optional[int] = None,
+    max_concurrency: Optional[int] = None,
+) -> List[int]:
+    """Play ``games`` concurrently, at most ``max_concurrency`` at a time;
+    ``agents[i]`` seats game ``i``. Returns the winners."""
+    semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+
+    async def play(index: int) -> int:
+        game_agents = None if agents is None else agents[index]
+        if semaphore is None:
+            return await play_game_async(games[index], game_agents, max_turns)
+        async with semaphore:
+            return await play_game_async(games[index], game_agents, max_turns)
+
+    return list(await asyncio.gather(*(play(index) for index in range(len(games)))))
@@ -0,0 +1,535 @@
+from typing import Tuple, Union
+
+import numpy as np
+from frozendict import frozendict
+
+from constants import card_id_dict, starting_buildings_dict
+from game import (
+    AIRPORT,
+    AMUSEMENT_PARK,
+    BREAD_IDS,
+    BUSINESS_CENTER,
+    CARD_COSTS,
+    CARD_ROLLS,
+    CARD_VALUES,
+    COW_IDS,
+    FLOWER_GARDEN,
+    GEAR_IDS,
+    GREEN_ACTIVATION_ORDER,
+    HARBOR,
+    LANDMARK_IDS,
+    LANDMARK_IDS_BY_COST,
+    LOAN_OFFICE,
+    MAJOR_IDS,
+    MAX_ROLL,
+    MOVING_COMPANY,
+    PRIMARY_IDS,
+    PUBLISHER_IDS,
+    RADIO_TOWER,
+    RESTAURANT_IDS,
+    SHOPPING_MALL,
+    TECH_STARTUP,
+    TRAIN_STATION,
+    VINEYARD,
+    WHEAT_IDS,
+    WINERY,
+    MachiKoroGame,
+)
+from rng import SeedSequence
+from state import N_CARDS, N_ESTABLISHMENTS
+
+# Same fields as ``GameState``, each with an extra trailing games axis.
+STATE_FIELDS = (
+    "coins",
+    "is_first_turn",
+    "tech_startups",
+    "market",
+    "working",
+    "on_renovation",
+    "owned",
+)
+
+
+def _as_slice(card_ids) -> slice:
+    if tuple(card_ids) != tuple(range(card_ids[0], card_ids[-1] + 1)):
+        raise ValueError(f"card ids {card_ids} are not contiguous")
+    return slice(card_ids[0], card_ids[-1] + 1)
+
+
+# ACTIVATION_TABLE[card_id, roll] is True when the card fires on that roll;
+# roll 0 fires nothing and stands for a player's first turn.
+ACTIVATION_TABLE = np.zeros((N_CARDS, MAX_ROLL + 1), dtype=bool)
+for _card_id, _rolls in enumerate(CARD_ROLLS):
+    ACTIVATION_TABLE[_card_id, list(_rolls)] = True
+
+COST_ARRAY = np.array(CARD_COSTS, dtype=np.int64)
+CARD_COLUMNS = np.arange(N_CARDS)[:, None]
+ESTABLISHMENT_COLUMNS = np.arange(N_ESTABLISHMENTS)[:, None]
+
+PRIMARY = _as_slice(PRIMARY_IDS)
+RESTAURANTS = _as_slice(RESTAURANT_IDS)
+LANDMARKS = _as_slice(LANDMARK_IDS)
+LANDMARK_BY_COST_ARRAY = np.array(LANDMARK_IDS_BY_COST)
+
+TUNA_COLUMN = PRIMARY_IDS.index(card_id_dict["tuna_boat"])
+CORN_COLUMN = PRIMARY_IDS.index(card_id_dict["corn_field"])
+PRIMARY_VALUES = np.array(
+    [0 if CARD_VALUES[card_id] == "special" else CARD_VALUES[card_id] for card_id in PRIMARY_IDS],
+    dtype=np.int64,
+)[:, None]
+
+SUSHI_BAR = card_id_dict["sushi_bar"]
+FRENCH_RESTAURANT = card_id_dict["french_restaurant"]
+SUSHI_COLUMN = RESTAURANT_IDS.index(SUSHI_BAR)
+FRENCH_COLUMN = RESTAURANT_IDS.index(FRENCH_RESTAURANT)
+MEMBERS_COLUMN = RESTAURANT_IDS.index(card_id_dict["members_only_club"])
+# Stand-in for the members only club's "all coins", larger than any purse.
+ALL_COINS = 1 << 40
+
+
+def _restaurant_value(card_id: int) -> int:
+    """Coins one copy takes, as in the MachiKoroGame card handlers."""
+    value = CARD_VALUES[card_id]
+    if value == "special":
+        return {SUSHI_BAR: 3, FRENCH_RESTAURANT: 5}[card_id]
+    return 0 if value == float("inf") else value
+
+
+RESTAURANT_VALUES = np.array(
+    [_restaurant_value(card_id) for card_id in RESTAURANT_IDS], dtype=np.int64
+)[:, None]
+
+
+class BatchedMachiKoroGame:
+    """Plays ``n_games`` independent games in lockstep with NumPy.
+
+    All games share the player count and the starting cards. ``take_turn``
+    advances every game by one turn following the rules of
+    ``MachiKoroGame.take_turn``, with each game's random decisions drawn
+    independently. Games that end are tallied in ``wins``,
+    ``games_finished`` and ``turns_finished`` and reset in place, so the
+    batch always stays full.
+
+    State arrays are named as in ``GameState`` with games on the last axis,
+    e.g. ``working`` has shape ``(n_players, N_CARDS, n_games)``, so that a
+    card column across all games is one contiguous vector.
+    """
+
+    def __init__(
+        self,
+        n_games: int,
+        n_players: int,
+        starting_buildings: frozendict = starting_buildings_dict,
+        starting_major_establishments: tuple = (),
+        seed: Union[int, SeedSequence, None] = None,
+    ):
+        self.n_games = n_games
+        self.n_players = n_players
+        if isinstance(seed, SeedSequence):
+            seed = np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key)
+        self.rng = np.random.default_rng(seed)
+        template = MachiKoroGame(
+            n_players,
+            starting_buildings=starting_buildings,
+            starting_major_establishments=starting_major_establishments,
+        )
+        self._initial_state = {
+            name: getattr(template.state, name).copy() for name in STATE_FIELDS
+        }
+        for name, initial in self._initial_state.items():
+            setattr(
+                self,
+                name,
+                np.ascontiguousarray(np.repeat(initial[..., None], n_games, axis=-1)),
+            )
+        self.current_player = np.zeros(n_games, dtype=np.int64)
+        self.current_turn = np.zeros(n_games, dtype=np.int64)
+        self.wins = np.zeros(n_players, dtype=np.int64)
+        self.games_finished = 0
+        self.turns_finished = 0
+        self._games = np.arange(n_games)
+        # Flat views: one fancy index per array reads a different player's
+        # cell in every game, which is much cheaper than 2-D indexing.
+        self._coins = self.coins.reshape(-1)
+        self._is_first_turn = self.is_first_turn.reshape(-1)
+        self._tech_startups = self.tech_startups.reshape(-1)
+        self._market = self.market.reshape(-1)
+        self._working = self.working.reshape(-1)
+        self._on_renovation = self.on_renovation.reshape(-1)
+        self._owned = self.owned.reshape(-1)
+
+    def load_game(self, index: int, game: MachiKoroGame) -> None:
+        """Copy the position of a ``MachiKoroGame`` into game ``index``."""
+        for name in STATE_FIELDS:
+            getattr(self, name)[..., index] = getattr(game.state, name)
+        self.current_player[index] = game.current_player
+        self.current_turn[index] = game.current_turn
+
+    def export_game(self, index: int) -> MachiKoroGame:
+        """Copy game ``index`` into a new ``MachiKoroGame``."""
+        game = MachiKoroGame(self.n_players)
+        for name in STATE_FIELDS:
+            getattr(game.state, name)[...] = getattr(self, name)[..., index]
+        game.state.recount()
+        game.current_player = int(self.current_player[index])
+        game.current_turn = int(self.current_turn[index])
+        return game
+
+    def _slot(self, player, card_id=None, games=None) -> np.ndarray:
+        """Flat index of each game's ``player`` cell, or its ``card_id`` cell.
+
+        ``games`` restricts the result to a subset of game indices, in which
+        case ``player`` holds one entry per selected game.
+        """
+        if games is None:
+            games = self._games
+        if card_id is None:
+            return player * self.n_games + games
+        return (player * N_CARDS + card_id) * self.n_games + games
+
+    def _random_choice(self, mask: np.ndarray) -> np.ndarray:
+        """Index of a uniformly chosen True entry along the first axis."""
+        keys = self.rng.random(mask.shape, dtype=np.float32)
+        keys += mask
+        return keys.argmax(axis=0)
+
+    def _count(self, player, card_ids, games=None) -> np.ndarray:
+        """Working plus renovated copies of ``card_ids`` held by ``player``."""
+        slots = self._slot(player, np.array(card_ids)[:, None], games)
+        return (self._working[slots] + self._on_renovation[slots]).sum(axis=0)
+
+    def _held_buildings(self, player, games=None) -> np.ndarray:
+        slots = self._slot(player, ESTABLISHMENT_COLUMNS, games)
+        return (self._working[slots] + self._on_renovation[slots]) > 0
+
+    def _landmark_counts(self) -> np.ndarray:
+        return self.owned[:, LANDMARKS].sum(axis=1)
+
+    def _richest_opponent(self, current_player: np.ndarray, games) -> np.ndarray:
+        coins = self.coins[:, games]
+        coins[current_player, np.arange(len(games))] = -1
+        return coins.argmax(axis=0)
+
+    def _open(self, slots: np.ndarray, mask: np.ndarray) -> None:
+        """Move renovated copies back to working where ``mask`` is set."""
+        slots = slots[mask]
+        self._working[slots] += self._on_renovation[slots]
+        self._on_renovation[slots] = 0
+
+    def _move(self, mask, from_player, to_player, card_id, renovated, games) -> None:
+        for counts, moving in (
+            (self._working, mask & ~renovated),
+            (self._on_renovation, mask & renovated),
+        ):
+            counts[self._slot(from_player, card_id, games)] -= moving
+            counts[self._slot(to_player, card_id, games)] += moving
+
+    def _transfer(self, mask, from_player, to_player, amount) -> None:
+        """Move up to ``amount`` coins where ``mask`` is set."""
+        from_slot = self._slot(from_player)
+        amount = np.where(mask, np.minimum(amount, self._coins[from_slot]), 0)
+        self._coins[from_slot] -= amount
+        self._coins[self._slot(to_player)] += amount
+
+    def roll_dice(self, num_dice: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Roll one or two dice per game."""
+        roll1 = self.rng.integers(1, 7, self.n_games)
+        roll2 = np.where(num_dice == 2, self.rng.integers(1, 7, self.n_games), 0)
+        return roll1 + roll2, roll1 == roll2
+
+    def _choose_num_dice(self, current_player: np.ndarray) -> np.ndarray:
+        has_train_station = self._owned[self._slot(current_player, TRAIN_STATION)]
+        return np.where(
+            (has_train_station == 1) & (self.rng.random(self.n_games) < 0.5), 2, 1
+        )
+
+    def activate_cards(
+        self, current_player: np.ndarray, roll: np.ndarray, active: np.ndarray
+    ) -> None:
+        """Activate cards in the ``active`` games, as ``MachiKoroGame.activate_cards``."""
+        cp = current_player
+        cp_slot = self._slot(cp)
+        coins = self._coins
+        working = self._working
+        on_renovation = self._on_renovation
+        owned = self._owned
+        fires = ACTIVATION_TABLE[:, roll] & active
+
+        # red goes first; every restaurant takes from the current player in
+        # reverse player order, so a running sum gives each card's share
+        receivers = (cp - np.arange(1, self.n_players)[:, None]) % self.n_players
+        red_slots = self._slot(receivers[:, None, :], np.array(RESTAURANT_IDS)[:, None])
+        red_working = working[red_slots]
+        red_renovation = on_renovation[red_slots]
+        rolled = fires[RESTAURANTS]
+        if rolled.any():
+            firing = (red_working > 0) & rolled
+            has_shopping_mall = owned[self._slot(receivers, SHOPPING_MALL)][:, None, :]
+            amount = (RESTAURANT_VALUES + has_shopping_mall) * red_working
+            amount[:, SUSHI_COLUMN] *= owned[self._slot(receivers, HARBOR)]
+            amount[:, FRENCH_COLUMN] *= self._landmark_counts()[cp, self._games] >= 2
+            amount[:, MEMBERS_COLUMN] = ALL_COINS
+            amount = np.where(firing, amount, 0).reshape(-1, self.n_games)
+            payer_coins = coins[cp_slot]
+            coins_before = payer_coins - (amount.cumsum(axis=0) - amount)
+            takes = np.minimum(amount, np.maximum(coins_before, 0))
+            coins[cp_slot] = payer_coins - takes.sum(axis=0)
+            gains = takes.reshape(red_slots.shape).sum(axis=1)
+            for receiver, gain in zip(receivers, gains):
+                coins[self._slot(receiver)] += gain
+            self._open(red_slots, rolled & (red_renovation > 0))
+
+        # green goes second, loan office and moving company first of them
+        has_shopping_mall = owned[self._slot(cp, SHOPPING_MALL)]
+        for card_id in GREEN_ACTIVATION_ORDER:
+            rolled = fires[card_id]
+            if not rolled.any():
+                continue
+            slot = self._slot(cp, card_id)
+            n_working = working[slot]
+            self._open(slot, rolled)
+            firing = rolled & (n_working > 0)
+            value = CARD_VALUES[card_id]
+            if isinstance(value, int) and card_id != LOAN_OFFICE:
+                bonus = has_shopping_mall if card_id in BREAD_IDS else 0
+                coins[cp_slot] += np.where(firing, (value + bonus) * n_working, 0)
+            elif firing.any():
+                self._activate_green_special(card_id, cp, n_working, firing)
+
+        # blue goes next, for all players at once
+        blue_working = self.working[:, PRIMARY]
+        blue_renovation = self.on_renovation[:, PRIMARY]
+        firing = (blue_working > 0) & fires[PRIMARY]
+        gains = (PRIMARY_VALUES * np.where(firing, blue_working, 0)).sum(axis=1)
+        tuna_firing = firing[:, TUNA_COLUMN]
+        if tuna_firing.any():
+            tuna_roll = self.rng.integers(1, 7, (2,) + tuna_firing.shape).sum(axis=0)
+            gains += np.where(tuna_firing, tuna_roll * blue_working[:, TUNA_COLUMN], 0)
+        corn_firing = firing[:, CORN_COLUMN] & (self._landmark_counts() < 2)
+        gains += np.where(corn_firing, 2 * blue_working[:, CORN_COLUMN], 0)
+        self.coins += gains
+        opening = fires[PRIMARY] & (blue_renovation > 0)
+        if opening.any():
+            blue_working += np.where(opening, blue_renovation, 0)
+            blue_renovation[opening] = 0
+
+        # purple goes last
+        for card_id in MAJOR_IDS:
+            if card_id == BUSINESS_CENTER:
+                continue
+            firing = fires[card_id] & (owned[self._slot(cp, card_id)] == 1)
+            if firing.any():
+                self._activate_purple(card_id, cp, firing)
+
+        # special treatment for business center
+        firing = fires[BUSINESS_CENTER] & (owned[self._slot(cp, BUSINESS_CENTER)] == 1)
+        if firing.any():
+            games = np.flatnonzero(firing)
+            trader = cp[games]
+            target = self._richest_opponent(trader, games)
+            target_held = self._held_buildings(target, games)
+            current_held = self._held_buildings(trader, games)
+            trading = target_held.any(axis=0) & current_held.any(axis=0)
+            target_building = self._random_choice(target_held)
+            current_building = self._random_choice(current_held)
+            # the target gives away a working copy if it has one
+            renovated = working[self._slot(target, target_building, games)] == 0
+            self._move(trading, target, trader, target_building, renovated, games)
+            # the current player gives away a renovated copy if it has one
+            renovated = on_renovation[self._slot(trader, current_building, games)] > 0
+            self._move(trading, trader, target, current_building, renovated, games)
+
+    def _activate_green_special(self, card_id, cp, n_working, firing):
+        if card_id == LOAN_OFFICE:
+            player_coins = self._coins[self._slot(cp)]
+            gain = -np.minimum(abs(CARD_VALUES[LOAN_OFFICE]) * n_working, player_coins)
+        elif card_id == MOVING_COMPANY:
+            self._activate_moving_company(cp, n_working, firing)
+            return
+        elif card_id == card_id_dict["fruit_and_vegetable_market"]:
+            gain = 2 * self._count(cp, WHEAT_IDS) * n_working
+        elif card_id == card_id_dict["cheese_factory"]:
+            gain = 3 * self._count(cp, COW_IDS) * n_working
+        elif card_id == card_id_dict["furniture_factory"]:
+            gain = 3 * self._count(cp, GEAR_IDS) * n_working
+        elif card_id == card_id_dict["flower_shop"]:
+            gain = self._count(cp, (FLOWER_GARDEN,)) * n_working
+        elif card_id == card_id_dict["food_warehouse"]:
+            gain = 2 * self._count(cp, RESTAURANT_IDS) * n_working
+        elif card_id == card_id_dict["general_store"]:
+            has_shopping_mall = self._owned[self._slot(cp, SHOPPING_MALL)]
+            gain = (2 + has_shopping_mall) * n_working
+            gain *= self._landmark_counts()[cp, self._games] < 2
+        elif card_id == card_id_dict["soda_bottling_plant"]:
+            gain = self.working[:, RESTAURANTS].sum(axis=(0, 1))
+            gain += self.on_renovation[:, RESTAURANTS].sum(axis=(0, 1))
+        elif card_id == WINERY:
+            gain = 6 * self._count(cp, (VINEYARD,)) * n_working
+            # the wineries that paid out close for renovation
+            slot = self._slot(cp, WINERY)
+            closing = np.where(firing, n_working, 0)
+            self._working[slot] -= closing
+            self._on_renovation[slot] += closing
+        elif card_id == card_id_dict["demolition_company"]:
+            gain = np.zeros(self.n_games, dtype=np.int64)
+            games = np.flatnonzero(firing)
+            demolisher = cp[games]
+            n_demolitions = n_working[games]
+            for step in range(int(n_demolitions.max())):
+                built = self._owned[
+                    self._slot(demolisher, LANDMARK_BY_COST_ARRAY[:, None], games)
+                ] == 1
+                closing = (step < n_demolitions) & built.any(axis=0)
+                landmark = LANDMARK_BY_COST_ARRAY[built.argmax(axis=0)]
+                self._owned[self._slot(demolisher, landmark, games)] -= closing
+                self._market[landmark * self.n_games + games] += closing
+                gain[games] += 8 * closing
+        else:
+            gain = 0
+        self._coins[self._slot(cp)] += np.where(firing, gain, 0)
+
+    def _activate_moving_company(self, cp, n_working, firing):
+        # rare, so only the games where it fires take part
+        games = np.flatnonzero(firing)
+        mover = cp[games]
+        n_moves = n_working[games]
+        for step in range(int(n_moves.max())):
+            held = self._held_buildings(mover, games)
+            stepping = (step < n_moves) & held.any(axis=0)
+            building = self._random_choice(held)
+            target = self._richest_opponent(mover, games)
+            renovated = self._on_renovation[self._slot(mover, building, games)] > 0
+            self._move(stepping, mover, target, building, renovated, games)
+            self._coins[self._slot(mover, games=games)] += 4 * stepping
+
+    def _activate_purple(self, card_id, cp, firing):
+        opponents = [
+            (cp - offset) % self.n_players for offset in range(1, self.n_players)
+        ]
+        if card_id == card_id_dict["stadium"]:
+            for player in opponents:
+                self._transfer(firing, player, cp, 2)
+        elif card_id == card_id_dict["tv_station"]:
+            target = self._richest_opponent(cp, self._games)
+            self._transfer(firing, target, cp, 5)
+        elif card_id == card_id_dict["publisher"]:
+            for player in opponents:
+                self._transfer(firing, player, cp, self._count(player, PUBLISHER_IDS))
+        elif card_id == card_id_dict["tax_office"]:
+            for player in opponents:
+                player_coins = self._coins[self._slot(player)]
+                self._transfer(
+                    firing & (player_coins >= 10), player, cp, player_coins // 2
+                )
+        elif card_id == card_id_dict["park"]:
+            new_player_coins = -(-self.coins.sum(axis=0) // self.n_players)
+            self.coins[:, firing] = new_player_coins[firing]
+        elif card_id == card_id_dict["renovation_company"]:
+            games = np.flatnonzero(firing)
+            held = (
+                self.working[:, :N_ESTABLISHMENTS, games]
+                + self.on_renovation[:, :N_ESTABLISHMENTS, games]
+            ).sum(axis=0) > 0
+            building = self._random_choice(held)
+            # games where nobody holds anything draw column 0, which is empty
+            for player in range(self.n_players):
+                slot = self._slot(player, building, games)
+                self._on_renovation[slot] += self._working[slot]
+                self._working[slot] = 0
+        elif card_id == TECH_STARTUP:
+            stake = self._tech_startups[self._slot(cp)]
+            for player in opponents:
+                self._transfer(firing, player, cp, stake)
+
+    def take_turn(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Simulate one turn in every game.
+
+        Returns the mask of games that ended on this turn and their winners
+        (-1 for games still running). Ended games are already reset.
+        """
+        cp = self.current_player
+        cp_slot = self._slot(cp)
+        owned = self._owned
+        self.current_turn += 1
+        active = self._is_first_turn[cp_slot] == 0
+
+        # Step 1: Roll Dice
+        roll, is_double = self.roll_dice(self._choose_num_dice(cp))
+
+        # Step 2: player can choose to reroll if they have radio tower
+        do_reroll = (owned[self._slot(cp, RADIO_TOWER)] == 1) & (
+            self.rng.random(self.n_games) < 0.5
+        )
+        if do_reroll.any():
+            reroll, reroll_is_double = self.roll_dice(self._choose_num_dice(cp))
+            roll = np.where(do_reroll, reroll, roll)
+            is_double = np.where(do_reroll, reroll_is_double, is_double)
+        roll = np.where(active, roll, 0)
+        is_double &= active
+
+        # Step 3: Activate Cards
+        self.activate_cards(cp, roll, active)
+        self._is_first_turn[cp_slot] = 0
+
+        # Step 4: Сity hall gives a coin if active player does not have any
+        coins = np.maximum(self._coins[cp_slot], 1)
+
+        # Step 5: Buy a card (randomly for now)
+        possible_purchases = (
+            (COST_ARRAY[:, None] <= coins)
+            & (self.market > 0)
+            & (owned[self._slot(cp, CARD_COLUMNS)] == 0)
+        )
+        has_built = possible_purchases.any(axis=0)
+        purchase = self._random_choice(possible_purchases)
+        self._market[purchase * self.n_games + self._games] -= has_built
+        coins -= np.where(has_built, COST_ARRAY[purchase], 0)
+        is_establishment = purchase < N_ESTABLISHMENTS
+        self._working[self._slot(cp, purchase)] += has_built & is_establishment
+        owned[self._slot(cp, purchase)] |= has_built & ~is_establishment
+
+        # Step 6: player can choose to put one of their coins on the tech startup
+        is_put_a_coin = (
+            (owned[self._slot(cp, TECH_STARTUP)] == 1)
+            & (self.rng.random(self.n_games) < 0.5)
+            & (coins > 0)
+        )
+        coins -= is_put_a_coin
+        self._tech_startups[cp_slot] += is_put_a_coin
+
+        # Step 7: airport trigger
+        coins += np.where(~has_built & (owned[self._slot(cp, AIRPORT)] == 1), 10, 0)
+        self._coins[cp_slot] = coins
+
+        takes_another_turn = is_double & (owned[self._slot(cp, AMUSEMENT_PARK)] == 1)
+        self.current_player = np.where(
+            takes_another_turn, cp, (cp + 1) % self.n_players
+        )
+        return self._finish_games()
+
+    def is_game_over(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Per game: whether a player has won, and the first such player (-1 if none)."""
+        completed = self.owned[:, LANDMARKS].all(axis=1)
+        is_game_over = completed.any(axis=0)
+        return is_game_over, np.where(is_game_over, completed.argmax(axis=0), -1)
+
+    def reset_games(self, mask: np.ndarray) -> None:
+        """Restart the games in ``mask`` from the starting position."""
+        for name, initial in self._initial_state.items():
+            getattr(self, name)[..., mask] = initial[..., None]
+        self.current_player[mask] = 0
+        self.current_turn[mask] = 0
+
+    def _finish_games(self) -> Tuple[np.ndarray, np.ndarray]:
+        is_game_over, winners = self.is_game_over()
+        if is_game_over.any():
+            self.wins += np.bincount(winners[is_game_over], minlength=self.n_players)
+            self.games_finished += int(is_game_over.sum())
+            self.turns_finished += int(self.current_turn[is_game_over].sum())
+            self.reset_games(is_game_over)
+        return is_game_over, winners
+
+    def play_games(self, n_games: int) -> None:
+        """Take turns until at least ``n_games`` games have finished."""
+        while self.games_finished < n_games:
+            self.take_turn()
@@ -0,0 +1,317 @@
+"""Throughput benchmarks for the game engine, compared against a baseline.
+
+    python benchmark.py [--quick] [--output results.json]
+                        [--baseline benchmark_baseline.json] [--update-baseline]
+
+Measures whole games (``play_game``), single turns from mid-game positions
+(``take_turn``), ``activate_cards`` for every roll and every card handler on
+its own, for 2 to 5 players, and how long a fresh interpreter takes to
+import the engine modules that worker processes need. It covers the default start and the "all
+buildings" start that test_.py plays, with every establishment and major
+establishment. Each benchmark runs a few rounds and keeps the best rate,
+which is the least disturbed by the rest of the machine.
+
+Results are written as JSON. Given a baseline written the same way, rates
+that dropped by more than ``--tolerance`` are reported as regressions and
+the exit status is 1, as it is when importing an engine module loads one
+of the optional dependencies (pydantic, gymnasium, torch, ...).
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from frozendict import frozendict
+
+from constants import (
+    cards_tuple,
+    establishments_tuple,
+    major_establishments_tuple,
+    starting_buildings_dict,
+)
+from game import CARD_HANDLERS, MAX_ROLL, RESTAURANT_IDS, GameSnapshot, MachiKoroGame
+
+ALL_BUILDINGS = frozendict({card: (1, 1) for card in establishments_tuple})
+START_CONFIGS: Dict[str, Tuple[frozendict, tuple]] = {
+    "default": (starting_buildings_dict, ()),
+    "all_buildings": (ALL_BUILDINGS, major_establishments_tuple),
+}
+PLAYER_COUNTS = (2, 3, 4, 5)
+# what process pool workers import; none of them may load OPTIONAL_MODULES
+ENGINE_MODULES = ("game", "simulate", "stats", "dataset", "broker", "async_game")
+OPTIONAL_MODULES = ("pydantic", "gymnasium", "torch", "stable_baselines3")
+DEFAULT_BASELINE = Path(__file__).with_name("benchmark_baseline.json")
+
+
+class Result(NamedTuple):
+    name: str
+    rate: float
+    unit: str
+    # for imports, the OPTIONAL_MODULES that the import loaded
+    loaded: Tuple[str, ...] = ()
+
+
+class Regression(NamedTuple):
+    name: str
+    baseline: float
+    rate: float
+
+    @property
+    def ratio(self) -> float:
+        return self.rate / self.baseline
+
+
+def _best_rate(run: Callable[[], int], rounds: int) -> float:
+    """The highest ``operations / second`` of ``rounds`` calls of ``run``,
+    which does some work and returns the number of operations done."""
+    best = 0.0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        n_operations = run()
+        best = max(best, n_operations / (time.perf_counter() - start))
+    return best
+
+
+def _new_game(config: str, n_players: int, seed: int) -> MachiKoroGame:
+    starting_buildings, starting_majors = START_CONFIGS[config]
+    return MachiKoroGame(
+        n_players,
+        starting_buildings=starting_buildings,
+        starting_major_establishments=starting_majors,
+        seed=seed,
+    )
+
+
+def bench_play_game(
+    config: str, n_players: int, n_games: int, rounds: int
+) -> List[Result]:
+    best_games = best_turns = 0.0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        turns = 0
+        for seed in range(n_games):
+            game = _new_game(config, n_players, seed)
+            game.play_game()
+            turns += game.current_turn
+        elapsed = time.perf_counter() - start
+        if n_games / elapsed > best_games:
+            best_games, best_turns = n_games / elapsed, turns / elapsed
+    name = f"play_game/{config}/{n_players}p"
+    return [Result(name, best_games, "games/s"), Result(name, best_turns, "turns/s")]
+
+
+def _mid_game_positions(
+    config: str, n_players: int, n_positions: int, turn: int
+) -> List[Tuple[MachiKoroGame, GameSnapshot]]:
+    positions = []
+    for seed in range(n_positions):
+        game = _new_game(config, n_players, seed)
+        while game.current_turn < turn and not game.is_game_over()[0]:
+            game.take_turn()
+        if not game.is_game_over()[0]:
+            positions.append((game, game.snapshot()))
+    return positions
+
+
+def bench_take_turn(
+    config: str, n_players: int, n_turns: int, rounds: int
+) -> List[Result]:
+    """Turns taken from positions ``2 * n_players`` turns into games; the
+    ``restore`` before each turn is part of the time."""
+    positions = _mid_game_positions(config, n_players, 32, 2 * n_players)
+
+    def run() -> int:
+        for i in range(n_turns):
+            game, snapshot = positions[i % len(positions)]
+            game.restore(snapshot)
+            game.take_turn()
+        return n_turns
+
+    rate = _best_rate(run, rounds)
+    return [Result(f"take_turn/{config}/{n_players}p", rate, "turns/s")]
+
+
+def _rich_all_buildings_game(n_players: int) -> Tuple[MachiKoroGame, GameSnapshot]:
+    """A game where everyone holds everything and has coins to lose."""
+    game = _new_game("all_buildings", n_players, 0)
+    game.state.coins[:] = 20
+    game.state.is_first_turn[:] = 0
+    return game, game.snapshot()
+
+
+def bench_activate_cards(n_players: int, n_calls: int, rounds: int) -> List[Result]:
+    game, snapshot = _rich_all_buildings_game(n_players)
+    results = []
+    for roll in range(1, MAX_ROLL + 1):
+
+        def run() -> int:
+            for _ in range(n_calls):
+                game.restore(snapshot)
+                game.activate_cards(0, roll)
+            return n_calls
+
+        rate = _best_rate(run, rounds)
+        results.append(Result(f"activate_cards/roll_{roll}", rate, "calls/s"))
+    return results
+
+
+def bench_card_handlers(n_players: int, n_calls: int, rounds: int) -> List[Result]:
+    """Every card handler called once per ``restore``, player 0 activating
+    (and paying, for restaurants) with one working copy."""
+    game, snapshot = _rich_all_buildings_game(n_players)
+    results = []
+    for card_id, handler in enumerate(CARD_HANDLERS):
+        args = (0, 1, card_id, 1) if card_id in RESTAURANT_IDS else (0, card_id, 1)
+
+        def run() -> int:
+            for _ in range(n_calls):
+                game.restore(snapshot)
+                handler(game, *args)
+            return n_calls
+
+        rate = _best_rate(run, rounds)
+        results.append(Result(f"card/{cards_tuple[card_id]}", rate, "calls/s"))
+    return results
+
+
+_IMPORT_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed)
+print(" ".join(name for name in {optional!r} if name in sys.modules))
+"""
+
+
+def import_cost(module: str) -> Tuple[float, List[str]]:
+    """Seconds a fresh interpreter takes to import ``module``, and which of
+    ``OPTIONAL_MODULES`` that loaded."""
+    script = _IMPORT_SCRIPT.format(module=module, optional=OPTIONAL_MODULES)
+    output = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=Path(__file__).parent,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.splitlines()
+    return float(output[0]), output[1].split() if len(output) > 1 else []
+
+
+def bench_imports(modules: Sequence[str], rounds: int) -> List[Result]:
+    results = []
+    for module in modules:
+        costs = [import_cost(module) for _ in range(rounds)]
+        best = min(seconds for seconds, _ in costs)
+        loaded = tuple(sorted({name for _, names in costs for name in names}))
+        results.append(Result(f"import/{module}", 1 / best, "imports/s", loaded))
+    return results
+
+
+def run_benchmarks(
+    scale: float = 1.0,
+    rounds: int = 3,
+    player_counts: Sequence[int] = PLAYER_COUNTS,
+    log: Optional[Callable[[Result], None]] = None,
+) -> List[Result]:
+    """Run every benchmark; ``scale`` multiplies the work done per round."""
+
+    def n(count: int) -> int:
+        return max(1, int(count * scale))
+
+    suites: List[Callable[[], List[Result]]] = []
+    for config in START_CONFIGS:
+        for n_players in player_counts:
+            suites.append(
+                lambda c=config, p=n_players: bench_play_game(c, p, n(100), rounds)
+            )
+            suites.append(
+                lambda c=config, p=n_players: bench_take_turn(c, p, n(5000), rounds)
+            )
+    suites.append(lambda: bench_activate_cards(4, n(2000), rounds))
+    suites.append(lambda: bench_card_handlers(4, n(2000), rounds))
+    suites.append(lambda: bench_imports(ENGINE_MODULES, rounds))
+    results = []
+    for suite in suites:
+        for result in suite():
+            results.append(result)
+            if log is not None:
+                log(result)
+    return results
+
+
+def _key(result: Result) -> str:
+    return f"{result.name} [{result.unit}]"
+
+
+def to_json(results: Sequence[Result]) -> dict:
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": {_key(result): result.rate for result in results},
+    }
+
+
+def compare(
+    results: Sequence[Result], baseline: dict, tolerance: float = 0.1
+) -> List[Regression]:
+    """Results whose rate is more than ``tolerance`` below the baseline's."""
+    baseline_rates = baseline["results"]
+    regressions = []
+    for result in results:
+        baseline_rate = baseline_rates.get(_key(result))
+        if baseline_rate and result.rate < (1 - tolerance) * baseline_rate:
+            regressions.append(Regression(_key(result), baseline_rate, result.rate))
+    return regressions
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="a tenth of the work")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--output", type=Path, default=Path("benchmark_results.json"))
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(
+        scale=0.1 if args.quick else 1.0,
+        rounds=args.rounds,
+        log=lambda result: print(f"{_key(result):<48} {result.rate:>14,.0f}"),
+    )
+    report = to_json(results)
+    args.output.write_text(json.dumps(report, indent=2))
+    heavy = [result for result in results if result.loaded]
+    for result in heavy:
+        print(f"IMPORT {result.name} loads {', '.join(result.loaded)}")
+    if heavy:
+        return 1
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2))
+        return 0
+    if not args.baseline.exists():
+        print(f"no baseline at {args.baseline}, run with --update-baseline to save one")
+        return 0
+    regressions = compare(results, json.loads(args.baseline.read_text()), args.tolerance)
+    for regression in regressions:
+        print(
+            f"REGRESSION {regression.name}: {regression.rate:,.0f}"
+            f" vs {regression.baseline:,.0f} ({regression.ratio:.0%})"
+        )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
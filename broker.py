@@ -0,0 +1,188 @@
+"""Batched answers to the decisions of games played on many threads.
+
+An ``InferenceBroker`` is a ``Policy`` that any number of games can share.
+Each ``choose`` call, from ``take_turn`` as well as from ``activate_cards``,
+queues its decision and waits; a serving thread gathers the queued
+decisions into batches of up to ``max_batch``, waiting at most
+``max_wait`` seconds after the first one for more, and answers each batch
+with one ``BatchPolicy.choose_batch`` call. A model can then score
+hundreds of decisions in one forward pass (which releases the GIL while it
+runs) instead of one sample at a time.
+
+``play_games_brokered`` plays games on one thread each through a broker.
+Worker processes each run their own broker and their own copy of the
+model; decisions hold a live view of their game and are not sent between
+processes.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, List, Optional, Sequence, Tuple
+
+from game import MachiKoroGame
+from policy import BatchPolicy, Decision
+
+_STOP = object()
+
+
+class InferenceBroker:
+    """Answers ``choose`` calls from many threads in batches.
+
+    A batch is sent as soon as it has ``max_batch`` decisions, when
+    ``max_wait`` seconds have passed since its first decision, or when
+    every one of the ``clients`` (if given) is waiting on it, whichever
+    comes first. Use it as a context manager, or ``close`` it, to stop the
+    serving thread.
+    """
+
+    def __init__(
+        self,
+        policy: BatchPolicy,
+        max_batch: int = 256,
+        max_wait: float = 0.002,
+        clients: Optional[int] = None,
+    ):
+        if max_batch < 1:
+            raise ValueError(f"max_batch must be positive, got {max_batch}")
+        self.policy = policy
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.clients = clients
+        self.n_batches = 0
+        self.n_decisions = 0
+        self._requests: "queue.SimpleQueue[Any]" = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.n_decisions / self.n_batches if self.n_batches else 0.0
+
+    def submit(self, decision: Decision) -> "Future[Any]":
+        """Queue ``decision``; the future gets the option chosen."""
+        future: "Future[Any]" = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("the broker is closed")
+            self._requests.put((decision, future))
+        return future
+
+    def choose(self, decision: Decision) -> Any:
+        return self.submit(decision).result()
+
+    def set_clients(self, clients: Optional[int]) -> None:
+        """Tell the broker how many threads can be waiting at once, so that
+        it does not wait for decisions that cannot come."""
+        self.clients = clients
+        # wakes the serving thread up to look at the new count
+        self._requests.put(None)
+
+    def _serve(self) -> None:
+        requests = self._requests
+        pending: List[Tuple[Decision, "Future[Any]"]] = []
+        stopping = False
+        while not stopping:
+            request = requests.get()
+            if request is _STOP:
+                break
+            if request is not None:
+                pending.append(request)
+            if not pending:
+                continue
+            deadline = time.monotonic() + self.max_wait
+            while len(pending) < self.max_batch:
+                clients = self.clients
+                if clients is not None and len(pending) >= clients:
+                    break
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = requests.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if request is _STOP:
+                    stopping = True
+                    break
+                if request is not None:
+                    pending.append(request)
+            self._answer(pending[: self.max_batch])
+            del pending[: self.max_batch]
+        while pending:
+            self._answer(pending[: self.max_batch])
+            del pending[: self.max_batch]
+
+    def _answer(self, batch: List[Tuple[Decision, "Future[Any]"]]) -> None:
+        try:
+            choices = self.policy.choose_batch([decision for decision, _ in batch])
+        except BaseException as error:
+            for _, future in batch:
+                future.set_exception(error)
+            return
+        self.n_batches += 1
+        self.n_decisions += len(batch)
+        for (_, future), choice in zip(batch, choices):
+            future.set_result(choice)
+
+    def close(self) -> None:
+        """Answer the decisions already queued and stop serving."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._requests.put(_STOP)
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def play_games_brokered(
+    games: Sequence[MachiKoroGame],
+    policy: BatchPolicy,
+    max_batch: int = 256,
+    max_wait: float = 0.002,
+    max_turns: Optional[int] = None,
+    max_threads: int = 128,
+) -> List[int]:
+    """Play ``games`` to the end on up to ``max_threads`` threads, one game
+    per thread at a time, every seat answered by ``policy`` through an
+    ``InferenceBroker``. Batches are at most ``max_threads`` decisions.
+
+    Unlike ``play_games_batched``, decisions taken while cards activate are
+    batched too. Returns the winners, -1 for games stopped by ``max_turns``.
+    """
+    if not games:
+        return []
+    if max_threads < 1:
+        raise ValueError(f"max_threads must be positive, got {max_threads}")
+    n_threads = min(len(games), max_threads)
+    with InferenceBroker(policy, max_batch, max_wait, clients=n_threads) as broker:
+        # games not finished yet; the ones past n_threads wait for a thread
+        active = [len(games)]
+        lock = threading.Lock()
+
+        def play(game: MachiKoroGame) -> int:
+            try:
+                game.policies = [broker] * game.n_players
+                is_game_over, winner = game.is_game_over()
+                while not is_game_over:
+                    if max_turns is not None and game.current_turn >= max_turns:
+                        return -1
+                    game.take_turn()
+                    is_game_over, winner = game.is_game_over()
+                return winner
+            finally:
+                with lock:
+                    active[0] -= 1
+                    broker.set_clients(min(active[0], n_threads))
+
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            return list(executor.map(play, games))
@@ -161,3 +161,13 @@ restaurants_tuple = (
     "french_restaurant",
     "members_only_club",
 )
+
+establishments_tuple = (
+    tuple(primary_industry_dict) + tuple(secondary_industry_dict) + restaurants_tuple
+)
+
+# Every card has an integer id; establishments come first so that their ids
+# also index the per-player establishment columns of the game state.
+cards_tuple = establishments_tuple + major_establishments_tuple + landmarks_tuple
+
+card_id_dict = frozendict({card: card_id for card_id, card in enumerate(cards_tuple)})
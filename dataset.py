@@ -0,0 +1,428 @@
+"""Self-play training data, written to sharded ``.npy`` files.
+
+Every decision of a self-play game becomes one row of ``row_dtype``: the
+state as the deciding player sees it, the kind of decision, the action
+taken and whether that player went on to win. These are the inputs and
+targets of the win-probability networks of the readme, one per decision
+kind (filter on ``kind``).
+
+The state is the first ``GameState.n_features`` values of the game's
+buffer with the seats rotated so that the deciding player comes first,
+stored as int16; values that do not fit raise rather than wrap. Actions are card ids for purchases and buildings
+(``PASS_ACTION`` for buying nothing), the number of dice, 0/1 for yes/no
+decisions and the target's seat counted from the deciding player.
+
+``DatasetWriter`` appends rows to ``{prefix}-{n:05d}.npy`` shards of a
+structured dtype that ``np.load(path, mmap_mode="r")`` (or
+``open_dataset``) maps without reading. ``generate_dataset`` plays games on
+worker processes that send their rows through a bounded queue, so a slow
+disk holds the workers back instead of filling memory.
+"""
+
+import multiprocessing
+import os
+import struct
+from pathlib import Path
+from typing import Any, BinaryIO, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from frozendict import frozendict
+
+from constants import card_id_dict, starting_buildings_dict
+from game import MachiKoroGame
+from policy import (
+    DECISION_KINDS,
+    NUM_DICE,
+    REROLL,
+    TARGET,
+    TECH_STARTUP_COIN,
+    Decision,
+    Policy,
+    RandomPolicy,
+)
+from replay import next_shard_number
+from rng import SeedSequence
+from state import N_CARDS, GameState
+
+PASS_ACTION = N_CARDS
+KIND_IDS = {kind: kind_id for kind_id, kind in enumerate(DECISION_KINDS)}
+STATE_DTYPE = np.int16
+
+
+def row_dtype(n_players: int) -> np.dtype:
+    return np.dtype(
+        [
+            ("state", STATE_DTYPE, (GameState.n_features(n_players),)),
+            ("kind", np.uint8),
+            ("player", np.uint8),
+            ("action", np.int16),
+            ("won", np.uint8),
+            ("turn", np.uint16),
+            ("game", np.uint32),
+        ]
+    )
+
+
+def seat_order(n_players: int) -> np.ndarray:
+    """``seat_order(n)[p]`` indexes the features so that player ``p`` comes
+    first and the others follow in turn order."""
+    n_features = GameState.n_features(n_players)
+    layout = GameState.layout(n_players)
+    per_player = {
+        name
+        for name, (_, shape) in GameState.layout(2).items()
+        if shape[0] == 2
+    }
+    order = np.tile(np.arange(n_features), (n_players, 1))
+    for name, (offset, shape) in layout.items():
+        if name not in per_player or offset >= n_features:
+            continue
+        size = int(np.prod(shape))
+        indices = np.arange(offset, offset + size).reshape(shape)
+        for player_id in range(n_players):
+            order[player_id, offset : offset + size] = np.roll(
+                indices, -player_id, axis=0
+            ).ravel()
+    return order
+
+
+def encode_action(decision: Decision, choice: Any, n_players: int) -> int:
+    kind = decision.kind
+    if kind == NUM_DICE:
+        return choice
+    if kind == REROLL or kind == TECH_STARTUP_COIN:
+        return int(choice)
+    if kind == TARGET:
+        return (choice - decision.player_id) % n_players
+    return PASS_ACTION if choice is None else card_id_dict[choice]
+
+
+def _checked(values: np.ndarray, field: str) -> np.ndarray:
+    """``values``, if they fit in the ``field`` of the rows; they would wrap
+    around otherwise."""
+    limits = np.iinfo(row_dtype(2)[field].base)
+    if values.min() < limits.min or values.max() > limits.max:
+        raise ValueError(
+            f"{field} values from {values.min()} to {values.max()} do not fit"
+            f" in {limits.dtype}"
+        )
+    return values
+
+
+class _RowRecorder:
+    """Collects the rows of one game; the outcome is filled in at the end."""
+
+    def __init__(self, game: MachiKoroGame, game_index: int):
+        self.game = game
+        self.game_index = game_index
+        self._seats = seat_order(game.n_players)
+        self._n_features = self._seats.shape[1]
+        self._states: List[np.ndarray] = []
+        self._columns: List[Tuple[int, int, int, int]] = []
+        game.recorder = self
+
+    def record(self, decision: Decision, choice: Any) -> None:
+        game = self.game
+        player_id = decision.player_id
+        self._states.append(game.state.buffer[self._seats[player_id]])
+        self._columns.append(
+            (
+                KIND_IDS[decision.kind],
+                player_id,
+                encode_action(decision, choice, game.n_players),
+                game.current_turn,
+            )
+        )
+
+    def end_turn(self) -> None:
+        pass
+
+    def rows(self, winner: int) -> np.ndarray:
+        rows = np.zeros(len(self._states), row_dtype(self.game.n_players))
+        if not len(rows):
+            return rows
+        rows["state"] = _checked(np.stack(self._states), "state")
+        columns = np.array(self._columns, dtype=np.int64)
+        rows["kind"] = columns[:, 0]
+        rows["player"] = columns[:, 1]
+        rows["action"] = columns[:, 2]
+        rows["turn"] = _checked(columns[:, 3], "turn")
+        rows["won"] = columns[:, 1] == winner
+        rows["game"] = self.game_index
+        return rows
+
+
+def play_game_rows(
+    game_index: int,
+    n_players: int,
+    seed: SeedSequence,
+    starting_buildings: frozendict = starting_buildings_dict,
+    starting_major_establishments: tuple = (),
+    policy: Optional[Policy] = None,
+) -> np.ndarray:
+    """Play a game with ``policy`` (``RandomPolicy`` by default) in every
+    seat and return a row for each of its decisions."""
+    policy = policy or RandomPolicy()
+    game = MachiKoroGame(
+        n_players,
+        starting_buildings=starting_buildings,
+        starting_major_establishments=starting_major_establishments,
+        seed=seed,
+        policies=[policy] * n_players,
+    )
+    recorder = _RowRecorder(game, game_index)
+    game.play_game()
+    return recorder.rows(game.is_game_over()[1])
+
+
+def iter_rows(
+    game_indices: Sequence[int],
+    n_players: int,
+    entropy: int,
+    starting_buildings: frozendict = starting_buildings_dict,
+    starting_major_establishments: tuple = (),
+    policy: Optional[Policy] = None,
+    batch_rows: int = 1 << 14,
+) -> Iterator[np.ndarray]:
+    """The rows of the games, in batches of at least ``batch_rows`` rows
+    (but for the last). Game ``i`` is seeded with ``SeedSequence(entropy,
+    (i,))``, as in simulate.py."""
+    batch: List[np.ndarray] = []
+    n_rows = 0
+    for game_index in game_indices:
+        rows = play_game_rows(
+            game_index,
+            n_players,
+            SeedSequence(entropy, (game_index,)),
+            starting_buildings,
+            starting_major_establishments,
+            policy,
+        )
+        batch.append(rows)
+        n_rows += len(rows)
+        if n_rows >= batch_rows:
+            yield np.concatenate(batch)
+            batch.clear()
+            n_rows = 0
+    if batch:
+        yield np.concatenate(batch)
+
+
+_NPY_MAGIC = b"\x93NUMPY\x01\x00"
+_MAX_ROWS = 2**63 - 1
+
+
+def _npy_header(dtype: np.dtype, n_rows: int) -> bytes:
+    """A version 1.0 ``.npy`` header for ``n_rows`` rows of ``dtype``. Its
+    size does not depend on ``n_rows``, so a shard's header can be written
+    again once its rows are counted."""
+
+    def text(rows: int) -> str:
+        return repr(
+            {
+                "descr": np.lib.format.dtype_to_descr(dtype),
+                "fortran_order": False,
+                "shape": (rows,),
+            }
+        )
+
+    # sized for the longest row count, then aligned to 64 bytes as numpy does
+    size = len(_NPY_MAGIC) + 2 + len(text(_MAX_ROWS)) + 1
+    size += -size % 64
+    header = text(n_rows).ljust(size - len(_NPY_MAGIC) - 2 - 1) + "\n"
+    return _NPY_MAGIC + struct.pack("<H", len(header)) + header.encode("latin1")
+
+
+class DatasetWriter:
+    """Appends rows to ``{prefix}-{n:05d}.npy`` shards in ``directory``.
+
+    A shard takes ``rows_per_shard`` rows. Rows are buffered up to
+    ``buffer_rows`` and the shard's header is brought up to date on every
+    flush, so closed and flushed shards are valid ``.npy`` files. New
+    shards are numbered after the writer's existing ones.
+    """
+
+    def __init__(
+        self,
+        directory: Union[str, Path],
+        n_players: int,
+        prefix: str = "selfplay",
+        rows_per_shard: int = 1 << 20,
+        buffer_rows: int = 1 << 14,
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.dtype = row_dtype(n_players)
+        self.prefix = prefix
+        self.rows_per_shard = rows_per_shard
+        self.n_rows = 0
+        self._n_shards = next_shard_number(self.directory, prefix, ".npy")
+        self._file: Optional[BinaryIO] = None
+        self._shard_rows = 0
+        self._buffer = np.zeros(buffer_rows, self.dtype)
+        self._buffered = 0
+
+    def write(self, rows: np.ndarray) -> None:
+        if rows.dtype != self.dtype:
+            raise ValueError(f"rows must be of dtype {self.dtype}, got {rows.dtype}")
+        while len(rows):
+            if self._file is None:
+                self._open_shard()
+            room = min(
+                self.rows_per_shard - self._shard_rows - self._buffered,
+                len(self._buffer) - self._buffered,
+            )
+            taken = rows[:room]
+            self._buffer[self._buffered : self._buffered + len(taken)] = taken
+            self._buffered += len(taken)
+            self.n_rows += len(taken)
+            rows = rows[room:]
+            if self._shard_rows + self._buffered == self.rows_per_shard:
+                self._close_shard()
+            elif self._buffered == len(self._buffer):
+                self.flush()
+
+    def _open_shard(self) -> None:
+        path = self.directory / f"{self.prefix}-{self._n_shards:05d}.npy"
+        self._n_shards += 1
+        # "x": never truncate a shard written before
+        self._file = open(path, "xb")
+        self._file.write(_npy_header(self.dtype, 0))
+        self._shard_rows = 0
+
+    def flush(self) -> None:
+        if self._file is None:
+            return
+        self._file.write(self._buffer[: self._buffered].tobytes())
+        self._shard_rows += self._buffered
+        self._buffered = 0
+        end = self._file.tell()
+        self._file.seek(0)
+        self._file.write(_npy_header(self.dtype, self._shard_rows))
+        self._file.seek(end)
+        self._file.flush()
+
+    def _close_shard(self) -> None:
+        self.flush()
+        self._file.close()
+        self._file = None
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._close_shard()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def open_dataset(directory: Union[str, Path], prefix: str = "selfplay") -> List[np.ndarray]:
+    """Every shard in ``directory``, memory-mapped read-only, in order."""
+    return [
+        np.load(path, mmap_mode="r")
+        for path in sorted(Path(directory).glob(f"{prefix}-*.npy"))
+    ]
+
+
+def _produce(
+    queue: Any,
+    game_indices: range,
+    n_players: int,
+    entropy: int,
+    starting_buildings: frozendict,
+    starting_major_establishments: tuple,
+    policy: Optional[Policy],
+    batch_rows: int,
+) -> None:
+    try:
+        for rows in iter_rows(
+            game_indices,
+            n_players,
+            entropy,
+            starting_buildings,
+            starting_major_establishments,
+            policy,
+            batch_rows,
+        ):
+            queue.put(rows)
+    except Exception as error:  # handed to the parent, which raises it
+        queue.put(error)
+    queue.put(None)
+
+
+def generate_dataset(
+    directory: Union[str, Path],
+    n_games: int,
+    n_players: int,
+    workers: Optional[int] = None,
+    starting_buildings: frozendict = starting_buildings_dict,
+    starting_major_establishments: tuple = (),
+    seed: Optional[int] = None,
+    policy: Optional[Policy] = None,
+    prefix: str = "selfplay",
+    rows_per_shard: int = 1 << 20,
+    batch_rows: int = 1 << 14,
+    queue_size: int = 4,
+) -> int:
+    """Play ``n_games`` self-play games and write their rows to ``directory``;
+    returns the number of rows written.
+
+    Worker ``w`` plays games ``w, w + workers, ...`` and puts batches of
+    about ``batch_rows`` rows on a queue of ``queue_size`` batches that this
+    process writes out. Rows are in completion order; ``game`` tells which
+    game each came from. ``workers=1`` plays in this process.
+    """
+    entropy = SeedSequence(seed).entropy
+    workers = workers or os.cpu_count() or 1
+    with DatasetWriter(directory, n_players, prefix, rows_per_shard) as writer:
+        if workers == 1:
+            for rows in iter_rows(
+                range(n_games),
+                n_players,
+                entropy,
+                starting_buildings,
+                starting_major_establishments,
+                policy,
+                batch_rows,
+            ):
+                writer.write(rows)
+            return writer.n_rows
+
+        queue = multiprocessing.Queue(queue_size)
+        producers = [
+            multiprocessing.Process(
+                target=_produce,
+                args=(
+                    queue,
+                    range(worker, n_games, workers),
+                    n_players,
+                    entropy,
+                    starting_buildings,
+                    starting_major_establishments,
+                    policy,
+                    batch_rows,
+                ),
+                daemon=True,
+            )
+            for worker in range(workers)
+        ]
+        for producer in producers:
+            producer.start()
+        try:
+            running = workers
+            while running:
+                rows = queue.get()
+                if rows is None:
+                    running -= 1
+                elif isinstance(rows, Exception):
+                    raise rows
+                else:
+                    writer.write(rows)
+        finally:
+            for producer in producers:
+                if producer.is_alive():
+                    producer.terminate()
+                producer.join()
+        return writer.n_rows
@@ -0,0 +1,315 @@
+"""Gymnasium environments for learning the purchase decision."""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+import gymnasium as gym
+import numpy as np
+from frozendict import frozendict
+from gymnasium import spaces
+from gymnasium.vector import VectorEnv
+from gymnasium.vector.utils import batch_space
+
+from constants import cards_tuple, starting_buildings_dict
+from game import CARD_BITS, CARD_COSTS, MachiKoroGame
+from policy import Policy, RandomPolicy
+from rng import GameRandom, SeedSequence
+from state import AFFORDABLE_BITS, MAX_COST, N_CARDS, GameState
+
+PASS_ACTION = N_CARDS
+COST_ARRAY = np.array(CARD_COSTS, dtype=np.int64)
+AFFORDABLE_ARRAY = np.array(AFFORDABLE_BITS, dtype=np.int64)
+
+
+def _observation_space(n_players: int) -> spaces.Box:
+    return spaces.Box(
+        low=0.0, high=np.inf, shape=(GameState.n_features(n_players),), dtype=np.float32
+    )
+
+
+def _seat_policies(
+    n_players: int, agent_id: int, opponent_policy: Optional[Policy]
+) -> List[Policy]:
+    policies: List[Policy] = [opponent_policy or RandomPolicy()] * n_players
+    # the agent's decisions other than purchases are taken at random
+    policies[agent_id] = RandomPolicy()
+    return policies
+
+
+def _advance(game: MachiKoroGame, agent_id: int, max_turns: int) -> Tuple[bool, int]:
+    """Play until the agent has a purchase to choose or the game ends.
+
+    Returns whether the game is over and the winner (-1 if none). Turns
+    where the agent can afford nothing are passed without stopping.
+    """
+    while game.current_turn < max_turns:
+        if game.current_player == agent_id:
+            if game.start_turn() is not None:
+                return False, -1
+        else:
+            game.take_turn()
+        is_game_over, winner = game.is_game_over()
+        if is_game_over:
+            return True, winner
+    return False, -1
+
+
+def _agent_purchase(action: int, mask: np.ndarray) -> Optional[str]:
+    if action != PASS_ACTION and mask[action]:
+        return cards_tuple[action]
+    return None
+
+
+class MachiKoroEnv(gym.Env):
+    """One seat of a ``MachiKoroGame``; ``opponent_policy`` plays the others.
+
+    ``opponent_policy`` defaults to ``RandomPolicy``, which also takes the
+    agent's decisions other than purchases.
+
+    Every step is one purchase decision of the agent (``take_turn`` step 5):
+    action ``card_id`` buys that card and ``PASS_ACTION`` buys nothing.
+    Actions the rules do not allow are played as a pass; ``action_masks``
+    (the method MaskablePPO looks for, also in ``info["action_mask"]``)
+    tells which ones are allowed. Turns where the agent can afford nothing
+    are passed without asking.
+
+    The observation is the first ``GameState.n_features`` values of the
+    game's ``GameState.buffer`` as float32, in seat order. It and the mask
+    are preallocated and overwritten in place on every step, so copy them
+    to keep them. The reward is 1 when the agent
+    wins, -1 when another player does and 0 otherwise.
+    """
+
+    metadata = {"render_modes": []}
+
+    def __init__(
+        self,
+        n_players: int = 4,
+        agent_id: int = 0,
+        starting_buildings: frozendict = starting_buildings_dict,
+        starting_major_establishments: tuple = (),
+        max_turns: int = 2000,
+        opponent_policy: Optional[Policy] = None,
+    ):
+        if not 0 <= agent_id < n_players:
+            raise ValueError(f"agent_id must be in [0, {n_players}), got {agent_id}")
+        self.n_players = n_players
+        self.agent_id = agent_id
+        self.starting_buildings = starting_buildings
+        self.starting_major_establishments = starting_major_establishments
+        self.max_turns = max_turns
+        self._policies = _seat_policies(n_players, agent_id, opponent_policy)
+
+        self.observation_space = _observation_space(n_players)
+        self.action_space = spaces.Discrete(N_CARDS + 1)
+        self._n_features = GameState.n_features(n_players)
+        self._observation = np.zeros(self.observation_space.shape, dtype=np.float32)
+        self._mask = np.zeros(N_CARDS + 1, dtype=bool)
+        # filled in place on every step: the purchase bits spread over cards
+        self._card_mask = self._mask[:N_CARDS]
+        self._card_bits = np.zeros(N_CARDS, dtype=np.int64)
+        self._seed_sequence = SeedSequence()
+        self.game: Optional[MachiKoroGame] = None
+
+    def _new_game(self) -> MachiKoroGame:
+        (seed,) = self._seed_sequence.spawn(1)
+        return MachiKoroGame(
+            self.n_players,
+            starting_buildings=self.starting_buildings,
+            starting_major_establishments=self.starting_major_establishments,
+            seed=GameRandom(seed),
+            policies=self._policies,
+        )
+
+    def _observe(self) -> np.ndarray:
+        np.copyto(
+            self._observation, self.game.state.buffer[: self._n_features], casting="unsafe"
+        )
+        return self._observation
+
+    def _update_mask(self) -> None:
+        bits = self.game.purchase_bits(self.agent_id)
+        np.bitwise_and(bits, CARD_BITS, out=self._card_bits)
+        np.not_equal(self._card_bits, 0, out=self._card_mask)
+        self._mask[PASS_ACTION] = True
+
+    def action_masks(self) -> np.ndarray:
+        return self._mask
+
+    def _info(self) -> Dict[str, Any]:
+        return {"action_mask": self._mask, "turn": self.game.current_turn}
+
+    def reset(
+        self, *, seed: Optional[int] = None, options: Optional[Dict[str, Any]] = None
+    ) -> Tuple[np.ndarray, Dict[str, Any]]:
+        super().reset(seed=seed)
+        if seed is not None:
+            self._seed_sequence = SeedSequence(seed)
+        self.game = self._new_game()
+        # nobody can win before buying anything, so this stops at the
+        # agent's first purchase
+        _advance(self.game, self.agent_id, self.max_turns)
+        self._update_mask()
+        return self._observe(), self._info()
+
+    def step(
+        self, action: int
+    ) -> Tuple[np.ndarray, float, bool, bool, Dict[str, Any]]:
+        game = self.game
+        if game is None:
+            raise RuntimeError("call reset() before step()")
+        game.finish_turn(_agent_purchase(int(action), self._mask))
+        is_game_over, winner = game.is_game_over()
+        if not is_game_over:
+            is_game_over, winner = _advance(game, self.agent_id, self.max_turns)
+        self._update_mask()
+        reward = 0.0
+        if is_game_over:
+            reward = 1.0 if winner == self.agent_id else -1.0
+            self._mask[:PASS_ACTION] = False
+        truncated = not is_game_over and game.current_turn >= self.max_turns
+        return self._observe(), reward, is_game_over, truncated, self._info()
+
+
+class MachiKoroVectorEnv(VectorEnv):
+    """``num_envs`` copies of ``MachiKoroEnv`` stepped in one call, in process.
+
+    The game states live side by side as rows of one int64 array, so the
+    stacked observations and action masks are each computed with a few
+    array operations for all games at once. Observations and masks are
+    preallocated and overwritten in place.
+
+    Games that end are reset within the same ``step`` (same-step autoreset):
+    the returned observation is the first one of the new game, and the last
+    one of the finished game is in ``infos["final_obs"]`` where
+    ``infos["_final_obs"]`` is set. ``infos["winner"]`` has the finished
+    games' winners (-1 for running or truncated games).
+    """
+
+    metadata = {"autoreset_mode": "same-step"}
+
+    def __init__(
+        self,
+        num_envs: int,
+        n_players: int = 4,
+        agent_id: int = 0,
+        starting_buildings: frozendict = starting_buildings_dict,
+        starting_major_establishments: tuple = (),
+        max_turns: int = 2000,
+        opponent_policy: Optional[Policy] = None,
+    ):
+        if not 0 <= agent_id < n_players:
+            raise ValueError(f"agent_id must be in [0, {n_players}), got {agent_id}")
+        self.num_envs = num_envs
+        self.n_players = n_players
+        self.agent_id = agent_id
+        self.starting_buildings = starting_buildings
+        self.starting_major_establishments = starting_major_establishments
+        self.max_turns = max_turns
+        self._policies = _seat_policies(n_players, agent_id, opponent_policy)
+
+        self.single_observation_space = _observation_space(n_players)
+        self.single_action_space = spaces.Discrete(N_CARDS + 1)
+        self.observation_space = batch_space(self.single_observation_space, num_envs)
+        self.action_space = batch_space(self.single_action_space, num_envs)
+
+        self._buffers = np.zeros((num_envs, GameState.size(n_players)), dtype=np.int64)
+        layout = GameState.layout(n_players)
+
+        def field(name: str) -> np.ndarray:
+            offset, shape = layout[name]
+            size = int(np.prod(shape))
+            return self._buffers[:, offset : offset + size].reshape((num_envs,) + shape)
+
+        self._agent_coins = field("coins")[:, agent_id]
+        self._on_sale_bits = field("on_sale_bits")[:, 0]
+        self._agent_owned_bits = field("owned_bits")[:, agent_id]
+
+        self._n_features = GameState.n_features(n_players)
+        self._observations = np.zeros(
+            (num_envs,) + self.single_observation_space.shape, dtype=np.float32
+        )
+        self._final_observations = np.zeros_like(self._observations)
+        self._masks = np.zeros((num_envs, N_CARDS + 1), dtype=bool)
+        self._seed_sequences: List[SeedSequence] = SeedSequence().spawn(num_envs)
+        self.games: List[MachiKoroGame] = []
+
+    def _new_game(self, index: int) -> MachiKoroGame:
+        (seed,) = self._seed_sequences[index].spawn(1)
+        buffer = self._buffers[index]
+        buffer[:] = 0
+        game = MachiKoroGame(
+            self.n_players,
+            starting_buildings=self.starting_buildings,
+            starting_major_establishments=self.starting_major_establishments,
+            seed=GameRandom(seed),
+            state=GameState(self.n_players, buffer),
+            policies=self._policies,
+        )
+        _advance(game, self.agent_id, self.max_turns)
+        return game
+
+    def _observe(self) -> np.ndarray:
+        np.copyto(
+            self._observations, self._buffers[:, : self._n_features], casting="unsafe"
+        )
+        # MachiKoroGame.purchase_bits for all games at once
+        bits = (
+            self._on_sale_bits
+            & ~self._agent_owned_bits
+            & AFFORDABLE_ARRAY[np.minimum(self._agent_coins, MAX_COST)]
+        )
+        self._masks[:, :N_CARDS] = np.unpackbits(
+            bits.astype("<i8").view(np.uint8).reshape(self.num_envs, 8),
+            axis=1,
+            count=N_CARDS,
+            bitorder="little",
+        )
+        self._masks[:, PASS_ACTION] = True
+        return self._observations
+
+    def action_masks(self) -> np.ndarray:
+        return self._masks
+
+    def reset(
+        self, *, seed: Optional[int] = None, options: Optional[Dict[str, Any]] = None
+    ) -> Tuple[np.ndarray, Dict[str, Any]]:
+        if seed is not None:
+            self._seed_sequences = SeedSequence(seed).spawn(self.num_envs)
+        self.games = [self._new_game(index) for index in range(self.num_envs)]
+        return self._observe(), {"action_mask": self._masks}
+
+    def step(
+        self, actions: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, Dict[str, Any]]:
+        if not self.games:
+            raise RuntimeError("call reset() before step()")
+        rewards = np.zeros(self.num_envs, dtype=np.float32)
+        terminations = np.zeros(self.num_envs, dtype=bool)
+        truncations = np.zeros(self.num_envs, dtype=bool)
+        winners = np.full(self.num_envs, -1, dtype=np.int64)
+        for index, (game, action) in enumerate(zip(self.games, actions.tolist())):
+            game.finish_turn(_agent_purchase(action, self._masks[index]))
+            is_game_over, winner = game.is_game_over()
+            if not is_game_over:
+                is_game_over, winner = _advance(game, self.agent_id, self.max_turns)
+            if is_game_over:
+                terminations[index] = True
+                winners[index] = winner
+                rewards[index] = 1.0 if winner == self.agent_id else -1.0
+            elif game.current_turn >= self.max_turns:
+                truncations[index] = True
+        done = terminations | truncations
+        for index in np.flatnonzero(done).tolist():
+            np.copyto(
+                self._final_observations[index],
+                self._buffers[index, : self._n_features],
+                casting="unsafe",
+            )
+            self.games[index] = self._new_game(index)
+        infos = {
+            "action_mask": self._masks,
+            "winner": winners,
+            "final_obs": self._final_observations,
+            "_final_obs": done,
+        }
+        return self._observe(), rewards, terminations, truncations, infos
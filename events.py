@@ -0,0 +1,289 @@
+"""Typed game events and the sinks that receive them.
+
+``MachiKoroGame`` builds an event only when a sink is attached, so a game
+without one pays a single ``is None`` check per event site. Every event
+carries the turn it happened on; card names are the keys of
+``card_id_dict``.
+"""
+
+import json
+import struct
+from abc import ABC, abstractmethod
+from dataclasses import asdict, dataclass, fields
+from pathlib import Path
+from typing import (
+    BinaryIO,
+    ClassVar,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Protocol,
+    Tuple,
+    Type,
+    Union,
+)
+
+from constants import card_id_dict, cards_tuple
+
+
+@dataclass(frozen=True, slots=True)
+class RollEvent:
+    """The current player rolled ``num_dice`` dice."""
+
+    kind: ClassVar[str] = "roll"
+    turn: int
+    player_id: int
+    num_dice: int
+    roll: int
+    is_double: bool
+    is_reroll: bool
+
+
+@dataclass(frozen=True, slots=True)
+class IncomeEvent:
+    """A player got coins from the bank, or paid them to it when negative.
+
+    ``card`` is None for the city hall coin.
+    """
+
+    kind: ClassVar[str] = "income"
+    turn: int
+    player_id: int
+    card: Optional[str]
+    coins: int
+
+
+@dataclass(frozen=True, slots=True)
+class StealEvent:
+    """Coins went from one player to another because of ``card``."""
+
+    kind: ClassVar[str] = "steal"
+    turn: int
+    from_player_id: int
+    to_player_id: int
+    card: str
+    coins: int
+
+
+@dataclass(frozen=True, slots=True)
+class PurchaseEvent:
+    kind: ClassVar[str] = "purchase"
+    turn: int
+    player_id: int
+    card: str
+    cost: int
+
+
+@dataclass(frozen=True, slots=True)
+class RenovationEvent:
+    """``count`` copies of an establishment were closed or opened."""
+
+    kind: ClassVar[str] = "renovation"
+    turn: int
+    player_id: int
+    card: str
+    direction: str
+    count: int
+
+
+@dataclass(frozen=True, slots=True)
+class TradeEvent:
+    """One copy of an establishment changed hands (moving/business center)."""
+
+    kind: ClassVar[str] = "trade"
+    turn: int
+    from_player_id: int
+    to_player_id: int
+    card: str
+    is_renovated: bool
+
+
+@dataclass(frozen=True, slots=True)
+class LandmarkBuiltEvent:
+    kind: ClassVar[str] = "landmark_built"
+    turn: int
+    player_id: int
+    card: str
+
+
+@dataclass(frozen=True, slots=True)
+class LandmarkDemolishedEvent:
+    kind: ClassVar[str] = "landmark_demolished"
+    turn: int
+    player_id: int
+    card: str
+
+
+@dataclass(frozen=True, slots=True)
+class GameOverEvent:
+    kind: ClassVar[str] = "game_over"
+    turn: int
+    winner_id: int
+
+
+Event = Union[
+    RollEvent,
+    IncomeEvent,
+    StealEvent,
+    PurchaseEvent,
+    RenovationEvent,
+    TradeEvent,
+    LandmarkBuiltEvent,
+    LandmarkDemolishedEvent,
+    GameOverEvent,
+]
+
+# The position in this tuple is the type code used by the binary format, so
+# new event types must only ever be appended.
+EVENT_TYPES: Tuple[Type[Event], ...] = (
+    RollEvent,
+    IncomeEvent,
+    StealEvent,
+    PurchaseEvent,
+    RenovationEvent,
+    TradeEvent,
+    LandmarkBuiltEvent,
+    LandmarkDemolishedEvent,
+    GameOverEvent,
+)
+EVENT_TYPES_BY_KIND: Dict[str, Type[Event]] = {
+    event_type.kind: event_type for event_type in EVENT_TYPES
+}
+RENOVATION_DIRECTIONS = ("open", "close")
+
+
+class EventSink(Protocol):
+    def emit(self, event: Event) -> None: ...
+
+
+class EventRecorder:
+    """Keeps every event in memory, mostly for tests and notebooks."""
+
+    def __init__(self):
+        self.events: List[Event] = []
+
+    def emit(self, event: Event) -> None:
+        self.events.append(event)
+
+    def of_kind(self, kind: str) -> List[Event]:
+        return [event for event in self.events if event.kind == kind]
+
+
+class PrintSink:
+    """Prints every event, the way games used to narrate themselves."""
+
+    def emit(self, event: Event) -> None:
+        print(event)
+
+
+class _BufferedFileSink(ABC):
+    """Collects encoded events and writes them in ``buffer_size`` chunks;
+    subclasses say how an event is encoded."""
+
+    def __init__(self, file: Union[str, Path, BinaryIO], buffer_size: int = 1 << 16):
+        if isinstance(file, (str, Path)):
+            self._file: BinaryIO = open(file, "wb")
+            self._owns_file = True
+        else:
+            self._file = file
+            self._owns_file = False
+        self.buffer_size = buffer_size
+        self._buffer = bytearray()
+
+    @abstractmethod
+    def _encode(self, event: Event) -> bytes: ...
+
+    def emit(self, event: Event) -> None:
+        self._buffer += self._encode(event)
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        self._file.write(self._buffer)
+        self._buffer.clear()
+        self._file.flush()
+
+    def close(self) -> None:
+        self.flush()
+        if self._owns_file:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class JsonlEventWriter(_BufferedFileSink):
+    """Writes one JSON object per line, with the event kind under ``"kind"``."""
+
+    def _encode(self, event: Event) -> bytes:
+        return (json.dumps({"kind": event.kind, **asdict(event)}) + "\n").encode()
+
+
+def read_jsonl_events(path: Union[str, Path]) -> Iterator[Event]:
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            record = json.loads(line)
+            yield EVENT_TYPES_BY_KIND[record.pop("kind")](**record)
+
+
+# Binary records are a one-byte type code followed by one little-endian
+# int32 per field. Cards are stored as their id (-1 for None) and renovation
+# directions as their index in RENOVATION_DIRECTIONS.
+_CODE = struct.Struct("<B")
+_STRUCTS = tuple(struct.Struct("<" + "i" * len(fields(t))) for t in EVENT_TYPES)
+_CODES: Dict[Type[Event], int] = {t: code for code, t in enumerate(EVENT_TYPES)}
+
+
+def _encode_value(name: str, value: Union[int, str, None]) -> int:
+    if name == "card":
+        return -1 if value is None else card_id_dict[value]
+    if name == "direction":
+        return RENOVATION_DIRECTIONS.index(str(value))
+    return int(value)
+
+
+def _decode_value(
+    name: str, value_type: object, value: int
+) -> Union[int, str, bool, None]:
+    if name == "card":
+        return None if value == -1 else cards_tuple[value]
+    if name == "direction":
+        return RENOVATION_DIRECTIONS[value]
+    if value_type is bool:
+        return bool(value)
+    return value
+
+
+class BinaryEventWriter(_BufferedFileSink):
+    """Writes fixed-size binary records, read back by ``read_binary_events``."""
+
+    def _encode(self, event: Event) -> bytes:
+        code = _CODES[type(event)]
+        values = [
+            _encode_value(field.name, getattr(event, field.name))
+            for field in fields(event)
+        ]
+        return _CODE.pack(code) + _STRUCTS[code].pack(*values)
+
+
+def read_binary_events(path: Union[str, Path]) -> Iterator[Event]:
+    data = Path(path).read_bytes()
+    offset = 0
+    while offset < len(data):
+        (code,) = _CODE.unpack_from(data, offset)
+        offset += _CODE.size
+        record_struct = _STRUCTS[code]
+        event_type = EVENT_TYPES[code]
+        values = record_struct.unpack_from(data, offset)
+        offset += record_struct.size
+        yield event_type(
+            *(
+                _decode_value(field.name, field.type, value)
+                for field, value in zip(fields(event_type), values)
+            )
+        )
+
@@ -1,14 +1,26 @@
 import math
-import random
-from typing import Dict, Tuple, Union
+from functools import cached_property
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
+import numpy as np
 from frozendict import frozendict
-from pydantic import BaseModel
-from pydantic.fields import Field
 
 from constants import (
     activation_dict,
     building_cost_dict,
+    card_id_dict,
+    cards_tuple,
     landmarks_tuple,
     major_establishments_tuple,
     primary_industry_dict,
@@ -16,20 +28,159 @@ from constants import (
     secondary_industry_dict,
     starting_buildings_dict,
 )
+from events import (
+    EventSink,
+    GameOverEvent,
+    IncomeEvent,
+    LandmarkBuiltEvent,
+    LandmarkDemolishedEvent,
+    PurchaseEvent,
+    RenovationEvent,
+    RollEvent,
+    StealEvent,
+    TradeEvent,
+)
+from policy import (
+    GIVE_BUILDING,
+    MOVE_BUILDING,
+    NUM_DICE,
+    PURCHASE,
+    RENOVATE_BUILDING,
+    REROLL,
+    TAKE_BUILDING,
+    TARGET,
+    TECH_STARTUP_COIN,
+    BatchAsPolicy,
+    BatchPolicy,
+    Decision,
+    DecisionRecorder,
+    GameView,
+    Policy,
+    RandomPolicy,
+)
+from profiler import GameProfiler
+from replay import GameRecord, ReplayCheckpoints, ReplayPolicy
+from rng import GameRandom, SeedSequence
+from state import (
+    BREAD,
+    COW,
+    GEAR,
+    AFFORDABLE_BITS,
+    ALL_LANDMARK_BITS,
+    ICON_IDS,
+    LANDMARK_BITS,
+    LANDMARKS_BY_COST,
+    MAX_COST,
+    N_CARDS,
+    N_ESTABLISHMENTS,
+    RESTAURANT,
+    WHEAT,
+    ArrayRowView,
+    GameState,
+    PlayersView,
+)
+
+CARD_COSTS = tuple(building_cost_dict[card] for card in cards_tuple)
+CARD_ROLLS = tuple(
+    activation_dict[card]["roll"] if card in activation_dict else ()
+    for card in cards_tuple
+)
+CARD_VALUES = tuple(
+    activation_dict[card]["value"] if card in activation_dict else None
+    for card in cards_tuple
+)
+PRIMARY_IDS = tuple(card_id_dict[card] for card in primary_industry_dict)
+SECONDARY_IDS = tuple(card_id_dict[card] for card in secondary_industry_dict)
+RESTAURANT_IDS = tuple(card_id_dict[card] for card in restaurants_tuple)
+MAJOR_IDS = tuple(card_id_dict[card] for card in major_establishments_tuple)
+LANDMARK_IDS = tuple(card_id_dict[card] for card in landmarks_tuple)
+BREAD_IDS = frozenset(
+    card_id_dict[card]
+    for card, icon in secondary_industry_dict.items()
+    if icon == "bread"
+)
+WHEAT_IDS = tuple(
+    card_id_dict[card] for card, icon in primary_industry_dict.items() if icon == "wheat"
+)
+COW_IDS = tuple(
+    card_id_dict[card] for card, icon in primary_industry_dict.items() if icon == "cow"
+)
+GEAR_IDS = tuple(
+    card_id_dict[card] for card, icon in primary_industry_dict.items() if icon == "gear"
+)
+PUBLISHER_IDS = tuple(sorted(BREAD_IDS)) + RESTAURANT_IDS
+# bit i of GameState.landmark_bits stands for LANDMARK_IDS_BY_COST[i]
+LANDMARK_IDS_BY_COST = tuple(card_id_dict[card] for card in LANDMARKS_BY_COST)
+
+TRAIN_STATION = card_id_dict["train_station"]
+SHOPPING_MALL = card_id_dict["shopping_mall"]
+AMUSEMENT_PARK = card_id_dict["amusement_park"]
+RADIO_TOWER = card_id_dict["radio_tower"]
+HARBOR = card_id_dict["harbor"]
+AIRPORT = card_id_dict["airport"]
+LOAN_OFFICE = card_id_dict["loan_office"]
+MOVING_COMPANY = card_id_dict["moving_company"]
+BUSINESS_CENTER = card_id_dict["business_center"]
+TECH_STARTUP = card_id_dict["tech_startup"]
+FLOWER_GARDEN = card_id_dict["flower_garden"]
+VINEYARD = card_id_dict["vineyard"]
+WINERY = card_id_dict["winery"]
+
+MAX_ROLL = 14
+# CARD_BITS[card_id] == 1 << card_id, to spread purchase bits over an array
+CARD_BITS = np.left_shift(1, np.arange(N_CARDS, dtype=np.int64))
+
+_MODELS = ("EstablishmentCount", "Player")
 
 
-class EstablishmentCount(BaseModel, validate_assignment=True):
-    working: int = Field(ge=0, strict=True)
-    on_renovation: int = Field(ge=0, strict=True)
+def __getattr__(name: str) -> Any:
+    # the pydantic models are only loaded when asked for, so that importing
+    # the engine stays cheap for workers that never validate anything
+    if name in _MODELS:
+        import models
 
+        return getattr(models, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-class Player(BaseModel, validate_assignment=True):
-    id: int = Field(frozen=True, strict=True)
-    coins: int = Field(ge=0, strict=True)
-    major_establishments: Dict[str, bool]
-    landmarks: Dict[str, bool]
-    establishments: Dict[str, EstablishmentCount]
-    is_first_turn: bool = True
+
+class RollRules(NamedTuple):
+    """Card ids that can activate on one roll, per colour phase, in activation order."""
+
+    red: Tuple[int, ...]
+    green: Tuple[int, ...]
+    blue: Tuple[int, ...]
+    purple: Tuple[int, ...]
+
+
+def _firing_on(roll: int, card_ids) -> Tuple[int, ...]:
+    return tuple(card_id for card_id in card_ids if roll in CARD_ROLLS[card_id])
+
+
+GREEN_ACTIVATION_ORDER = (LOAN_OFFICE, MOVING_COMPANY) + tuple(
+    card_id for card_id in SECONDARY_IDS if card_id not in (LOAN_OFFICE, MOVING_COMPANY)
+)
+PURPLE_ACTIVATION_ORDER = tuple(card_id for card_id in MAJOR_IDS if card_id != BUSINESS_CENTER) + (
+    BUSINESS_CENTER,
+)
+# ROLL_RULES[roll] lists the only cards activate_cards has to look at; roll 0
+# activates nothing.
+ROLL_RULES = tuple(
+    RollRules(
+        red=_firing_on(roll, RESTAURANT_IDS),
+        green=_firing_on(roll, GREEN_ACTIVATION_ORDER),
+        blue=_firing_on(roll, PRIMARY_IDS),
+        purple=_firing_on(roll, PURPLE_ACTIVATION_ORDER),
+    )
+    for roll in range(MAX_ROLL + 1)
+)
+
+
+class GameSnapshot(NamedTuple):
+    """A game between turns: the bytes of its state buffer and whose turn it is."""
+
+    state: bytes
+    current_player: int
+    current_turn: int
 
 
 class MachiKoroGame:
@@ -38,41 +189,191 @@ class MachiKoroGame:
         n_players: int,
         starting_buildings: frozendict = starting_buildings_dict,
         starting_major_establishments: tuple = (),
+        events: Optional[EventSink] = None,
+        seed: Union[int, SeedSequence, GameRandom, None] = None,
+        state: Optional[GameState] = None,
+        policies: Optional[Sequence[Policy]] = None,
+        profiler: Optional[GameProfiler] = None,
     ):
+        """``state``, if given, must be zeroed; by default a new one is made.
+
+        ``policies`` has one ``Policy`` per seat and defaults to
+        ``RandomPolicy`` for everyone. ``profiler`` times the turns, see
+        profiler.py.
+        """
         self.n_players = n_players
-        self.players = {
-            i: self._init_player(
-                player_id=i,
+        if policies is None:
+            policies = [RandomPolicy()] * n_players
+        if len(policies) != n_players:
+            raise ValueError(f"expected {n_players} policies, got {len(policies)}")
+        self.policies: List[Policy] = list(policies)
+        self.rng = seed if isinstance(seed, GameRandom) else GameRandom(seed)
+        # Events are only built when a sink is attached, see events.py.
+        self.events = events
+        # Set by replay.GameRecorder to log the decisions taken.
+        self.recorder: Optional[DecisionRecorder] = None
+        self.profiler = profiler
+        self._card_handlers = CARD_HANDLERS
+        if profiler is not None:
+            self._card_handlers = profiler.wrap_handlers(CARD_HANDLERS, cards_tuple)
+        self.starting_buildings = starting_buildings
+        self.starting_major_establishments = starting_major_establishments
+        self._bind_state(GameState(n_players) if state is None else state)
+
+        for player_id in range(n_players):
+            self._init_player(
+                player_id=player_id,
                 starting_buildings=starting_buildings,
                 starting_major_establishments=starting_major_establishments,
             )
-            for i in range(n_players)
-        }
-        self.market = self._init_market(n_players=n_players)
+        for card, count in self._init_market(n_players=n_players).items():
+            self.state.set_market(card_id_dict[card], count)
         self.current_player = 0
         self.current_turn = 0
-        self.tech_startups = {i: 0 for i in range(n_players)}
+        # the turn started by start_turn and its pending purchase decision
+        self._turn: Optional[Generator[Decision, Any, Optional[str]]] = None
+        self._purchase_decision: Optional[Decision] = None
+
+    def _bind_state(self, state: GameState) -> None:
+        self.state = state
+        # Memoryviews share memory with the state arrays but return plain
+        # ints, which keeps scalar reads and writes in the turn loop cheap.
+        self._coins = memoryview(state.coins)
+        self._working = memoryview(state.working)
+        self._on_renovation = memoryview(state.on_renovation)
+        self._owned = memoryview(state.owned)
+        self._market = memoryview(state.market)
+        self._tech_startups = memoryview(state.tech_startups)
+        self._is_first_turn = memoryview(state.is_first_turn)
+        self._icons = memoryview(state.icons)
+        self._landmark_bits = memoryview(state.landmark_bits)
+        self._n_landmarks = memoryview(state.n_landmarks)
+        self._on_sale_bits = memoryview(state.on_sale_bits)
+        self._owned_bits = memoryview(state.owned_bits)
+
+    # The views are built on first use, which keeps clone cheap.
+    @cached_property
+    def players(self) -> PlayersView:
+        return PlayersView(self.state)
+
+    @cached_property
+    def market(self) -> ArrayRowView:
+        return ArrayRowView(
+            cards_tuple, card_id_dict, self.state.market, setter=self.state.set_market
+        )
+
+    @cached_property
+    def tech_startups(self) -> ArrayRowView:
+        return ArrayRowView(
+            range(self.n_players),
+            {i: i for i in range(self.n_players)},
+            self.state.tech_startups,
+        )
+
+    @cached_property
+    def view(self) -> GameView:
+        return GameView(self)
+
+    def snapshot(self) -> GameSnapshot:
+        """Everything ``restore`` needs to bring the game back to this point.
+
+        The random source is not part of it, so a game restored twice will
+        roll different dice. Taken during a turn, it holds the state as it is
+        at that point; ``resume_turn`` plays the rest of the turn.
+        """
+        return GameSnapshot(
+            self.state.buffer.tobytes(), self.current_player, self.current_turn
+        )
+
+    def restore(self, snapshot: GameSnapshot) -> None:
+        """Return to ``snapshot``, dropping a turn left waiting for a purchase."""
+        buffer = memoryview(self.state.buffer).cast("B")
+        if len(snapshot.state) != len(buffer):
+            raise ValueError(
+                f"snapshot is {len(snapshot.state)} bytes, the state {len(buffer)}"
+            )
+        buffer[:] = snapshot.state
+        self.current_player = snapshot.current_player
+        self.current_turn = snapshot.current_turn
+        self._turn = None
+        self._purchase_decision = None
+
+    def clone(self, rng: Optional[GameRandom] = None) -> "MachiKoroGame":
+        """An independent copy of the game, with the same policies and no sink,
+        recorder or profiler.
+
+        The copy draws from the same ``GameRandom`` as this game unless
+        ``rng`` is given; ``game.clone(game.rng.copy())`` replays exactly
+        what the original would. Like ``snapshot``, a clone taken during a
+        turn continues it only through ``resume_turn``.
+        """
+        game = MachiKoroGame.__new__(MachiKoroGame)
+        game.n_players = self.n_players
+        game.policies = list(self.policies)
+        game.rng = self.rng if rng is None else rng
+        game.events = None
+        game.recorder = None
+        game.profiler = None
+        game._card_handlers = CARD_HANDLERS
+        game.starting_buildings = self.starting_buildings
+        game.starting_major_establishments = self.starting_major_establishments
+        game._bind_state(self.state.copy())
+        game.current_player = self.current_player
+        game.current_turn = self.current_turn
+        game._turn = None
+        game._purchase_decision = None
+        return game
+
+    @classmethod
+    def replay(
+        cls,
+        record: GameRecord,
+        until_turn: Optional[int] = None,
+        checkpoints: Optional[ReplayCheckpoints] = None,
+    ) -> "MachiKoroGame":
+        """Play the game of ``record`` again, up to ``until_turn`` turns.
+
+        Nothing is emitted while replaying. ``until_turn`` is at most, and
+        defaults to, the number of turns recorded. With ``checkpoints`` of
+        the same record the replay starts from the last one at or before
+        ``until_turn`` and saves those it passes. The game returned keeps
+        answering decisions from the record.
+        """
+        if until_turn is None or until_turn > record.turns:
+            until_turn = record.turns
+        start = None
+        if checkpoints is not None:
+            if not checkpoints.matches(record):
+                raise ValueError("the checkpoints are of another record")
+            start = checkpoints.latest(until_turn)
+        policy = ReplayPolicy(record.decisions, 0 if start is None else start.position)
+        game = cls(
+            record.n_players,
+            starting_buildings=record.starting_buildings,
+            starting_major_establishments=record.starting_major_establishments,
+            seed=record.seed if start is None else start.rng.copy(),
+            policies=[policy] * record.n_players,
+        )
+        if start is not None:
+            game.restore(start.snapshot)
+        while game.current_turn < until_turn:
+            game.take_turn()
+            if checkpoints is not None:
+                checkpoints.add(game, policy.position)
+        return game
 
-    @staticmethod
     def _init_player(
+        self,
         player_id: int = 0,
         starting_buildings: frozendict = starting_buildings_dict,
         starting_major_establishments: tuple = (),
-    ) -> Player:
-        return Player(
-            id=player_id,
-            coins=3,
-            major_establishments={
-                key: True if key in starting_major_establishments else False
-                for key in major_establishments_tuple
-            },
-            landmarks={landmark: False for landmark in landmarks_tuple},
-            establishments={
-                key: EstablishmentCount(working=val[0], on_renovation=val[1])
-                for key, val in starting_buildings.items()
-            },
-            is_first_turn=True,
-        )
+    ) -> None:
+        self._coins[player_id] = 3
+        self._is_first_turn[player_id] = 1
+        for key in starting_major_establishments:
+            self.state.set_owned(player_id, card_id_dict[key], 1)
+        for key, val in starting_buildings.items():
+            self.state.set_establishment(player_id, card_id_dict[key], val[0], val[1])
 
     @staticmethod
     def _init_market(n_players: int = 2) -> dict:
@@ -94,11 +395,10 @@ class MachiKoroGame:
 
         return market_dict
 
-    @staticmethod
-    def roll_dice(num_dice=1) -> Tuple[int, bool]:
+    def roll_dice(self, num_dice=1) -> Tuple[int, bool]:
         """Simulate rolling dice."""
-        roll1 = random.randint(1, 6)
-        roll2 = random.randint(1, 6) if num_dice == 2 else 0
+        roll1 = self.rng.roll_die()
+        roll2 = self.rng.roll_die() if num_dice == 2 else 0
         is_double = True if roll1 == roll2 else False
         return roll1 + roll2, is_double
 
@@ -112,773 +412,745 @@ class MachiKoroGame:
 
         return order[:-1]
 
+    def get_held_buildings(self, player_id: int) -> List[str]:
+        """Names of the establishments a player holds, working or renovated."""
+        working = self._working
+        on_renovation = self._on_renovation
+        return [
+            cards_tuple[card_id]
+            for card_id in range(N_ESTABLISHMENTS)
+            if working[player_id, card_id] > 0 or on_renovation[player_id, card_id] > 0
+        ]
+
+    def count_landmarks(self, player_id: int) -> int:
+        return self._n_landmarks[player_id]
+
     def activate_cards(self, current_player_id: int, roll: int) -> None:
-        """Activate cards based on dice roll."""
+        """Activate the cards that fire on ``roll``, one colour phase at a time.
+
+        Renovated copies of an establishment that fires reopen instead of
+        paying out; the working copies are resolved by the card's handler.
+        """
+        rules = ROLL_RULES[roll]
+        handlers = self._card_handlers
+        profiler = self.profiler
+        working = self._working
+        on_renovation = self._on_renovation
+        owned = self._owned
+
         # red goes first
-        reverse_player_order = self.get_reverse_player_order(current_player_id)
-        for player_id in reverse_player_order:
-            has_shopping_mall = self.players[player_id].landmarks["shopping_mall"]
-            for building_name, building_info in self.players[
-                player_id
-            ].establishments.items():
-                if self.players[current_player_id].coins == 0:
-                    continue
-                if building_name not in restaurants_tuple:
-                    continue
-                if building_info.working == 0:
-                    if building_info.on_renovation > 0:
-                        self.renovation("open", player_id, building_name)
-                    continue
-                if roll not in activation_dict[building_name]["roll"]:
-                    continue
-                coins_to_take = activation_dict[building_name]["value"]
-                if coins_to_take == "special":
-                    kwargs = {
-                        "target_player_id": current_player_id,
-                        "receiving_player_id": player_id,
-                    }
-                    self.activate_special_card(
-                        building_name, -1, building_info, **kwargs
-                    )
-                    continue
+        if rules.red:
+            for player_id in self.get_reverse_player_order(current_player_id):
+                for card_id in rules.red:
+                    n_working = working[player_id, card_id]
+                    if on_renovation[player_id, card_id]:
+                        self.renovation("open", player_id, cards_tuple[card_id])
+                    if n_working:
+                        handlers[card_id](
+                            self, current_player_id, player_id, card_id, n_working
+                        )
+        if profiler is not None:
+            profiler.lap("red")
 
-                if has_shopping_mall:
-                    coins_to_take += 1
-                coins_to_take *= building_info.working
-                coins_to_take = min(
-                    coins_to_take, self.players[current_player_id].coins
-                )
-                self.players[current_player_id].coins -= coins_to_take
-                print(
-                    f"{current_player_id=} lost {coins_to_take=}, current player coins: {self.players[current_player_id].coins}"
-                )
-                self.players[player_id].coins += coins_to_take
-                print(
-                    f"{player_id=} gain {coins_to_take=}, current player coins: {self.players[player_id].coins}"
-                )
+        # green goes second, loan office and moving company first of them
+        for card_id in rules.green:
+            n_working = working[current_player_id, card_id]
+            if on_renovation[current_player_id, card_id]:
+                self.renovation("open", current_player_id, cards_tuple[card_id])
+            if n_working:
+                handlers[card_id](self, current_player_id, card_id, n_working)
+        if profiler is not None:
+            profiler.lap("green")
 
-        # green goes second, loan office is the first of them
-        if "loan_office" in self.players[current_player_id].establishments.keys():
-            coins_to_take = activation_dict["loan_office"]["value"]
-            coins_to_take *= (
-                self.players[current_player_id].establishments["loan_office"].working
-            )
-            coins_to_take = min(
-                abs(coins_to_take), self.players[current_player_id].coins
+        # blue goes next
+        if rules.blue:
+            for player_id in range(self.n_players):
+                for card_id in rules.blue:
+                    n_working = working[player_id, card_id]
+                    if on_renovation[player_id, card_id]:
+                        self.renovation("open", player_id, cards_tuple[card_id])
+                    if n_working:
+                        handlers[card_id](self, player_id, card_id, n_working)
+        if profiler is not None:
+            profiler.lap("blue")
+
+        # purple goes last, business center at the very end
+        for card_id in rules.purple:
+            if owned[current_player_id, card_id]:
+                handlers[card_id](self, current_player_id, card_id, 1)
+        if profiler is not None:
+            profiler.lap("purple")
+
+    def _choose(self, decision: Decision) -> Any:
+        choice = self.policies[decision.player_id].choose(decision)
+        if choice not in decision.options:
+            raise ValueError(
+                f"{choice!r} is not one of the {decision.kind} options {decision.options}"
             )
-            self.players[current_player_id].coins -= coins_to_take
-            if (
-                self.players[current_player_id]
-                .establishments["loan_office"]
-                .on_renovation
-                > 0
-            ):
-                self.renovation("open", current_player_id, "loan_office")
-
-        # moving company is the second
-        if (
-            "moving_company" in self.players[current_player_id].establishments
-            and roll in activation_dict["moving_company"]["roll"]
-        ):
-            building_info = self.players[current_player_id].establishments[
-                "moving_company"
-            ]
-            for _ in range(building_info.working):
-                self.clean_empty_cards()
-                kwargs = {
-                    "target_player_id": self.get_target_player_id(current_player_id),
-                    "current_player_building": random.choice(
-                        [
-                            key
-                            for key in self.players[
-                                current_player_id
-                            ].establishments.keys()
-                            if self.players[current_player_id]
-                            .establishments[key]
-                            .working
-                            > 0
-                            or self.players[current_player_id]
-                            .establishments[key]
-                            .on_renovation
-                            > 0
-                        ]
-                    ),
-                }
-                self.activate_special_card(
-                    "moving_company", current_player_id, building_info, **kwargs
-                )
-                self.clean_empty_cards()
-            if building_info.on_renovation:
-                self.renovation("open", current_player_id, "moving_company")
-
-        has_shopping_mall = self.players[current_player_id].landmarks["shopping_mall"]
-        for building_name, building_info in self.players[
-            current_player_id
-        ].establishments.items():
-            if building_name not in secondary_industry_dict:
-                continue
-            if building_name in ("loan_office", "moving_company"):
-                continue
-            if roll not in activation_dict[building_name]["roll"]:
-                continue
-            if building_info.working == 0:
-                if building_info.on_renovation > 0:
-                    self.renovation("open", current_player_id, building_name)
-                continue
-
-            coins_to_take = activation_dict[building_name]["value"]
-            if coins_to_take == "special":
-                self.activate_special_card(
-                    building_name, current_player_id, building_info
-                )
-                continue
+        return choice
 
-            if has_shopping_mall and secondary_industry_dict[building_name] == "bread":
-                coins_to_take += 1
+    def _decide(
+        self, kind: str, player_id: int, options: Sequence[Any], card: str
+    ) -> Any:
+        """Ask the player's policy to make a decision while ``card`` activates."""
+        decision = Decision(kind, player_id, tuple(options), self.view, card)
+        choice = self._choose(decision)
+        if self.recorder is not None:
+            self.recorder.record(decision, choice)
+        return choice
 
-            coins_to_take *= building_info.working
-            self.players[current_player_id].coins += coins_to_take
+    def _choose_target(self, player_id: int, card: str) -> int:
+        opponents = [other_id for other_id in range(self.n_players) if other_id != player_id]
+        return self._decide(TARGET, player_id, opponents, card)
 
-        # blue goes next
-        for player_id in self.players:
-            for building_name, building_info in self.players[
-                player_id
-            ].establishments.items():
-                if building_name not in primary_industry_dict:
-                    continue
-                if building_info.working == 0:
-                    if building_info.on_renovation > 0:
-                        self.renovation("open", player_id, building_name)
-                    continue
-                if roll not in activation_dict[building_name]["roll"]:
-                    continue
-
-                coins_to_take = activation_dict[building_name]["value"]
-                if coins_to_take == "special":
-                    self.activate_special_card(building_name, player_id, building_info)
-                    continue
-
-                coins_to_take *= building_info.working
-                self.players[player_id].coins += coins_to_take
-
-        # purple goes last
-        for building_name in self.players[current_player_id].major_establishments:
-            if building_name == "business_center":
-                continue
-            if roll not in activation_dict[building_name]["roll"]:
-                continue
-
-            kwargs = {}
-            if building_name == "tv_station":
-                kwargs["target_player_id"] = self.get_target_player_id(
-                    current_player_id
-                )
-            if building_name == "renovation_company":
-                choose_from = [
-                    building_name
-                    for player_id in self.players
-                    for building_name in self.players[player_id].establishments
-                ]
-                choose_from = list(set(choose_from))
-                kwargs["target_building_name"] = random.choice(choose_from)
-
-            self.activate_special_card(
-                building_name,
-                current_player_id,
-                EstablishmentCount(working=1, on_renovation=0),
-                **kwargs,
+    # The _emit_* helpers expect the caller to have checked that a sink is
+    # attached, so that nothing is built when there is none.
+    def _emit_income(self, player_id: int, card: Optional[str], coins: int) -> None:
+        if coins and self.events is not None:
+            self.events.emit(IncomeEvent(self.current_turn, player_id, card, coins))
+
+    def _emit_steal(
+        self, from_player_id: int, to_player_id: int, card: str, coins: int
+    ) -> None:
+        if coins and self.events is not None:
+            self.events.emit(
+                StealEvent(self.current_turn, from_player_id, to_player_id, card, coins)
             )
 
-        # special treatment for business center
-        if (
-            "business_center" in self.players[current_player_id].major_establishments
-            and roll in activation_dict["business_center"]["roll"]
-        ):
-            kwargs: Dict[str, Union[int, str]] = {
-                "target_player_id": self.get_target_player_id(current_player_id)
-            }
-            choose_from = [
-                key
-                for key in self.players[
-                    int(kwargs["target_player_id"])
-                ].establishments.keys()
-                if self.players[int(kwargs["target_player_id"])]
-                .establishments[key]
-                .working
-                > 0
-                or self.players[int(kwargs["target_player_id"])]
-                .establishments[key]
-                .on_renovation
-                > 0
-            ]
-            kwargs["target_player_building"] = random.choice(choose_from)
-            kwargs["current_player_building"] = random.choice(
-                list(
-                    key
-                    for key in self.players[current_player_id].establishments.keys()
-                    if self.players[current_player_id].establishments[key].working > 0
-                    or self.players[current_player_id].establishments[key].on_renovation
-                    > 0
+    def _emit_renovation(
+        self, player_id: int, card: str, direction: str, count: int
+    ) -> None:
+        if count and self.events is not None:
+            self.events.emit(
+                RenovationEvent(self.current_turn, player_id, card, direction, count)
+            )
+
+    def _count_copies(self, player_id: int, card_id: int) -> int:
+        return self._working[player_id, card_id] + self._on_renovation[player_id, card_id]
+
+    def _move_building(
+        self, from_player_id: int, to_player_id: int, card_id: int, renovated: bool
+    ) -> None:
+        counts = self._on_renovation if renovated else self._working
+        counts[from_player_id, card_id] -= 1
+        counts[to_player_id, card_id] += 1
+        icon = ICON_IDS[card_id]
+        if icon >= 0:
+            self._icons[from_player_id, icon] -= 1
+            self._icons[to_player_id, icon] += 1
+        if self.events is not None:
+            self.events.emit(
+                TradeEvent(
+                    self.current_turn,
+                    from_player_id,
+                    to_player_id,
+                    cards_tuple[card_id],
+                    bool(renovated),
                 )
             )
-            self.activate_special_card(
-                "business_center",
-                current_player_id,
-                EstablishmentCount(working=1, on_renovation=0),
-                **kwargs,
+
+    # Card handlers. CARD_HANDLERS maps every establishment and major
+    # establishment to one of these; red handlers get the paying and the
+    # receiving player, the others get the card's owner. ``n_working`` is the
+    # owner's number of working copies and is always positive.
+
+    def _earn_flat(self, player_id: int, card_id: int, n_working: int) -> None:
+        coins_to_gain = CARD_VALUES[card_id]
+        if card_id in BREAD_IDS and self._owned[player_id, SHOPPING_MALL]:
+            coins_to_gain += 1
+        coins_to_gain *= n_working
+        self._coins[player_id] += coins_to_gain
+        if self.events is not None:
+            self._emit_income(player_id, cards_tuple[card_id], coins_to_gain)
+
+    def _earn_per_icon(
+        self, player_id: int, card_id: int, n_working: int, n_icons: int, per_icon: int
+    ) -> None:
+        coins_to_gain = per_icon * n_icons * n_working
+        self._coins[player_id] += coins_to_gain
+        if self.events is not None:
+            self._emit_income(player_id, cards_tuple[card_id], coins_to_gain)
+
+    def _take(
+        self, from_player_id: int, to_player_id: int, card_id: int, coins_to_take
+    ) -> None:
+        coins = self._coins
+        coins_to_take = min(coins_to_take, coins[from_player_id])
+        coins[from_player_id] -= coins_to_take
+        coins[to_player_id] += coins_to_take
+        if self.events is not None:
+            self._emit_steal(
+                from_player_id, to_player_id, cards_tuple[card_id], coins_to_take
             )
 
-    def get_target_player_id(self, current_player_id: int) -> int:
-        # just take from the richest
-        target_player_id = sorted(
-            [
-                (player_id, self.players[player_id].coins)
-                for player_id in self.players
-                if player_id != current_player_id
-            ],
-            key=lambda a: a[1],
-            reverse=True,
+    def _take_flat(
+        self, payer_id: int, receiver_id: int, card_id: int, n_working: int
+    ) -> None:
+        coins_to_take = CARD_VALUES[card_id]
+        if self._owned[receiver_id, SHOPPING_MALL]:
+            coins_to_take += 1
+        self._take(payer_id, receiver_id, card_id, coins_to_take * n_working)
+
+    def _activate_sushi_bar(
+        self, payer_id: int, receiver_id: int, card_id: int, n_working: int
+    ) -> None:
+        if not self._owned[receiver_id, HARBOR]:
+            return
+        coins_to_take = 3
+        if self._owned[receiver_id, SHOPPING_MALL]:
+            coins_to_take += 1
+        self._take(payer_id, receiver_id, card_id, coins_to_take * n_working)
+
+    def _activate_french_restaurant(
+        self, payer_id: int, receiver_id: int, card_id: int, n_working: int
+    ) -> None:
+        if self.count_landmarks(payer_id) < 2:
+            return
+        coins_to_take = 5
+        if self._owned[receiver_id, SHOPPING_MALL]:
+            coins_to_take += 1
+        for _ in range(n_working):
+            self._take(payer_id, receiver_id, card_id, coins_to_take)
+
+    def _activate_members_only_club(
+        self, payer_id: int, receiver_id: int, card_id: int, n_working: int
+    ) -> None:
+        self._take(payer_id, receiver_id, card_id, self._coins[payer_id])
+
+    def _activate_loan_office(
+        self, player_id: int, card_id: int, n_working: int
+    ) -> None:
+        coins_to_pay = min(abs(CARD_VALUES[card_id]) * n_working, self._coins[player_id])
+        self._coins[player_id] -= coins_to_pay
+        if self.events is not None:
+            self._emit_income(player_id, cards_tuple[card_id], -coins_to_pay)
+
+    def _activate_moving_company(
+        self, player_id: int, card_id: int, n_working: int
+    ) -> None:
+        for _ in range(n_working):
+            held_buildings = self.get_held_buildings(player_id)
+            if not held_buildings:
+                break
+            target_player_id = self._choose_target(player_id, "moving_company")
+            building_id = card_id_dict[
+                self._decide(MOVE_BUILDING, player_id, held_buildings, "moving_company")
+            ]
+            is_renovated = self._on_renovation[player_id, building_id] > 0
+            self._move_building(player_id, target_player_id, building_id, is_renovated)
+            self._coins[player_id] += 4
+            if self.events is not None:
+                self._emit_income(player_id, cards_tuple[card_id], 4)
+
+    def _activate_fruit_and_vegetable_market(
+        self, player_id: int, card_id: int, n_working: int
+    ) -> None:
+        self._earn_per_icon(
+            player_id, card_id, n_working, self._icons[player_id, WHEAT], 2
         )
-        target_player_id = target_player_id[0][0]
-        return target_player_id
 
-    def activate_special_card(
-        self,
-        card_name: str,
-        current_player_id: int,
-        building_info: EstablishmentCount,
-        **kwargs,
+    def _activate_cheese_factory(
+        self, player_id: int, card_id: int, n_working: int
     ) -> None:
-        match card_name:
-            case "fruit_and_vegetable_market":
-                total_wheat_buildings = 0
-                for b_name, b_info in self.players[
-                    current_player_id
-                ].establishments.items():
-                    if primary_industry_dict.get(b_name, "") == "wheat":
-                        total_wheat_buildings += b_info.working + b_info.on_renovation
-                coins_to_gain = 2 * total_wheat_buildings
-                coins_to_gain *= building_info.working
-                self.players[current_player_id].coins += coins_to_gain
-                if building_info.on_renovation > 0:
-                    self.renovation("open", current_player_id, card_name)
-            case "cheese_factory":
-                total_cow_buildings = 0
-                for b_name, b_info in self.players[
-                    current_player_id
-                ].establishments.items():
-                    if primary_industry_dict.get(b_name, "") == "cow":
-                        total_cow_buildings += b_info.working + b_info.on_renovation
-                coins_to_gain = 3 * total_cow_buildings
-                coins_to_gain *= building_info.working
-                self.players[current_player_id].coins += coins_to_gain
-                if building_info.on_renovation > 0:
-                    self.renovation("open", current_player_id, card_name)
-            case "furniture_factory":
-                total_gear_buildings = 0
-                for b_name, b_info in self.players[
-                    current_player_id
-                ].establishments.items():
-                    if primary_industry_dict.get(b_name, "") == "gear":
-                        total_gear_buildings += b_info.working + b_info.on_renovation
-                coins_to_gain = 3 * total_gear_buildings
-                coins_to_gain *= building_info.working
-                self.players[current_player_id].coins += coins_to_gain
-                if building_info.on_renovation > 0:
-                    self.renovation("open", current_player_id, card_name)
-            case "stadium":
-                reverse_player_order = self.get_reverse_player_order(current_player_id)
-                for player_id in reverse_player_order:
-                    coins_to_take = 2
-                    coins_to_take *= building_info.working
-                    coins_to_take = min(coins_to_take, self.players[player_id].coins)
-                    self.players[player_id].coins -= coins_to_take
-                    self.players[current_player_id].coins += coins_to_take
-            case "tv_station":
-                target_player_id = kwargs["target_player_id"]
-                coins_to_take = 5
-                coins_to_take *= building_info.working
-                coins_to_take = min(coins_to_take, self.players[target_player_id].coins)
-                self.players[target_player_id].coins -= coins_to_take
-                self.players[current_player_id].coins += coins_to_take
-            case "business_center":
-                target_player_id = kwargs["target_player_id"]
-                target_player_building = kwargs["target_player_building"]
-                current_player_building = kwargs["current_player_building"]
-
-                b_info = self.players[target_player_id].establishments[
-                    target_player_building
-                ]
-                transferring_renovated = False
-                if b_info.working > 0:
-                    self.players[target_player_id].establishments[
-                        target_player_building
-                    ].working -= 1
-                elif b_info.on_renovation > 0:
-                    transferring_renovated = True
-                    self.players[target_player_id].establishments[
-                        target_player_building
-                    ].on_renovation -= 1
-
-                b_info = self.players[target_player_id].establishments[
-                    target_player_building
-                ]
-                if b_info.working == 0 and b_info.on_renovation == 0:
-                    self.players[target_player_id].establishments.pop(
-                        target_player_building
-                    )
+        self._earn_per_icon(
+            player_id, card_id, n_working, self._icons[player_id, COW], 3
+        )
 
-                if (
-                    target_player_building
-                    in self.players[current_player_id].establishments
-                ):
-                    if transferring_renovated:
-                        self.players[current_player_id].establishments[
-                            target_player_building
-                        ].on_renovation += 1
-                    else:
-                        self.players[current_player_id].establishments[
-                            target_player_building
-                        ].working += 1
-                else:
-                    if transferring_renovated:
-                        self.players[current_player_id].establishments[
-                            target_player_building
-                        ] = EstablishmentCount(working=0, on_renovation=1)
-                    else:
-                        self.players[current_player_id].establishments[
-                            target_player_building
-                        ] = EstablishmentCount(working=1, on_renovation=0)
-
-                b_info = self.players[current_player_id].establishments[
-                    current_player_building
-                ]
-                if b_info.on_renovation > 0:
-                    transferring_renovated = True
-                    self.players[current_player_id].establishments[
-                        current_player_building
-                    ].on_renovation -= 1
-                elif b_info.working > 0:
-                    transferring_renovated = False
-                    self.players[current_player_id].establishments[
-                        current_player_building
-                    ].working -= 1
-
-                b_info = self.players[current_player_id].establishments[
-                    current_player_building
-                ]
-                if b_info == EstablishmentCount(working=0, on_renovation=0):
-                    self.players[current_player_id].establishments.pop(
-                        current_player_building
-                    )
+    def _activate_furniture_factory(
+        self, player_id: int, card_id: int, n_working: int
+    ) -> None:
+        self._earn_per_icon(
+            player_id, card_id, n_working, self._icons[player_id, GEAR], 3
+        )
 
-                if (
-                    current_player_building
-                    in self.players[target_player_id].establishments
-                ):
-                    if transferring_renovated:
-                        self.players[target_player_id].establishments[
-                            current_player_building
-                        ].on_renovation += 1
-                    else:
-                        self.players[target_player_id].establishments[
-                            current_player_building
-                        ].working += 1
-                else:
-                    if transferring_renovated:
-                        self.players[target_player_id].establishments[
-                            current_player_building
-                        ] = EstablishmentCount(working=0, on_renovation=1)
-                    else:
-                        self.players[target_player_id].establishments[
-                            current_player_building
-                        ] = EstablishmentCount(working=1, on_renovation=0)
-            case "tuna_boat":
-                tuna_roll, _ = self.roll_dice(num_dice=2)
-                coins_to_gain = tuna_roll * building_info.working
-                self.players[current_player_id].coins += coins_to_gain
-                if building_info.on_renovation > 0:
-                    self.renovation("open", current_player_id, card_name)
-            case "flower_shop":
-                flower_gardens = self.players[current_player_id].establishments.get(
-                    "flower_garden",
-                    EstablishmentCount(working=0, on_renovation=0),
-                )
-                flower_gardens = flower_gardens.working + flower_gardens.on_renovation
-                coins_to_gain = flower_gardens * building_info.working
-                self.players[current_player_id].coins += coins_to_gain
-                if building_info.on_renovation > 0:
-                    self.renovation("open", current_player_id, card_name)
-            case "food_warehouse":
-                total_restaurants = 0
-                for b_name, b_info in self.players[
-                    current_player_id
-                ].establishments.items():
-                    if b_name in restaurants_tuple:
-                        total_restaurants += b_info.working + b_info.on_renovation
-                coins_to_gain = total_restaurants * 2
-                coins_to_gain *= building_info.working
-                self.players[current_player_id].coins += coins_to_gain
-                if building_info.on_renovation > 0:
-                    self.renovation("open", current_player_id, card_name)
-            case "sushi_bar":
-                target_player_id = kwargs["target_player_id"]
-                receiving_player_id = kwargs["receiving_player_id"]
-                coins_to_take = 3
-                if self.players[receiving_player_id].landmarks["shopping_mall"]:
-                    coins_to_take += 1
-                if not self.players[receiving_player_id].landmarks["harbor"]:
-                    coins_to_take = 0
-                coins_to_take *= (
-                    self.players[receiving_player_id]
-                    .establishments["sushi_bar"]
-                    .working
-                )
-                coins_to_take = min(coins_to_take, self.players[target_player_id].coins)
-                self.players[target_player_id].coins -= coins_to_take
-                self.players[receiving_player_id].coins += coins_to_take
-                if building_info.on_renovation > 0:
-                    self.renovation("open", receiving_player_id, card_name)
-            case "publisher":
-                reverse_player_order = self.get_reverse_player_order(current_player_id)
-                for target_player_id in reverse_player_order:
-                    coins_to_take = 0
-                    for b_name, b_info in self.players[
-                        target_player_id
-                    ].establishments.items():
-                        if (
-                            b_name in restaurants_tuple
-                            or secondary_industry_dict.get(b_name, "") == "bread"
-                        ):
-                            coins_to_take += b_info.working + b_info.on_renovation
-                    coins_to_take *= building_info.working
-                    coins_to_take = min(
-                        coins_to_take, self.players[target_player_id].coins
-                    )
-                    self.players[target_player_id].coins -= coins_to_take
-                    self.players[current_player_id].coins += coins_to_take
-            case "tax_office":
-                reverse_player_order = self.get_reverse_player_order(current_player_id)
-                for target_player_id in reverse_player_order:
-                    if self.players[target_player_id].coins >= 10:
-                        coins_to_take = math.floor(
-                            self.players[target_player_id].coins / 2
-                        )
-                        coins_to_take *= building_info.working
-                        self.players[target_player_id].coins -= coins_to_take
-                        self.players[current_player_id].coins += coins_to_take
-            case "corn_field":
-                coins_to_gain: int = 0  # noqa
-                if sum(self.players[current_player_id].landmarks.values()) < 2:
-                    coins_to_gain = 2
-                    coins_to_gain *= building_info.working
-                else:
-                    coins_to_gain = 0
-                self.players[current_player_id].coins += coins_to_gain
-                if building_info.on_renovation > 0:
-                    self.renovation("open", current_player_id, card_name)
-            case "general_store":
-                if sum(self.players[current_player_id].landmarks.values()) < 2:
-                    coins_to_gain = (
-                        3
-                        if self.players[current_player_id].landmarks["shopping_mall"]
-                        else 2
-                    )
-                    coins_to_gain *= building_info.working
-                else:
-                    coins_to_gain = 0
-                self.players[current_player_id].coins += coins_to_gain
-                if building_info.on_renovation > 0:
-                    self.renovation("open", current_player_id, card_name)
-            case "moving_company":
-                target_player_id = kwargs["target_player_id"]
-                current_player_building = kwargs["current_player_building"]
-
-                if (
-                    self.players[current_player_id]
-                    .establishments[current_player_building]
-                    .on_renovation
-                    > 0
-                ):
-                    self.players[current_player_id].establishments[
-                        current_player_building
-                    ].on_renovation -= 1
-                    is_renovated = True
-                else:
-                    self.players[current_player_id].establishments[
-                        current_player_building
-                    ].working -= 1
-                    is_renovated = False
-                if (
-                    current_player_building
-                    not in self.players[kwargs["target_player_id"]].establishments
-                ):
-                    if is_renovated:
-                        self.players[target_player_id].establishments[
-                            current_player_building
-                        ] = EstablishmentCount(on_renovation=1, working=0)
-                    else:
-                        self.players[target_player_id].establishments[
-                            current_player_building
-                        ] = EstablishmentCount(on_renovation=0, working=1)
-                else:
-                    if is_renovated:
-                        self.players[target_player_id].establishments[
-                            current_player_building
-                        ].on_renovation += 1
-                    else:
-                        self.players[target_player_id].establishments[
-                            current_player_building
-                        ].working += 1
-
-                coins_to_gain = 4
-                self.players[current_player_id].coins += coins_to_gain
-            case "winery":
-                coins_to_gain = 6
-                vineyards = self.players[current_player_id].establishments.get(
-                    "vineyard", EstablishmentCount(working=0, on_renovation=0)
-                )
-                vineyards = vineyards.working + vineyards.on_renovation
-                coins_to_gain *= vineyards
-                coins_to_gain *= building_info.working
-                self.players[current_player_id].coins += coins_to_gain
-                working, on_renovation = (
-                    building_info.working,
-                    building_info.on_renovation,
-                )
-                self.players[current_player_id].establishments["winery"] = (
-                    EstablishmentCount(
-                        working=on_renovation,
-                        on_renovation=working,
+    def _activate_flower_shop(
+        self, player_id: int, card_id: int, n_working: int
+    ) -> None:
+        n_flower_gardens = self._count_copies(player_id, FLOWER_GARDEN)
+        self._earn_per_icon(player_id, card_id, n_working, n_flower_gardens, 1)
+
+    def _activate_food_warehouse(
+        self, player_id: int, card_id: int, n_working: int
+    ) -> None:
+        self._earn_per_icon(
+            player_id, card_id, n_working, self._icons[player_id, RESTAURANT], 2
+        )
+
+    def _activate_general_store(
+        self, player_id: int, card_id: int, n_working: int
+    ) -> None:
+        if self.count_landmarks(player_id) >= 2:
+            return
+        coins_to_gain = 3 if self._owned[player_id, SHOPPING_MALL] else 2
+        coins_to_gain *= n_working
+        self._coins[player_id] += coins_to_gain
+        if self.events is not None:
+            self._emit_income(player_id, cards_tuple[card_id], coins_to_gain)
+
+    def _activate_winery(self, player_id: int, card_id: int, n_working: int) -> None:
+        n_vineyards = self._count_copies(player_id, VINEYARD)
+        self._earn_per_icon(player_id, card_id, n_working, n_vineyards, 6)
+        # the wineries that paid out close for renovation
+        self._working[player_id, card_id] -= n_working
+        self._on_renovation[player_id, card_id] += n_working
+        if self.events is not None:
+            self._emit_renovation(player_id, cards_tuple[card_id], "close", n_working)
+
+    def _activate_demolition_company(
+        self, player_id: int, card_id: int, n_working: int
+    ) -> None:
+        landmark_bits = self._landmark_bits
+        for _ in range(n_working):
+            bits = landmark_bits[player_id]
+            if not bits:
+                break
+            # the lowest set bit is the cheapest landmark built
+            cheapest = bits & -bits
+            landmark_to_close = LANDMARK_IDS_BY_COST[cheapest.bit_length() - 1]
+            landmark_bits[player_id] = bits ^ cheapest
+            self._n_landmarks[player_id] -= 1
+            self._owned[player_id, landmark_to_close] = 0
+            self._owned_bits[player_id] &= ~(1 << landmark_to_close)
+            self._market[landmark_to_close] += 1
+            self._on_sale_bits[0] |= 1 << landmark_to_close
+            self._coins[player_id] += 8
+            if self.events is not None:
+                self.events.emit(
+                    LandmarkDemolishedEvent(
+                        self.current_turn, player_id, cards_tuple[landmark_to_close]
                     )
                 )
-            case "demolition_company":
-                landmarks_with_costs = sorted(
-                    [
-                        (landmark, building_cost_dict[landmark])
-                        for landmark in landmarks_tuple
-                    ],
-                    key=lambda a: a[1],
-                )
-                landmarks_with_costs = [
-                    (landmark, cost)
-                    for landmark, cost in landmarks_with_costs
-                    if self.players[current_player_id].landmarks[landmark]
-                ]
-                for _ in range(building_info.working):
-                    if not len(landmarks_with_costs):
-                        break
-                    landmark_to_close = landmarks_with_costs[0][0]
-                    self.players[current_player_id].landmarks[landmark_to_close] = False
-                    self.market[landmark_to_close] += 1
-                    self.players[current_player_id].coins += 8
-                    landmarks_with_costs = landmarks_with_costs[1:]
-
-                if building_info.on_renovation > 0:
-                    self.renovation("open", current_player_id, card_name)
-            case "soda_bottling_plant":
-                total_restaurants_from_players = 0
-                for player_info in self.players.values():
-                    for b_name, b_info in player_info.establishments.items():
-                        if b_name in restaurants_tuple:
-                            total_restaurants_from_players += (
-                                b_info.working + b_info.on_renovation
-                            )
-                coins_to_gain = 1 * total_restaurants_from_players
-                self.players[current_player_id].coins += coins_to_gain
-                if building_info.on_renovation > 0:
-                    self.renovation("open", current_player_id, card_name)
-            case "french_restaurant":
-                target_player_id = kwargs["target_player_id"]
-                receiving_player_id = kwargs["receiving_player_id"]
-                has_shopping_mall = self.players[receiving_player_id].landmarks[
-                    "shopping_mall"
-                ]
-                is_eligible = (
-                    sum(self.players[target_player_id].landmarks.values()) >= 2
-                )
-                for _ in range(building_info.working):
-                    if not is_eligible:
-                        break
-                    coins_to_take = 5
-                    if has_shopping_mall:
-                        coins_to_take += 1
-                    coins_to_take = min(
-                        coins_to_take, self.players[target_player_id].coins
-                    )
-                    self.players[target_player_id].coins -= coins_to_take
-                    self.players[receiving_player_id].coins += coins_to_take
-                if building_info.on_renovation > 0:
-                    self.renovation("open", receiving_player_id, card_name)
-            case "park":
-                player_coins = sum(
-                    self.players[player_id].coins for player_id in self.players
+                self._emit_income(player_id, cards_tuple[card_id], 8)
+
+    def _activate_soda_bottling_plant(
+        self, player_id: int, card_id: int, n_working: int
+    ) -> None:
+        coins_to_gain = sum(
+            self._icons[other_player_id, RESTAURANT]
+            for other_player_id in range(self.n_players)
+        )
+        self._coins[player_id] += coins_to_gain
+        if self.events is not None:
+            self._emit_income(player_id, cards_tuple[card_id], coins_to_gain)
+
+    def _activate_tuna_boat(self, player_id: int, card_id: int, n_working: int) -> None:
+        tuna_roll, _ = self.roll_dice(num_dice=2)
+        coins_to_gain = tuna_roll * n_working
+        self._coins[player_id] += coins_to_gain
+        if self.events is not None:
+            self._emit_income(player_id, cards_tuple[card_id], coins_to_gain)
+
+    def _activate_corn_field(self, player_id: int, card_id: int, n_working: int) -> None:
+        if self.count_landmarks(player_id) >= 2:
+            return
+        coins_to_gain = 2 * n_working
+        self._coins[player_id] += coins_to_gain
+        if self.events is not None:
+            self._emit_income(player_id, cards_tuple[card_id], coins_to_gain)
+
+    def _activate_stadium(self, player_id: int, card_id: int, n_working: int) -> None:
+        for target_player_id in self.get_reverse_player_order(player_id):
+            self._take(target_player_id, player_id, card_id, 2)
+
+    def _activate_tv_station(self, player_id: int, card_id: int, n_working: int) -> None:
+        target_player_id = self._choose_target(player_id, "tv_station")
+        self._take(target_player_id, player_id, card_id, 5)
+
+    def _activate_publisher(self, player_id: int, card_id: int, n_working: int) -> None:
+        for target_player_id in self.get_reverse_player_order(player_id):
+            coins_to_take = (
+                self._icons[target_player_id, BREAD]
+                + self._icons[target_player_id, RESTAURANT]
+            )
+            self._take(target_player_id, player_id, card_id, coins_to_take)
+
+    def _activate_tax_office(self, player_id: int, card_id: int, n_working: int) -> None:
+        coins = self._coins
+        for target_player_id in self.get_reverse_player_order(player_id):
+            if coins[target_player_id] >= 10:
+                self._take(target_player_id, player_id, card_id, coins[target_player_id] // 2)
+
+    def _activate_park(self, player_id: int, card_id: int, n_working: int) -> None:
+        coins = self._coins
+        player_coins = sum(coins[other_id] for other_id in range(self.n_players))
+        new_player_coins = math.ceil(player_coins / self.n_players)
+        for other_id in range(self.n_players):
+            if self.events is not None:
+                self._emit_income(
+                    other_id, cards_tuple[card_id], new_player_coins - coins[other_id]
                 )
-                new_player_coins = math.ceil(player_coins / self.n_players)
-                for player_id in self.players:
-                    self.players[player_id].coins = new_player_coins
-            case "renovation_company":
-                building_to_close = kwargs["target_building_name"]
-                for player_id in self.players:
-                    if building_to_close in self.players[player_id].establishments:
-                        close_count = (
-                            self.players[player_id]
-                            .establishments[building_to_close]
-                            .working
-                        )
-                        self.players[player_id].establishments[
-                            building_to_close
-                        ].working -= close_count
-                        self.players[player_id].establishments[
-                            building_to_close
-                        ].on_renovation += close_count
-            case "tech_startup":
-                reverse_player_order = self.get_reverse_player_order(current_player_id)
-                for _ in range(building_info.working):
-                    for player_id in reverse_player_order:
-                        coins_to_take = self.tech_startups[current_player_id]
-                        coins_to_take = min(
-                            coins_to_take, self.players[player_id].coins
-                        )
-                        self.players[player_id].coins -= coins_to_take
-                        self.players[current_player_id].coins += coins_to_take
-            case _:
-                pass
+            coins[other_id] = new_player_coins
+
+    def _activate_renovation_company(
+        self, player_id: int, card_id: int, n_working: int
+    ) -> None:
+        working = self._working
+        on_renovation = self._on_renovation
+        choose_from = [
+            cards_tuple[establishment_id]
+            for establishment_id in range(N_ESTABLISHMENTS)
+            if any(
+                working[other_id, establishment_id] > 0
+                or on_renovation[other_id, establishment_id] > 0
+                for other_id in range(self.n_players)
+            )
+        ]
+        if not choose_from:
+            return
+        building_to_close = self._decide(
+            RENOVATE_BUILDING, player_id, choose_from, "renovation_company"
+        )
+        building_id = card_id_dict[building_to_close]
+        for other_id in range(self.n_players):
+            if working[other_id, building_id]:
+                self.renovation("close", other_id, building_to_close)
+
+    def _activate_tech_startup(
+        self, player_id: int, card_id: int, n_working: int
+    ) -> None:
+        for target_player_id in self.get_reverse_player_order(player_id):
+            self._take(
+                target_player_id, player_id, card_id, self._tech_startups[player_id]
+            )
+
+    def _activate_business_center(
+        self, player_id: int, card_id: int, n_working: int
+    ) -> None:
+        target_player_id = self._choose_target(player_id, "business_center")
+        choose_from = self.get_held_buildings(target_player_id)
+        current_player_buildings = self.get_held_buildings(player_id)
+        if not choose_from or not current_player_buildings:
+            return
+        target_player_building = card_id_dict[
+            self._decide(TAKE_BUILDING, player_id, choose_from, "business_center")
+        ]
+        current_player_building = card_id_dict[
+            self._decide(
+                GIVE_BUILDING, player_id, current_player_buildings, "business_center"
+            )
+        ]
+
+        # the target gives away a working copy if it has one
+        transferring_renovated = (
+            self._working[target_player_id, target_player_building] == 0
+        )
+        self._move_building(
+            target_player_id,
+            player_id,
+            target_player_building,
+            transferring_renovated,
+        )
+
+        # the current player gives away a renovated copy if it has one
+        transferring_renovated = (
+            self._on_renovation[player_id, current_player_building] > 0
+        )
+        self._move_building(
+            player_id,
+            target_player_id,
+            current_player_building,
+            transferring_renovated,
+        )
 
     def renovation(self, direction: str, player_id: int, card_name: str) -> None:
+        card_id = card_id_dict[card_name]
         if direction == "open":
-            to_open = self.players[player_id].establishments[card_name].on_renovation
-            self.players[player_id].establishments[card_name].on_renovation = 0
-            self.players[player_id].establishments[card_name].working += to_open
+            to_open = self._on_renovation[player_id, card_id]
+            self._on_renovation[player_id, card_id] = 0
+            self._working[player_id, card_id] += to_open
+            if self.events is not None:
+                self._emit_renovation(player_id, card_name, direction, to_open)
         elif direction == "close":
-            to_close = self.players[player_id].establishments[card_name].working
-            self.players[player_id].establishments[card_name].working = 0
-            self.players[player_id].establishments[card_name].on_renovation += to_close
-
-    def clean_empty_cards(self) -> None:
-        for player_id in self.players:
-            to_pop = []
-            for building_name, building_info in self.players[
-                player_id
-            ].establishments.items():
-                if building_info == EstablishmentCount(working=0, on_renovation=0):
-                    to_pop.append(building_name)
-            for building_name in to_pop:
-                self.players[player_id].establishments.pop(building_name)
-
-    def take_turn(self) -> None:
-        """Simulate one turn for the current player."""
+            to_close = self._working[player_id, card_id]
+            self._working[player_id, card_id] = 0
+            self._on_renovation[player_id, card_id] += to_close
+            if self.events is not None:
+                self._emit_renovation(player_id, card_name, direction, to_close)
+
+    def take_turn(self) -> Optional[str]:
+        """Simulate one turn for the current player, asking the seats' policies.
+
+        Returns the card the player bought, or None if they bought nothing.
+        """
+        turn = self.play_turn()
+        try:
+            decision = next(turn)
+            while True:
+                decision = turn.send(self._choose(decision))
+        except StopIteration as stop:
+            return stop.value
+
+    def play_turn(self) -> Generator[Decision, Any, Optional[str]]:
+        """Simulate one turn, yielding the turn's decisions instead of asking.
+
+        Each yielded ``Decision`` expects one of its options to be sent back.
+        Decisions taken while cards activate are still asked of the seats'
+        policies. The generator returns what ``take_turn`` returns.
+        """
         current_player_id = self.current_player
-        is_double = False
         self.current_turn += 1
-        print(f"START OF TURN {self.current_turn}")
-        for player_id in self.players:
-            print(f"\t{player_id=}, coins: {self.players[player_id].coins}")
-        if not self.players[current_player_id].is_first_turn:
-            # Step 1: Roll Dice
-            num_dice = (
-                1
-                if not self.players[current_player_id].landmarks["train_station"]
-                else random.choice([1, 2])
-            )
-            roll, is_double = self.roll_dice(num_dice)
-            print(
-                f"Player {current_player_id} rolled {roll} {'(which is double)' if is_double else ''}."
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.start()
+        if self._is_first_turn[current_player_id]:
+            return (yield from self._after_activation(current_player_id, False))
+        # Step 1: Roll Dice
+        roll, is_double = yield from self._roll(current_player_id, False)
+        if profiler is not None:
+            profiler.lap("roll")
+
+        # Step 2: player can choose to reroll if they have radio tower
+        if self._owned[current_player_id, RADIO_TOWER]:
+            decision = Decision(
+                REROLL,
+                current_player_id,
+                (False, True),
+                self.view,
+                roll=roll,
+                is_double=is_double,
             )
+            do_reroll = yield decision
+            if self.recorder is not None:
+                self.recorder.record(decision, do_reroll)
+            if do_reroll:
+                roll, is_double = yield from self._roll(current_player_id, True)
+            if profiler is not None:
+                profiler.lap("reroll")
 
-            # Step 2: player can choose to reroll if they have radio tower
-            if self.players[current_player_id].landmarks["radio_tower"]:
-                do_reroll = bool(random.random() < 0.5)
-                if do_reroll:
-                    print(f"Player {current_player_id} chose to reroll")
-                    num_dice = (
-                        1
-                        if not self.players[current_player_id].landmarks[
-                            "train_station"
-                        ]
-                        else random.choice([1, 2])
-                    )
-                    roll, is_double = self.roll_dice(num_dice)
-                    print(
-                        f"Player {current_player_id} rolled {roll} {'(which is double)' if is_double else ''}."
-                    )
+        # Step 3: Activate Cards
+        self.activate_cards(current_player_id, roll)
+        return (yield from self._after_activation(current_player_id, is_double))
 
-            # Step 3: Activate Cards
+    def resume_turn(
+        self, decision: Decision, choice: Any
+    ) -> Generator[Decision, Any, Optional[str]]:
+        """Like ``play_turn``, but starting with ``decision`` answered by ``choice``.
+
+        Meant for games forked (``clone``, ``restore``) while the turn that
+        asked ``decision`` was waiting for it: the turn itself is not copied,
+        this plays the rest of it. Works for reroll and purchase decisions.
+        """
+        current_player_id = decision.player_id
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.start()
+        if decision.kind == REROLL:
+            roll, is_double = decision.roll, decision.is_double
+            if choice:
+                roll, is_double = yield from self._roll(current_player_id, True)
+            if profiler is not None:
+                profiler.lap("reroll")
             self.activate_cards(current_player_id, roll)
-            # technical step: clean empty cards
-            self.clean_empty_cards()
-        self.players[current_player_id].is_first_turn = False
+            return (yield from self._after_activation(current_player_id, is_double))
+        if decision.kind == PURCHASE:
+            return (
+                yield from self._after_purchase(
+                    current_player_id, decision.is_double, choice
+                )
+            )
+        raise ValueError(f"cannot resume a turn from a {decision.kind} decision")
+
+    def _roll(
+        self, current_player_id: int, is_reroll: bool
+    ) -> Generator[Decision, Any, Tuple[int, bool]]:
+        num_dice = 1
+        if self._owned[current_player_id, TRAIN_STATION]:
+            decision = Decision(NUM_DICE, current_player_id, (1, 2), self.view)
+            num_dice = yield decision
+            if self.recorder is not None:
+                self.recorder.record(decision, num_dice)
+        roll, is_double = self.roll_dice(num_dice)
+        if self.events is not None:
+            self.events.emit(
+                RollEvent(
+                    self.current_turn,
+                    current_player_id,
+                    num_dice,
+                    roll,
+                    is_double,
+                    is_reroll,
+                )
+            )
+        return roll, is_double
+
+    def _after_activation(
+        self, current_player_id: int, is_double: bool
+    ) -> Generator[Decision, Any, Optional[str]]:
+        coins = self._coins
+        profiler = self.profiler
+        self._is_first_turn[current_player_id] = 0
 
         # Step 4: Сity hall gives a coin if active player does not have any
-        self.players[current_player_id].coins = (
-            1
-            if self.players[current_player_id].coins == 0
-            else self.players[current_player_id].coins
-        )
+        if coins[current_player_id] == 0:
+            coins[current_player_id] = 1
+            if self.events is not None:
+                self._emit_income(current_player_id, None, 1)
+        if profiler is not None:
+            profiler.lap("city_hall")
 
-        # Step 5: Buy a card (randomly for now)
-        possible_purchases = [
-            card
-            for card, count in self.market.items()
-            if building_cost_dict[card] <= self.players[current_player_id].coins
-            and count > 0
-            and not self.players[current_player_id].major_establishments.get(
-                card, False
-            )
-            and not self.players[current_player_id].landmarks.get(card, False)
-        ]
-        print(f"{possible_purchases=}")
-        has_built = False
+        # Step 5: Buy a card, or nothing
+        purchase = None
+        possible_purchases = self.get_possible_purchases(current_player_id)
+        if profiler is not None:
+            profiler.lap("purchase_options")
         if possible_purchases:
-            purchase = random.choice(possible_purchases)
-            self.market[purchase] -= 1
-            self.players[current_player_id].coins -= building_cost_dict[purchase]
-            if purchase in landmarks_tuple:
-                self.players[current_player_id].landmarks[purchase] = True
-            elif purchase in major_establishments_tuple:
-                self.players[current_player_id].major_establishments[purchase] = True
+            possible_purchases.append(None)
+            decision = Decision(
+                PURCHASE,
+                current_player_id,
+                tuple(possible_purchases),
+                self.view,
+                is_double=is_double,
+            )
+            purchase = yield decision
+            if self.recorder is not None:
+                self.recorder.record(decision, purchase)
+        return (yield from self._after_purchase(current_player_id, is_double, purchase))
+
+    def _after_purchase(
+        self, current_player_id: int, is_double: bool, purchase: Optional[str]
+    ) -> Generator[Decision, Any, Optional[str]]:
+        coins = self._coins
+        owned = self._owned
+        market = self._market
+        profiler = self.profiler
+        if purchase is not None:
+            card_id = card_id_dict[purchase]
+            if not self.purchase_bits(current_player_id) >> card_id & 1:
+                raise ValueError(f"player {current_player_id} cannot buy {purchase}")
+            market[card_id] -= 1
+            if not market[card_id]:
+                self._on_sale_bits[0] &= ~(1 << card_id)
+            coins[current_player_id] -= CARD_COSTS[card_id]
+            if card_id < N_ESTABLISHMENTS:
+                self._working[current_player_id, card_id] += 1
+                if ICON_IDS[card_id] >= 0:
+                    self._icons[current_player_id, ICON_IDS[card_id]] += 1
             else:
-                if purchase not in self.players[current_player_id].establishments:
-                    self.players[current_player_id].establishments[purchase] = (
-                        EstablishmentCount(
-                            working=1,
-                            on_renovation=0,
+                owned[current_player_id, card_id] = 1
+                self._owned_bits[current_player_id] |= 1 << card_id
+                if LANDMARK_BITS[card_id]:
+                    self._landmark_bits[current_player_id] |= LANDMARK_BITS[card_id]
+                    self._n_landmarks[current_player_id] += 1
+            if self.events is not None:
+                self.events.emit(
+                    PurchaseEvent(
+                        self.current_turn,
+                        current_player_id,
+                        purchase,
+                        CARD_COSTS[card_id],
+                    )
+                )
+                if card_id in LANDMARK_IDS:
+                    self.events.emit(
+                        LandmarkBuiltEvent(
+                            self.current_turn, current_player_id, purchase
                         )
                     )
-                else:
-                    self.players[current_player_id].establishments[
-                        purchase
-                    ].working += 1
-            has_built = True
-            print(f"Player {current_player_id} bought {purchase}.")
+
+        if profiler is not None:
+            profiler.lap("purchase")
 
         # Step 6: player can choose to put one of their coins on the tech startup
-        if "tech_startup" in self.players[current_player_id].major_establishments:
-            is_put_a_coin = int(random.random() < 0.5)
-            is_put_a_coin = min(is_put_a_coin, self.players[current_player_id].coins)
-            self.players[current_player_id].coins -= is_put_a_coin
-            self.tech_startups[current_player_id] += is_put_a_coin
+        if owned[current_player_id, TECH_STARTUP] and coins[current_player_id] > 0:
+            decision = Decision(
+                TECH_STARTUP_COIN, current_player_id, (False, True), self.view
+            )
+            is_put_a_coin = yield decision
+            if self.recorder is not None:
+                self.recorder.record(decision, is_put_a_coin)
+            if is_put_a_coin:
+                coins[current_player_id] -= 1
+                self._tech_startups[current_player_id] += 1
+        if profiler is not None:
+            profiler.lap("tech_startup")
 
         # Step 7: airport trigger
-        if not has_built and self.players[current_player_id].landmarks["airport"]:
-            self.players[current_player_id].coins += 10
+        if purchase is None and owned[current_player_id, AIRPORT]:
+            coins[current_player_id] += 10
+            if self.events is not None:
+                self._emit_income(current_player_id, "airport", 10)
+        if profiler is not None:
+            profiler.lap("airport")
 
-        for player_id in self.players:
-            print(
-                f"\t{player_id=}, coins: {self.players[player_id].coins}, landmarks: {self.players[player_id].landmarks}"
-            )
-        if is_double and self.players[current_player_id].landmarks["amusement_park"]:
+        if is_double and owned[current_player_id, AMUSEMENT_PARK]:
             # no reason not to take a second turn
             pass
         else:
             self.current_player = (self.current_player + 1) % self.n_players
+        if self.recorder is not None:
+            self.recorder.end_turn()
+        if profiler is not None:
+            profiler.lap("end_turn")
+        return purchase
+
+    def _play_to_purchase(self, choice: Any) -> Optional[Decision]:
+        """Play the turn of ``start_turn`` with the seats' policies up to its
+        purchase decision; None once the turn is over."""
+        turn = self._turn
+        try:
+            decision = turn.send(choice)
+            while decision.kind != PURCHASE:
+                decision = turn.send(self._choose(decision))
+        except StopIteration:
+            self._turn = None
+            decision = None
+        self._purchase_decision = decision
+        return decision
+
+    def start_turn(self) -> Optional[Decision]:
+        """Play the current player's turn up to the purchase (step 5).
+
+        Returns the purchase decision, to be answered with ``finish_turn``, or
+        None when the player can afford nothing and the turn is already over.
+        """
+        if self._turn is not None:
+            raise RuntimeError("the previous turn is waiting for finish_turn")
+        self._turn = self.play_turn()
+        return self._play_to_purchase(None)
+
+    def purchase_bits(self, player_id: int) -> int:
+        """Bit ``card_id`` set for each card the player can buy now."""
+        coins = self._coins[player_id]
+        return (
+            self._on_sale_bits[0]
+            & ~self._owned_bits[player_id]
+            & AFFORDABLE_BITS[coins if coins < MAX_COST else MAX_COST]
+        )
+
+    def get_possible_purchases(self, player_id: int) -> List[str]:
+        """Cards the player can afford, that are on sale and that they lack."""
+        bits = self.purchase_bits(player_id)
+        possible_purchases = []
+        while bits:
+            lowest = bits & -bits
+            possible_purchases.append(cards_tuple[lowest.bit_length() - 1])
+            bits ^= lowest
+        return possible_purchases
+
+    def purchase_mask(
+        self, player_id: int, out: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """``purchase_bits`` as a bool array of ``N_CARDS`` for action masking."""
+        bits = np.bitwise_and(self.purchase_bits(player_id), CARD_BITS)
+        return np.not_equal(bits, 0, out=out)
+
+    def finish_turn(self, purchase: Optional[str]) -> None:
+        """Buy ``purchase`` (None to pass) and play the rest of the turn
+        started by ``start_turn``.
+        """
+        decision = self._purchase_decision
+        if decision is None:
+            raise RuntimeError("no turn is waiting for a purchase")
+        if purchase not in decision.options:
+            raise ValueError(f"player {decision.player_id} cannot buy {purchase}")
+        self._play_to_purchase(purchase)
 
     def is_game_over(self):
         """Check if a player has won."""
-        for player_id in self.players:
-            if all(
-                self.players[player_id].landmarks.values()
-            ):  # All landmarks completed
+        landmark_bits = self._landmark_bits
+        for player_id in range(self.n_players):
+            if landmark_bits[player_id] == ALL_LANDMARK_BITS:  # All landmarks completed
                 return True, player_id
         return False, -1
 
@@ -887,7 +1159,82 @@ class MachiKoroGame:
         is_game_over, winning_player_id = self.is_game_over()
         while not is_game_over:
             self.take_turn()
-            print(f"--- End of turn {self.current_turn} ---")
             is_game_over, winning_player_id = self.is_game_over()
-        print("Game over!")
-        print(f"Player {winning_player_id} wins!")
+        if self.events is not None:
+            self.events.emit(GameOverEvent(self.current_turn, winning_player_id))
+
+
+def _card_handler(card_id: int) -> Callable[..., None]:
+    handler = getattr(MachiKoroGame, f"_activate_{cards_tuple[card_id]}", None)
+    if handler is not None:
+        return handler
+    if not isinstance(CARD_VALUES[card_id], int):
+        raise ValueError(f"{cards_tuple[card_id]} needs an _activate_ handler")
+    if card_id in RESTAURANT_IDS:
+        return MachiKoroGame._take_flat
+    return MachiKoroGame._earn_flat
+
+
+# CARD_HANDLERS[card_id] resolves one activation of an establishment or a
+# major establishment, see MachiKoroGame.activate_cards.
+CARD_HANDLERS: Tuple[Callable[..., None], ...] = tuple(
+    _card_handler(card_id) for card_id in range(N_ESTABLISHMENTS + len(MAJOR_IDS))
+)
+
+
+def play_games_batched(
+    games: Sequence[MachiKoroGame],
+    policy: BatchPolicy,
+    max_turns: Optional[int] = None,
+) -> List[int]:
+    """Play ``games`` to the end, answering their decisions in batches.
+
+    Every round each unfinished game is played up to its next turn
+    decision, and those decisions are answered by one
+    ``policy.choose_batch`` call, so a model can score all of them in one
+    pass. The rarer decisions taken while cards activate are asked as
+    batches of one: every seat of every game is given to ``policy``.
+
+    Returns the winners, -1 for games stopped by ``max_turns``.
+    """
+    seat = BatchAsPolicy(policy)
+    for game in games:
+        game.policies = [seat] * game.n_players
+    winners = [-1] * len(games)
+    turns: Dict[int, Generator[Decision, Any, Optional[str]]] = {}
+    pending: Dict[int, Decision] = {}
+
+    def advance(index: int, choice: Any) -> None:
+        game = games[index]
+        turn = turns.get(index)
+        while True:
+            if turn is None:
+                is_game_over, winner = game.is_game_over()
+                if is_game_over or (
+                    max_turns is not None and game.current_turn >= max_turns
+                ):
+                    winners[index] = winner
+                    pending.pop(index, None)
+                    turns.pop(index, None)
+                    return
+                turn = turns[index] = game.play_turn()
+                choice = None
+            try:
+                pending[index] = turn.send(choice)
+                return
+            except StopIteration:
+                turn = None
+
+    for index in range(len(games)):
+        advance(index, None)
+    while pending:
+        indices = list(pending)
+        decisions = [pending[index] for index in indices]
+        choices = policy.choose_batch(decisions)
+        for index, decision, choice in zip(indices, decisions, choices):
+            if choice not in decision.options:
+                raise ValueError(
+                    f"{choice!r} is not one of the {decision.kind} options {decision.options}"
+                )
+            advance(index, choice)
+    return winners
@@ -0,0 +1,388 @@
+"""Exact distribution of the coins every player gains or loses in one turn.
+
+``income_distribution`` resolves a turn's card activations for every roll
+of the dice at once with array operations instead of sampling them. It does
+this for each candidate purchase of a player and for each player whose turn
+it could be. For every dice outcome it returns each player's coin delta
+and the probability of that outcome.
+Heuristic players and expectimax search can read expected income from it
+many times per decision; a Monte Carlo estimate would be slower and noisy.
+
+The activations follow ``MachiKoroGame.activate_cards`` and its card
+handlers, up to the city hall coin (step 4) and before the purchase. The
+decisions cards ask for are resolved the way ``RandomPolicy`` takes the
+ones that move coins: the tv station robs the richest opponent. The
+buildings the moving company gives away are assumed not to change who is
+paid later in the same turn.
+"""
+
+from functools import lru_cache
+from typing import Dict, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from constants import card_id_dict
+from game import (
+    BREAD_IDS,
+    BUSINESS_CENTER,
+    CARD_COSTS,
+    CARD_ROLLS,
+    CARD_VALUES,
+    FLOWER_GARDEN,
+    GREEN_ACTIVATION_ORDER,
+    HARBOR,
+    LOAN_OFFICE,
+    MOVING_COMPANY,
+    PRIMARY_IDS,
+    PURPLE_ACTIVATION_ORDER,
+    RADIO_TOWER,
+    RESTAURANT_IDS,
+    SHOPPING_MALL,
+    TECH_STARTUP,
+    TRAIN_STATION,
+    VINEYARD,
+    WINERY,
+)
+from policy import GameView
+from state import (
+    BREAD,
+    COW,
+    GEAR,
+    ICON_IDS,
+    LANDMARK_BITS,
+    N_ESTABLISHMENTS,
+    RESTAURANT,
+    WHEAT,
+    GameState,
+)
+
+MAX_DICE_ROLL = 12
+# Probability of each roll 0..MAX_DICE_ROLL with one and with two dice
+ONE_DIE = np.array([0.0] + [1 / 6] * 6 + [0.0] * 6)
+TWO_DICE = np.array([0.0, 0.0] + [(6 - abs(roll - 7)) / 36 for roll in range(2, 13)])
+
+# The outcomes a turn is resolved for. Roll 0 is a first turn, which rolls
+# nothing. Roll 12 is split by the 2d6 a tuna boat rolls for its owners;
+# with several owners the engine rolls for each, here they share one roll.
+OUTCOME_ROLLS = np.array(list(range(MAX_DICE_ROLL)) + [MAX_DICE_ROLL] * 11)
+OUTCOME_TUNA_ROLLS = np.array([0] * MAX_DICE_ROLL + list(range(2, 13)))
+N_OUTCOMES = len(OUTCOME_ROLLS)
+# probability of an outcome given its roll
+_TUNA_WEIGHTS = np.where(OUTCOME_TUNA_ROLLS > 0, TWO_DICE[OUTCOME_TUNA_ROLLS], 1.0)
+# _ROLL_OUTCOMES[outcome, roll] is 1 where the outcome has that roll
+_ROLL_OUTCOMES = (OUTCOME_ROLLS[:, None] == np.arange(MAX_DICE_ROLL + 1)).astype(float)
+# _FIRES[card_id] is 1 for the outcomes the card activates on
+_FIRES = tuple(
+    np.isin(OUTCOME_ROLLS, rolls).astype(np.int64) for rolls in CARD_ROLLS
+)
+
+TUNA_BOAT = card_id_dict["tuna_boat"]
+CORN_FIELD = card_id_dict["corn_field"]
+SUSHI_BAR = card_id_dict["sushi_bar"]
+FRENCH_RESTAURANT = card_id_dict["french_restaurant"]
+MEMBERS_ONLY_CLUB = card_id_dict["members_only_club"]
+FRUIT_AND_VEGETABLE_MARKET = card_id_dict["fruit_and_vegetable_market"]
+CHEESE_FACTORY = card_id_dict["cheese_factory"]
+FURNITURE_FACTORY = card_id_dict["furniture_factory"]
+FLOWER_SHOP = card_id_dict["flower_shop"]
+FOOD_WAREHOUSE = card_id_dict["food_warehouse"]
+GENERAL_STORE = card_id_dict["general_store"]
+DEMOLITION_COMPANY = card_id_dict["demolition_company"]
+SODA_BOTTLING_PLANT = card_id_dict["soda_bottling_plant"]
+STADIUM = card_id_dict["stadium"]
+TV_STATION = card_id_dict["tv_station"]
+PUBLISHER = card_id_dict["publisher"]
+TAX_OFFICE = card_id_dict["tax_office"]
+PARK = card_id_dict["park"]
+
+
+def _fires(card_ids: Sequence[int]) -> np.ndarray:
+    return np.array([_FIRES[card_id] for card_id in card_ids])
+
+
+def _flat_values(card_ids: Sequence[int]) -> np.ndarray:
+    values = [CARD_VALUES[card_id] for card_id in card_ids]
+    return np.array([value if isinstance(value, int) else 0 for value in values])
+
+
+def _columns(card_ids: Sequence[int]) -> Dict[int, int]:
+    return {card_id: column for column, card_id in enumerate(card_ids)}
+
+
+# Coins per working copy and the firing outcomes of each colour's cards, in
+# activation order. The cards left at 0 are worked out per state by _resolve.
+_RED_VALUES = _flat_values(RESTAURANT_IDS)
+_RED_FIRES = _fires(RESTAURANT_IDS)
+_SUSHI_BAR_COLUMN = RESTAURANT_IDS.index(SUSHI_BAR)
+_FRENCH_RESTAURANT_COLUMN = RESTAURANT_IDS.index(FRENCH_RESTAURANT)
+_MEMBERS_ONLY_CLUB_COLUMN = RESTAURANT_IDS.index(MEMBERS_ONLY_CLUB)
+
+_GREEN_COLUMNS = _columns(GREEN_ACTIVATION_ORDER)
+_GREEN_VALUES = _flat_values(GREEN_ACTIVATION_ORDER)
+_GREEN_VALUES[_GREEN_COLUMNS[LOAN_OFFICE]] = 0
+_GREEN_VALUES[_GREEN_COLUMNS[MOVING_COMPANY]] = 4
+_GREEN_FIRES = _fires(GREEN_ACTIVATION_ORDER)
+_BREAD_COLUMNS = [_GREEN_COLUMNS[card_id] for card_id in sorted(BREAD_IDS)]
+_DEMOLITION_COMPANY_COLUMN = _GREEN_COLUMNS[DEMOLITION_COMPANY]
+
+_BLUE_VALUES = _flat_values(PRIMARY_IDS)
+_BLUE_FIRES = _fires(PRIMARY_IDS)
+_CORN_FIELD_COLUMN = PRIMARY_IDS.index(CORN_FIELD)
+_TUNA_BOAT_COLUMN = PRIMARY_IDS.index(TUNA_BOAT)
+
+
+class IncomeDistribution(NamedTuple):
+    """Coin deltas of one turn, per candidate purchase, roller and outcome.
+
+    Axes are candidate purchase (in the order ``purchases`` were given),
+    the player whose turn it is, the outcome (``OUTCOME_ROLLS`` and
+    ``OUTCOME_TUNA_ROLLS``) and, for ``deltas``, the player whose coins
+    change. ``probabilities`` are those of the dice choices that maximise
+    the roller's own expected delta: ``num_dice`` is the number of dice it
+    rolls and ``rerolls[..., roll]`` whether it uses its radio tower on a
+    roll.
+    """
+
+    purchases: Tuple[Optional[str], ...]
+    deltas: np.ndarray
+    probabilities: np.ndarray
+    num_dice: np.ndarray
+    rerolls: np.ndarray
+
+    def expected(self) -> np.ndarray:
+        """Expected deltas, shape ``(n_purchases, n_players, n_players)``."""
+        return np.einsum("bco,bcop->bcp", self.probabilities, self.deltas)
+
+
+@lru_cache(maxsize=None)
+def _seat_players(n_players: int) -> np.ndarray:
+    """``[roller, seat]`` -> player id; seat 0 is the roller, then clockwise."""
+    seats = np.arange(n_players)
+    return (seats[:, None] + seats[None, :]) % n_players
+
+
+@lru_cache(maxsize=None)
+def _player_seats(n_players: int) -> np.ndarray:
+    """``[roller, player id]`` -> seat, the inverse of ``_seat_players``."""
+    seats = np.arange(n_players)
+    return (seats[None, :] - seats[:, None]) % n_players
+
+
+def _take(coins: np.ndarray, payer: int, receiver: int, amount: np.ndarray) -> None:
+    taken = np.minimum(amount, coins[..., payer])
+    coins[..., payer] -= taken
+    coins[..., receiver] += taken
+
+
+def _resolve(
+    coins: np.ndarray,
+    working: np.ndarray,
+    copies: np.ndarray,
+    owned: np.ndarray,
+    icons: np.ndarray,
+    n_landmarks: np.ndarray,
+    tech_startups: np.ndarray,
+) -> np.ndarray:
+    """Coins after activation for every outcome, shape ``(B, C, N_OUTCOMES, P)``.
+
+    The arguments are indexed ``[candidate, roller, seat, ...]``, with seat 0
+    the roller and the other seats clockwise from it. Coins taken one after
+    the other by the same player from the same player add up to a single
+    take, and the green and blue incomes are sums once the loan office is
+    paid, so each colour is one product with its cards' ``_FIRES``.
+    """
+    n_players = coins.shape[-1]
+    coins = np.repeat(coins[:, :, None, :], N_OUTCOMES, axis=2)
+    mall = owned[..., SHOPPING_MALL]
+
+    # red goes first, the roller's right-hand neighbour (the last seat) first
+    n_working = working[..., RESTAURANT_IDS]
+    if n_working.any():
+        value = np.repeat(_RED_VALUES[None, None, None], n_players, axis=2)
+        value = np.broadcast_to(value, n_working.shape).copy()
+        value[..., _SUSHI_BAR_COLUMN] = 3 * owned[..., HARBOR]
+        value[..., _FRENCH_RESTAURANT_COLUMN] = 5 * (n_landmarks[:, :, :1] >= 2)
+        value += mall[..., None] * (value > 0)
+        amounts = (value * n_working) @ _RED_FIRES
+        # the members only club takes everything there is
+        clubs = n_working[..., _MEMBERS_ONLY_CLUB_COLUMN, None] * _FIRES[MEMBERS_ONLY_CLUB]
+        for seat in range(n_players - 1, 0, -1):
+            amount = amounts[:, :, seat] + (clubs[:, :, seat] > 0) * coins[..., 0]
+            _take(coins, 0, seat, amount)
+
+    # green goes second, loan office and moving company first of them
+    own = coins[..., 0]
+    n_working = working[:, :, 0, GREEN_ACTIVATION_ORDER]
+    landmarks = np.repeat(n_landmarks[:, :, None, :], N_OUTCOMES, axis=2)
+    if n_working.any():
+        loans = n_working[..., :1] * -CARD_VALUES[LOAN_OFFICE] * _FIRES[LOAN_OFFICE]
+        own -= np.minimum(loans, own)
+        demolished = (
+            np.minimum(n_working[..., _DEMOLITION_COMPANY_COLUMN, None], landmarks[..., 0])
+            * _FIRES[DEMOLITION_COMPANY]
+        )
+        landmarks[..., 0] -= demolished
+        value = np.broadcast_to(_GREEN_VALUES, n_working.shape).copy()
+        value[..., _BREAD_COLUMNS] += mall[:, :, :1]
+        own_icons = icons[:, :, 0]
+        value[..., _GREEN_COLUMNS[FRUIT_AND_VEGETABLE_MARKET]] = 2 * own_icons[..., WHEAT]
+        value[..., _GREEN_COLUMNS[CHEESE_FACTORY]] = 3 * own_icons[..., COW]
+        value[..., _GREEN_COLUMNS[FURNITURE_FACTORY]] = 3 * own_icons[..., GEAR]
+        value[..., _GREEN_COLUMNS[FLOWER_SHOP]] = copies[:, :, 0, FLOWER_GARDEN]
+        value[..., _GREEN_COLUMNS[FOOD_WAREHOUSE]] = 2 * own_icons[..., RESTAURANT]
+        value[..., _GREEN_COLUMNS[GENERAL_STORE]] = (2 + mall[:, :, 0]) * (
+            n_landmarks[:, :, 0] < 2
+        )
+        value[..., _GREEN_COLUMNS[WINERY]] = 6 * copies[:, :, 0, VINEYARD]
+        gains = value * n_working
+        # the soda bottling plant pays once, however many there are
+        gains[..., _GREEN_COLUMNS[SODA_BOTTLING_PLANT]] = icons[..., RESTAURANT].sum(
+            axis=2
+        ) * (n_working[..., _GREEN_COLUMNS[SODA_BOTTLING_PLANT]] > 0)
+        own += gains @ _GREEN_FIRES + 8 * demolished
+
+    # blue goes next and pays everyone
+    n_working = working[..., PRIMARY_IDS]
+    coins += np.swapaxes((_BLUE_VALUES * n_working) @ _BLUE_FIRES, 2, 3)
+    n_corn_fields = n_working[:, :, None, :, _CORN_FIELD_COLUMN]
+    if n_corn_fields.any():
+        coins += 2 * n_corn_fields * _FIRES[CORN_FIELD][:, None] * (landmarks < 2)
+    n_tuna_boats = n_working[:, :, None, :, _TUNA_BOAT_COLUMN]
+    if n_tuna_boats.any():
+        coins += n_tuna_boats * OUTCOME_TUNA_ROLLS[:, None]
+
+    # purple goes last
+    for card_id in PURPLE_ACTIVATION_ORDER:
+        if card_id == BUSINESS_CENTER or not owned[:, :, 0, card_id].any():
+            continue
+        active = owned[:, :, 0, card_id, None] * _FIRES[card_id]
+        if card_id == STADIUM:
+            for seat in range(n_players - 1, 0, -1):
+                _take(coins, seat, 0, 2 * active)
+        elif card_id == TV_STATION:
+            # the richest opponent, the lowest player id among equals
+            player_ids = _seat_players(n_players)[None, :, None, 1:]
+            target = 1 + np.argmax(
+                coins[..., 1:] * n_players - player_ids, axis=-1, keepdims=True
+            )
+            target_coins = np.take_along_axis(coins, target, axis=-1)[..., 0]
+            taken = np.minimum(5 * active, target_coins)
+            np.put_along_axis(coins, target, (target_coins - taken)[..., None], axis=-1)
+            coins[..., 0] += taken
+        elif card_id == PUBLISHER:
+            for seat in range(n_players - 1, 0, -1):
+                per_icon = icons[:, :, seat, BREAD] + icons[:, :, seat, RESTAURANT]
+                _take(coins, seat, 0, per_icon[..., None] * active)
+        elif card_id == TAX_OFFICE:
+            for seat in range(n_players - 1, 0, -1):
+                seat_coins = coins[..., seat]
+                _take(coins, seat, 0, (seat_coins >= 10) * (seat_coins // 2) * active)
+        elif card_id == PARK:
+            equal_share = -(-coins.sum(axis=-1, keepdims=True) // n_players)
+            coins = np.where(active[..., None] > 0, equal_share, coins)
+        elif card_id == TECH_STARTUP:
+            for seat in range(n_players - 1, 0, -1):
+                _take(coins, seat, 0, tech_startups[:, :, 0, None] * active)
+        # the renovation company closes buildings but moves no coins
+
+    # city hall
+    coins[..., 0] = np.maximum(coins[..., 0], 1)
+    return coins
+
+
+def _roll_probabilities(
+    own_deltas: np.ndarray,
+    is_first_turn: np.ndarray,
+    has_train_station: np.ndarray,
+    has_radio_tower: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Roll probabilities under the dice choices that maximise ``own_deltas``.
+
+    Returns them with shape ``(B, C, MAX_DICE_ROLL + 1)``, the number of dice
+    rolled first and the rolls that are rerolled.
+    """
+    # expected own delta given the roll
+    by_roll = (own_deltas * _TUNA_WEIGHTS) @ _ROLL_OUTCOMES
+    fresh_one = by_roll @ ONE_DIE
+    fresh_two = np.where(has_train_station, by_roll @ TWO_DICE, -np.inf)
+    reroll_two = fresh_two > fresh_one
+    fresh = np.maximum(fresh_one, fresh_two)
+    rerolls = has_radio_tower[..., None] & (by_roll < fresh[..., None])
+    kept = np.where(rerolls, fresh[..., None], by_roll)
+    first_two = has_train_station & (kept @ TWO_DICE > kept @ ONE_DIE)
+    first = np.where(first_two[..., None], TWO_DICE, ONE_DIE)
+    second = np.where(reroll_two[..., None], TWO_DICE, ONE_DIE)
+    rerolled = (first * rerolls).sum(axis=-1, keepdims=True)
+    probabilities = first * ~rerolls + rerolled * second
+    probabilities[is_first_turn] = np.eye(MAX_DICE_ROLL + 1)[0]
+    num_dice = np.where(first_two, 2, 1)
+    return probabilities, num_dice, rerolls & ~is_first_turn[..., None]
+
+
+def income_distribution(
+    state: Union[GameState, GameView],
+    player_id: int = 0,
+    purchases: Sequence[Optional[str]] = (None,),
+) -> IncomeDistribution:
+    """Distribution of one turn's coin deltas after each of ``purchases``.
+
+    ``purchases`` are candidates for ``player_id`` to buy, None for buying
+    nothing; they are not checked against the rules, see
+    ``MachiKoroGame.get_possible_purchases`` for the legal ones. The coins
+    a purchase costs are not part of the deltas, but the coins left after
+    it are what later effects take from. Every player is resolved as the
+    roller, so ``expected().sum(axis=1)`` is the income of a round.
+    """
+    n_players = len(state.coins)
+    n_purchases = len(purchases)
+
+    def stacked(array: np.ndarray) -> np.ndarray:
+        return np.repeat(np.asarray(array)[None], n_purchases, axis=0)
+
+    coins = stacked(state.coins)
+    working = stacked(state.working[:, :N_ESTABLISHMENTS])
+    copies = working + stacked(state.on_renovation[:, :N_ESTABLISHMENTS])
+    owned = stacked(state.owned)
+    icons = stacked(state.icons)
+    n_landmarks = stacked(state.n_landmarks)
+    for index, purchase in enumerate(purchases):
+        if purchase is None:
+            continue
+        card_id = card_id_dict[purchase]
+        coins[index, player_id] -= CARD_COSTS[card_id]
+        if card_id < N_ESTABLISHMENTS:
+            working[index, player_id, card_id] += 1
+            copies[index, player_id, card_id] += 1
+            if ICON_IDS[card_id] >= 0:
+                icons[index, player_id, ICON_IDS[card_id]] += 1
+        else:
+            owned[index, player_id, card_id] = 1
+            n_landmarks[index, player_id] += bool(LANDMARK_BITS[card_id])
+
+    seat_players = _seat_players(n_players)
+    coins_by_seat = coins[:, seat_players]
+    after = _resolve(
+        coins_by_seat,
+        working[:, seat_players],
+        copies[:, seat_players],
+        owned[:, seat_players],
+        icons[:, seat_players],
+        n_landmarks[:, seat_players],
+        stacked(state.tech_startups)[:, seat_players],
+    )
+    deltas_by_seat = after - coins_by_seat[:, :, None, :]
+    deltas = np.take_along_axis(
+        deltas_by_seat, _player_seats(n_players)[None, :, None, :], axis=-1
+    )
+
+    is_first_turn = np.broadcast_to(
+        np.asarray(state.is_first_turn, dtype=bool), (n_purchases, n_players)
+    )
+    roll_probabilities, num_dice, rerolls = _roll_probabilities(
+        deltas_by_seat[..., 0],
+        is_first_turn,
+        owned[..., TRAIN_STATION] > 0,
+        owned[..., RADIO_TOWER] > 0,
+    )
+    probabilities = roll_probabilities[..., OUTCOME_ROLLS] * _TUNA_WEIGHTS
+    return IncomeDistribution(tuple(purchases), deltas, probabilities, num_dice, rerolls)
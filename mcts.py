@@ -0,0 +1,251 @@
+"""Monte Carlo tree search for the purchase and radio tower decisions.
+
+``MCTSPolicy`` searches an open-loop tree: nodes are the searching
+player's sequences of choices, and dice, opponents and every other
+decision are sampled afresh on each iteration by playing on a clone of the
+game, so chance is handled by sampling rather than by explicit chance
+nodes. Options that are legal only under some dice are scored with
+availability counts, as in information set MCTS.
+"""
+
+import math
+import multiprocessing
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from frozendict import frozendict
+
+from game import GameSnapshot, MachiKoroGame
+from policy import PURCHASE, REROLL, Decision, Policy, RandomPolicy
+from rng import GameRandom, SeedSequence
+
+SEARCHED_KINDS = (PURCHASE, REROLL)
+
+
+class _Node:
+    __slots__ = ("visits", "value", "available", "children")
+
+    def __init__(self):
+        self.visits = 0
+        self.value = 0.0
+        self.available = 0
+        self.children: Dict[Tuple[str, Any], "_Node"] = {}
+
+
+def _select(node: _Node, decision: Decision, exploration: float) -> Any:
+    """UCB1 over the options legal now; untried options come first."""
+    best_option = None
+    best_score = -math.inf
+    for option in decision.options:
+        key = (decision.kind, option)
+        child = node.children.get(key)
+        if child is None:
+            child = node.children[key] = _Node()
+        child.available += 1
+        if child.visits == 0:
+            score = math.inf
+        else:
+            score = child.value / child.visits + exploration * math.sqrt(
+                math.log(child.available) / child.visits
+            )
+        if score > best_score:
+            best_option, best_score = option, score
+    return best_option
+
+
+def _score(game: MachiKoroGame, player_id: int) -> float:
+    """1 for a win, 0 for a loss; an unfinished game is scored on landmarks."""
+    is_game_over, winner = game.is_game_over()
+    if is_game_over:
+        return 1.0 if winner == player_id else 0.0
+    landmarks = game.state.n_landmarks.tolist()
+    best_other = max(
+        count for other_id, count in enumerate(landmarks) if other_id != player_id
+    )
+    total = landmarks[player_id] + best_other
+    return landmarks[player_id] / total if total else 0.5
+
+
+def search(
+    game: MachiKoroGame,
+    decision: Decision,
+    iterations: int = 1000,
+    time_budget: Optional[float] = None,
+    exploration: float = 0.7,
+    max_rollout_turns: int = 200,
+    rng: Optional[GameRandom] = None,
+) -> Dict[Any, Tuple[int, float]]:
+    """Search ``decision`` of ``game`` and return ``{option: (visits, value)}``.
+
+    ``game`` is left untouched; every iteration plays on a clone of it until
+    the game ends or ``max_rollout_turns`` more turns were played. Stops
+    after ``iterations`` iterations or ``time_budget`` seconds, whichever
+    comes first.
+    """
+    rng = rng or GameRandom()
+    rollout_policies: List[Policy] = [RandomPolicy()] * game.n_players
+    player_id = decision.player_id
+    turn_limit = game.current_turn + max_rollout_turns
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+    root = _Node()
+    for _ in range(iterations):
+        if deadline is not None and time.perf_counter() >= deadline:
+            break
+        fork = game.clone(rng)
+        fork.policies = rollout_policies
+        choice = _select(root, decision, exploration)
+        path = [root.children[(decision.kind, choice)]]
+        # None once the iteration has left the tree
+        node: Optional[_Node] = path[0] if path[0].visits else None
+        turn = fork.resume_turn(decision, choice)
+        reply = None
+        while True:
+            try:
+                pending = turn.send(reply)
+            except StopIteration:
+                if fork.is_game_over()[0] or fork.current_turn >= turn_limit:
+                    break
+                turn = fork.play_turn()
+                reply = None
+                continue
+            if (
+                node is not None
+                and pending.player_id == player_id
+                and pending.kind in SEARCHED_KINDS
+            ):
+                reply = _select(node, pending, exploration)
+                child = node.children[(pending.kind, reply)]
+                path.append(child)
+                node = child if child.visits else None
+            else:
+                reply = fork.policies[pending.player_id].choose(pending)
+        reward = _score(fork, player_id)
+        for child in path:
+            child.visits += 1
+            child.value += reward
+    return {
+        option: (child.visits, child.value)
+        for (_, option), child in root.children.items()
+    }
+
+
+def _search_task(
+    task: Tuple[bytes, int, int, int, frozendict, tuple, tuple, dict, SeedSequence],
+) -> Dict[Any, Tuple[int, float]]:
+    (
+        snapshot_state,
+        current_player,
+        current_turn,
+        n_players,
+        starting_buildings,
+        starting_major_establishments,
+        fields,
+        kwargs,
+        seed,
+    ) = task
+    # the game the snapshot was taken from, set up the same way
+    game = MachiKoroGame(
+        n_players,
+        starting_buildings=starting_buildings,
+        starting_major_establishments=starting_major_establishments,
+    )
+    game.restore(GameSnapshot(snapshot_state, current_player, current_turn))
+    decision = Decision(fields[0], fields[1], fields[2], game.view, *fields[3:])
+    return search(game, decision, rng=GameRandom(seed), **kwargs)
+
+
+class MCTSPolicy:
+    """Searches purchases and rerolls; ``fallback`` takes the other decisions.
+
+    With ``workers > 1`` the search is parallelised at the root: each worker
+    process searches its own tree with ``iterations / workers`` iterations
+    (and the same ``time_budget``) and the visit counts are summed. The
+    worker pool is started on first use and stopped by ``close``.
+    """
+
+    def __init__(
+        self,
+        iterations: int = 1000,
+        time_budget: Optional[float] = None,
+        exploration: float = 0.7,
+        max_rollout_turns: int = 200,
+        workers: int = 1,
+        seed: Optional[int] = None,
+        fallback: Optional[Policy] = None,
+    ):
+        self.iterations = iterations
+        self.time_budget = time_budget
+        self.exploration = exploration
+        self.max_rollout_turns = max_rollout_turns
+        self.workers = workers
+        self.fallback = fallback or RandomPolicy()
+        self._seed_sequence = SeedSequence(seed)
+        (rng_seed,) = self._seed_sequence.spawn(1)
+        self._rng = GameRandom(rng_seed)
+        self._pool = None
+
+    def choose(self, decision: Decision) -> Any:
+        if decision.kind not in SEARCHED_KINDS or len(decision.options) == 1:
+            return self.fallback.choose(decision)
+        stats = self.search(decision)
+        return max(decision.options, key=lambda option: stats.get(option, (0, 0.0)))
+
+    def search(self, decision: Decision) -> Dict[Any, Tuple[int, float]]:
+        game = decision.view.fork(self._rng)
+        if self.workers <= 1:
+            return search(
+                game,
+                decision,
+                self.iterations,
+                self.time_budget,
+                self.exploration,
+                self.max_rollout_turns,
+                self._rng,
+            )
+        if self._pool is None:
+            self._pool = multiprocessing.Pool(self.workers)
+        snapshot = game.snapshot()
+        kwargs = {
+            "iterations": max(1, self.iterations // self.workers),
+            "time_budget": self.time_budget,
+            "exploration": self.exploration,
+            "max_rollout_turns": self.max_rollout_turns,
+        }
+        fields = (
+            decision.kind,
+            decision.player_id,
+            decision.options,
+            decision.card,
+            decision.roll,
+            decision.is_double,
+        )
+        tasks = [
+            (
+                *snapshot,
+                game.n_players,
+                game.starting_buildings,
+                game.starting_major_establishments,
+                fields,
+                kwargs,
+                seed,
+            )
+            for seed in self._seed_sequence.spawn(self.workers)
+        ]
+        stats: Dict[Any, Tuple[int, float]] = {}
+        for worker_stats in self._pool.map(_search_task, tasks):
+            for option, (visits, value) in worker_stats.items():
+                total_visits, total_value = stats.get(option, (0, 0.0))
+                stats[option] = (total_visits + visits, total_value + value)
+        return stats
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,18 @@
+from typing import Dict
+
+from pydantic import BaseModel
+from pydantic.fields import Field
+
+
+class EstablishmentCount(BaseModel, validate_assignment=True):
+    working: int = Field(ge=0, strict=True)
+    on_renovation: int = Field(ge=0, strict=True)
+
+
+class Player(BaseModel, validate_assignment=True):
+    id: int = Field(frozen=True, strict=True)
+    coins: int = Field(ge=0, strict=True)
+    major_establishments: Dict[str, bool]
+    landmarks: Dict[str, bool]
+    establishments: Dict[str, EstablishmentCount]
+    is_first_turn: bool = True
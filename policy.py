@@ -0,0 +1,165 @@
+"""Decisions a game asks its players to make, and the policies that make them.
+
+``MachiKoroGame`` asks the seat's ``Policy`` whenever a player has a
+choice, passing a ``Decision`` with the legal ``options`` and a read-only
+``GameView``. A ``BatchPolicy`` answers many decisions, typically from
+many games, in one call; see ``play_games_batched`` in game.py. An
+``AsyncPolicy`` answers with a coroutine, for async_game.py.
+"""
+
+from typing import Any, NamedTuple, Optional, Protocol, Sequence, Tuple
+
+import numpy as np
+
+from state import GameState
+
+# Turn-level decisions
+NUM_DICE = "num_dice"  # options (1, 2), asked with a train station
+REROLL = "reroll"  # options (False, True), asked with a radio tower
+PURCHASE = "purchase"  # card names, then None to buy nothing
+TECH_STARTUP_COIN = "tech_startup_coin"  # options (False, True)
+# Decisions while cards activate; ``Decision.card`` is the activating card
+TARGET = "target"  # opponent ids, for tv station, moving and business center
+MOVE_BUILDING = "move_building"  # own held establishments, moving company
+TAKE_BUILDING = "take_building"  # target's held establishments, business center
+GIVE_BUILDING = "give_building"  # own held establishments, business center
+RENOVATE_BUILDING = "renovate_building"  # establishments anyone holds
+DECISION_KINDS = (
+    NUM_DICE,
+    REROLL,
+    PURCHASE,
+    TECH_STARTUP_COIN,
+    TARGET,
+    MOVE_BUILDING,
+    TAKE_BUILDING,
+    GIVE_BUILDING,
+    RENOVATE_BUILDING,
+)
+
+_STATE_FIELDS = tuple(GameState.layout(1))
+
+
+class GameView:
+    """Read-only access to a game for policies.
+
+    The state arrays are views of the live ``GameState`` that cannot be
+    written to, so they always show the current position.
+    """
+
+    coins: np.ndarray
+    is_first_turn: np.ndarray
+    tech_startups: np.ndarray
+    market: np.ndarray
+    working: np.ndarray
+    on_renovation: np.ndarray
+    owned: np.ndarray
+    icons: np.ndarray
+    landmark_bits: np.ndarray
+    n_landmarks: np.ndarray
+    on_sale_bits: np.ndarray
+    owned_bits: np.ndarray
+
+    def __init__(self, game: Any):
+        self._game = game
+        self.n_players: int = game.n_players
+        for name in _STATE_FIELDS:
+            view = getattr(game.state, name).view()
+            view.flags.writeable = False
+            setattr(self, name, view)
+
+    @property
+    def current_player(self) -> int:
+        return self._game.current_player
+
+    @property
+    def current_turn(self) -> int:
+        return self._game.current_turn
+
+    def fork(self, rng: Any = None) -> Any:
+        """A ``clone`` of the game to search on, leaving the game untouched."""
+        return self._game.clone(rng)
+
+    @property
+    def rng(self) -> Any:
+        """The game's ``GameRandom``, for policies that play at random."""
+        return self._game.rng
+
+
+class Decision(NamedTuple):
+    """A choice ``player_id`` has to make among ``options``.
+
+    ``card`` is the card being activated, for decisions taken while cards
+    activate. ``roll`` is the roll a reroll would replace and ``is_double``
+    tells whether the turn's roll so far is a double (reroll and purchase).
+    """
+
+    kind: str
+    player_id: int
+    options: Tuple[Any, ...]
+    view: GameView
+    card: Optional[str] = None
+    roll: int = 0
+    is_double: bool = False
+
+
+class Policy(Protocol):
+    def choose(self, decision: Decision) -> Any:
+        """Return one of ``decision.options``."""
+        ...
+
+
+class BatchPolicy(Protocol):
+    def choose_batch(self, decisions: Sequence[Decision]) -> Sequence[Any]:
+        """Return one option for each decision, in order."""
+        ...
+
+
+class AsyncPolicy(Protocol):
+    async def choose(self, decision: Decision) -> Any:
+        """Return one of ``decision.options``; see async_game.py."""
+        ...
+
+
+class DecisionRecorder(Protocol):
+    def record(self, decision: Decision, choice: Any) -> None:
+        """Called with every decision a game takes and the option chosen."""
+        ...
+
+    def end_turn(self) -> None:
+        """Called when a turn is over."""
+        ...
+
+
+class RandomPolicy:
+    """The game's original behaviour.
+
+    Every choice is uniform over the options, except that purchases never
+    pass when a card is affordable and targets are the richest opponent
+    (the lowest id among equals).
+    """
+
+    def choose(self, decision: Decision) -> Any:
+        kind, _, options, view = decision[:4]
+        if kind == PURCHASE:
+            # any card but the final None
+            return options[int(view.rng.random() * (len(options) - 1))]
+        if kind == REROLL or kind == TECH_STARTUP_COIN:
+            return view.rng.random() < 0.5
+        if kind == TARGET:
+            coins = view.coins
+            return max(options, key=lambda player_id: (coins[player_id], -player_id))
+        return view.rng.choice(options)
+
+    def choose_batch(self, decisions: Sequence[Decision]) -> Sequence[Any]:
+        return [self.choose(decision) for decision in decisions]
+
+
+class BatchAsPolicy:
+    """Answers single decisions with a ``BatchPolicy``, one at a time."""
+
+    def __init__(self, batch_policy: BatchPolicy):
+        self.batch_policy = batch_policy
+
+    def choose(self, decision: Decision) -> Any:
+        (choice,) = self.batch_policy.choose_batch([decision])
+        return choice
@@ -0,0 +1,123 @@
+"""Opt-in timing of the phases of a turn and of every card handler.
+
+A ``GameProfiler`` passed to ``MachiKoroGame(profiler=...)`` counts calls
+and wall time per phase of ``play_turn`` and per card handler. Phases are
+timed as laps: each mark in the turn charges the time since the previous
+mark to its phase, so the phases of a turn add up to the whole turn.
+Decisions are taken within the phase that asks for them; ``purchase_options``
+is the scan for what can be bought and ``purchase`` the choice and the
+buying. A game without a profiler only checks for one at each mark.
+
+Profilers hold plain counters, so they pickle cheaply and ``merge``
+combines those of worker processes, see ``simulate_many``.
+"""
+
+from time import perf_counter_ns
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+# In the order they happen in a turn
+PHASES = (
+    "roll",
+    "reroll",
+    "red",
+    "green",
+    "blue",
+    "purple",
+    "city_hall",
+    "purchase_options",
+    "purchase",
+    "tech_startup",
+    "airport",
+    "end_turn",
+)
+
+
+class GameProfiler:
+    """Calls and nanoseconds per turn phase (``phases``) and card (``cards``)."""
+
+    def __init__(self):
+        # name -> [calls, nanoseconds]
+        self.phases: Dict[str, List[int]] = {phase: [0, 0] for phase in PHASES}
+        self.cards: Dict[str, List[int]] = {}
+        self._last = 0
+
+    def start(self) -> None:
+        """Start timing the first phase of a turn."""
+        self._last = perf_counter_ns()
+
+    def lap(self, phase: str) -> None:
+        """Charge the time since the last mark to ``phase``."""
+        now = perf_counter_ns()
+        counters = self.phases[phase]
+        counters[0] += 1
+        counters[1] += now - self._last
+        self._last = now
+
+    def wrap_handlers(
+        self, handlers: Sequence[Callable[..., None]], names: Sequence[str]
+    ) -> Tuple[Callable[..., None], ...]:
+        """``handlers`` timed under ``names``, for ``activate_cards`` to call."""
+        return tuple(
+            self._timed(handler, name) for handler, name in zip(handlers, names)
+        )
+
+    def _timed(self, handler: Callable[..., None], name: str) -> Callable[..., None]:
+        counters = self.cards.setdefault(name, [0, 0])
+
+        def timed_handler(*args: Any) -> None:
+            start = perf_counter_ns()
+            handler(*args)
+            counters[0] += 1
+            counters[1] += perf_counter_ns() - start
+
+        return timed_handler
+
+    def checkpoint(self) -> Tuple[Dict[str, Tuple[int, int]], ...]:
+        """The counters as they are now, for ``rewind``."""
+        return tuple(
+            {name: (calls, nanoseconds) for name, (calls, nanoseconds) in kind.items()}
+            for kind in (self.phases, self.cards)
+        )
+
+    def rewind(self, checkpoint: Tuple[Dict[str, Tuple[int, int]], ...]) -> None:
+        """Put the counters back to ``checkpoint``, dropping what was timed
+        since (a turn that is played again, say)."""
+        for counters, saved in zip((self.phases, self.cards), checkpoint):
+            # in place: timed handlers hold on to their counters
+            for name, counter in counters.items():
+                counter[:] = saved.get(name, (0, 0))
+
+    def merge(self, other: "GameProfiler") -> None:
+        for mine, theirs in ((self.phases, other.phases), (self.cards, other.cards)):
+            for name, (calls, nanoseconds) in theirs.items():
+                counters = mine.setdefault(name, [0, 0])
+                counters[0] += calls
+                counters[1] += nanoseconds
+
+    def __getstate__(self) -> dict:
+        return {"phases": self.phases, "cards": self.cards}
+
+    def __setstate__(self, state: dict) -> None:
+        self.phases = state["phases"]
+        self.cards = state["cards"]
+        self._last = 0
+
+    def report(self) -> str:
+        """A table of both kinds of counters, the costliest first."""
+        lines = []
+        for title, counters in (("phase", self.phases), ("card", self.cards)):
+            total = sum(nanoseconds for _, nanoseconds in counters.values()) or 1
+            lines.append(
+                f"{title:<28} {'calls':>10} {'total ms':>10} {'mean us':>9} {'share':>6}"
+            )
+            for name, (calls, nanoseconds) in sorted(
+                counters.items(), key=lambda item: -item[1][1]
+            ):
+                if not calls:
+                    continue
+                lines.append(
+                    f"{name:<28} {calls:>10} {nanoseconds / 1e6:>10.1f}"
+                    f" {nanoseconds / calls / 1e3:>9.2f} {nanoseconds / total:>6.1%}"
+                )
+            lines.append("")
+        return "\n".join(lines)
@@ -0,0 +1,413 @@
+"""Compact binary records of whole games, kept in sharded files.
+
+A ``GameRecord`` holds what it takes to play a game again: its seed, its
+starting setup and the index of the option taken at every decision, one
+byte each. Dice come from a stream of the seed that policies do not draw
+from (see ``GameRandom``), so answering the same decisions in the same
+order replays the game exactly. Coins at the end of every turn can be kept
+too, to check a replay or to read them without replaying.
+
+``GameRecorder`` builds a record while a game is played, ``ReplayWriter``
+appends records to shard files and ``ReplayReader`` memory-maps the shards
+to iterate or index the games.
+"""
+
+import array
+import mmap
+import struct
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    BinaryIO,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+
+import numpy as np
+from frozendict import frozendict
+
+from constants import card_id_dict, cards_tuple, starting_buildings_dict
+from policy import Decision
+from rng import GameRandom, SeedSequence
+
+if TYPE_CHECKING:
+    from game import GameSnapshot
+
+
+class GameRecord(NamedTuple):
+    """One game: its seed and setup, its decisions and how it ended.
+
+    ``decisions[i]`` is the index in ``Decision.options`` of the option
+    taken at the game's ``i``-th decision. ``coins``, when kept, has shape
+    ``(turns, n_players)`` and holds everyone's coins after each turn.
+    """
+
+    n_players: int
+    entropy: int
+    spawn_key: Tuple[int, ...]
+    decisions: bytes
+    winner: int = -1
+    turns: int = 0
+    coins: Optional[np.ndarray] = None
+    starting_buildings: frozendict = starting_buildings_dict
+    starting_major_establishments: Tuple[str, ...] = ()
+
+    @property
+    def seed(self) -> SeedSequence:
+        return SeedSequence(self.entropy, self.spawn_key)
+
+
+class GameRecorder:
+    """Logs the decisions of ``game`` as it is played; see ``game_record``.
+
+    Attach it before the first turn. The game's ``GameRandom`` must be its
+    own, as it is when the game is made from a seed, so that the seed alone
+    gives back the dice.
+    """
+
+    def __init__(self, game: Any, coins: bool = False):
+        if game.current_turn:
+            raise ValueError("games must be recorded from their first turn")
+        self.game = game
+        self._decisions = bytearray()
+        self._coins: Optional[array.array] = array.array("i") if coins else None
+        game.recorder = self
+
+    def record(self, decision: Decision, choice: Any) -> None:
+        self._decisions.append(decision.options.index(choice))
+
+    def end_turn(self) -> None:
+        if self._coins is not None:
+            self._coins.extend(self.game.state.coins.tolist())
+
+    def game_record(self) -> GameRecord:
+        """The record of the game so far."""
+        game = self.game
+        seed = game.rng.seed_sequence
+        coins = None
+        if self._coins is not None:
+            coins = np.array(self._coins, dtype=np.int32).reshape(-1, game.n_players)
+        return GameRecord(
+            game.n_players,
+            seed.entropy,
+            seed.spawn_key,
+            bytes(self._decisions),
+            game.is_game_over()[1],
+            game.current_turn,
+            coins,
+            frozendict(game.starting_buildings),
+            tuple(game.starting_major_establishments),
+        )
+
+
+class ReplayPolicy:
+    """Answers decisions with the options of a record, in order."""
+
+    def __init__(self, decisions: bytes, start: int = 0):
+        self.decisions = decisions
+        self.position = start
+
+    def choose(self, decision: Decision) -> Any:
+        if self.position >= len(self.decisions):
+            raise IndexError("the record has no decisions left")
+        choice = decision.options[self.decisions[self.position]]
+        self.position += 1
+        return choice
+
+
+class Checkpoint(NamedTuple):
+    """A replay between turns: the game, its random source and the number of
+    decisions taken so far."""
+
+    snapshot: "GameSnapshot"
+    rng: GameRandom
+    position: int
+
+
+class ReplayCheckpoints:
+    """Checkpoints of ``record`` every ``every`` turns, for
+    ``MachiKoroGame.replay`` to start from instead of the first turn.
+
+    Replays that are given these checkpoints add the ones they pass.
+    """
+
+    def __init__(self, record: GameRecord, every: int = 50):
+        if every < 1:
+            raise ValueError(f"every must be positive, got {every}")
+        self.record = record
+        self.every = every
+        self._checkpoints: Dict[int, Checkpoint] = {}
+
+    def __len__(self) -> int:
+        return len(self._checkpoints)
+
+    def matches(self, record: GameRecord) -> bool:
+        return (
+            record.decisions == self.record.decisions
+            and record.entropy == self.record.entropy
+            and record.spawn_key == self.record.spawn_key
+        )
+
+    def add(self, game: Any, position: int) -> None:
+        """Save ``game`` if it is at a checkpoint turn."""
+        turn = game.current_turn
+        if turn % self.every == 0 and turn not in self._checkpoints:
+            self._checkpoints[turn] = Checkpoint(game.snapshot(), game.rng.copy(), position)
+
+    def latest(self, turn: int) -> Optional[Checkpoint]:
+        """The last checkpoint at or before ``turn``, None if there is none."""
+        turn -= turn % self.every
+        while turn > 0:
+            if turn in self._checkpoints:
+                return self._checkpoints[turn]
+            turn -= self.every
+        return None
+
+
+# A record is a header, the variable-size fields in its order and the coins:
+# record size (after this field), n_players, winner, has coins, entropy
+# size, spawn key size, starting buildings, starting majors, turns,
+# decisions. Entropy is little-endian, spawn keys are uint32, each starting
+# building is (card id, working, on renovation) and each major a card id,
+# all uint8, then a byte per decision and int32 coins.
+_HEADER = struct.Struct("<IBbBBBBBII")
+_SIZE = struct.Struct("<I")
+_MAGIC = b"MKRP\x01\x00\x00\x00"
+
+
+def encode_record(record: GameRecord) -> bytes:
+    entropy_size = max(1, (record.entropy.bit_length() + 7) // 8)
+    entropy = record.entropy.to_bytes(entropy_size, "little")
+    buildings = bytes(
+        value
+        for card, (working, on_renovation) in record.starting_buildings.items()
+        for value in (card_id_dict[card], working, on_renovation)
+    )
+    majors = bytes(card_id_dict[card] for card in record.starting_major_establishments)
+    coins = b"" if record.coins is None else record.coins.astype("<i4").tobytes()
+    body = b"".join(
+        (
+            entropy,
+            struct.pack(f"<{len(record.spawn_key)}I", *record.spawn_key),
+            buildings,
+            majors,
+            record.decisions,
+            coins,
+        )
+    )
+    header = _HEADER.pack(
+        _HEADER.size - _SIZE.size + len(body),
+        record.n_players,
+        record.winner,
+        record.coins is not None,
+        len(entropy),
+        len(record.spawn_key),
+        len(record.starting_buildings),
+        len(record.starting_major_establishments),
+        record.turns,
+        len(record.decisions),
+    )
+    return header + body
+
+
+def decode_record(data: bytes, offset: int = 0) -> GameRecord:
+    (
+        _,
+        n_players,
+        winner,
+        has_coins,
+        entropy_size,
+        spawn_key_size,
+        n_buildings,
+        n_majors,
+        turns,
+        n_decisions,
+    ) = _HEADER.unpack_from(data, offset)
+    offset += _HEADER.size
+    entropy = int.from_bytes(data[offset : offset + entropy_size], "little")
+    offset += entropy_size
+    spawn_key = struct.unpack_from(f"<{spawn_key_size}I", data, offset)
+    offset += 4 * spawn_key_size
+    buildings = data[offset : offset + 3 * n_buildings]
+    offset += 3 * n_buildings
+    starting_buildings = frozendict(
+        {
+            cards_tuple[buildings[i]]: (buildings[i + 1], buildings[i + 2])
+            for i in range(0, len(buildings), 3)
+        }
+    )
+    majors = tuple(cards_tuple[card_id] for card_id in data[offset : offset + n_majors])
+    offset += n_majors
+    decisions = bytes(data[offset : offset + n_decisions])
+    offset += n_decisions
+    coins = None
+    if has_coins:
+        coins = np.frombuffer(
+            data, dtype="<i4", count=turns * n_players, offset=offset
+        ).reshape(turns, n_players)
+    return GameRecord(
+        n_players,
+        entropy,
+        spawn_key,
+        decisions,
+        winner,
+        turns,
+        coins,
+        starting_buildings,
+        majors,
+    )
+
+
+def next_shard_number(directory: Path, prefix: str, suffix: str) -> int:
+    """One past the highest ``n`` of the ``{prefix}-{n:05d}{suffix}`` shards
+    in ``directory``; 0 when there are none."""
+    numbers = [
+        int(number)
+        for number in (
+            path.name[len(prefix) + 1 : -len(suffix)]
+            for path in directory.glob(f"{prefix}-*{suffix}")
+        )
+        if number.isdigit()
+    ]
+    return max(numbers, default=-1) + 1
+
+
+def _shard_paths(directory: Path) -> List[Path]:
+    return sorted(directory.glob("*.bin"))
+
+
+class ReplayWriter:
+    """Appends records to ``{prefix}-{n:05d}.bin`` shards in ``directory``.
+
+    A shard takes ``games_per_shard`` games; its ``.idx`` file beside it
+    holds the uint64 offset of every record. New shards are numbered after
+    the writer's existing ones, so records are never written into an old
+    file. Workers writing to the same directory need different prefixes.
+    """
+
+    def __init__(
+        self,
+        directory: Union[str, Path],
+        prefix: str = "replays",
+        games_per_shard: int = 100_000,
+        buffer_size: int = 1 << 20,
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.prefix = prefix
+        self.games_per_shard = games_per_shard
+        self.buffer_size = buffer_size
+        self._n_shards = next_shard_number(self.directory, prefix, ".bin")
+        self._data: Optional[BinaryIO] = None
+        self._index: Optional[BinaryIO] = None
+        self._buffer = bytearray()
+        self._offsets = array.array("Q")
+        self._shard_size = 0
+        self._shard_games = 0
+
+    def _open_shard(self) -> None:
+        path = self.directory / f"{self.prefix}-{self._n_shards:05d}.bin"
+        self._n_shards += 1
+        # "x": a shard that appeared since is an error, not something to truncate
+        self._data = open(path, "xb")
+        self._index = open(path.with_suffix(".idx"), "xb")
+        self._buffer += _MAGIC
+        self._shard_size = len(_MAGIC)
+        self._shard_games = 0
+
+    def write(self, record: GameRecord) -> None:
+        if self._data is None:
+            self._open_shard()
+        encoded = encode_record(record)
+        self._offsets.append(self._shard_size)
+        self._buffer += encoded
+        self._shard_size += len(encoded)
+        self._shard_games += 1
+        if self._shard_games >= self.games_per_shard:
+            self._close_shard()
+        elif len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._data is None:
+            return
+        self._data.write(self._buffer)
+        self._buffer.clear()
+        self._data.flush()
+        self._index.write(self._offsets.tobytes())
+        del self._offsets[:]
+        self._index.flush()
+
+    def _close_shard(self) -> None:
+        self.flush()
+        self._data.close()
+        self._index.close()
+        self._data = self._index = None
+
+    def close(self) -> None:
+        if self._data is not None:
+            self._close_shard()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class ReplayReader:
+    """Memory-maps every shard in ``directory``; a sequence of ``GameRecord``.
+
+    Games are numbered shard by shard in file name order, and only the
+    records that are read are decoded.
+    """
+
+    def __init__(self, directory: Union[str, Path]):
+        self._maps: List[mmap.mmap] = []
+        self._offsets: List[np.ndarray] = []
+        for path in _shard_paths(Path(directory)):
+            with open(path, "rb") as file:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            if data[: len(_MAGIC)] != _MAGIC:
+                data.close()
+                raise ValueError(f"{path} is not a replay shard")
+            self._maps.append(data)
+            self._offsets.append(
+                np.fromfile(path.with_suffix(".idx"), dtype="<u8").astype(np.int64)
+            )
+        self._starts = np.cumsum([0] + [len(offsets) for offsets in self._offsets])
+
+    def __len__(self) -> int:
+        return int(self._starts[-1])
+
+    def __getitem__(self, index: int) -> GameRecord:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("game index out of range")
+        shard = int(np.searchsorted(self._starts, index, side="right")) - 1
+        data = self._maps[shard]
+        offset = int(self._offsets[shard][index - self._starts[shard]])
+        (size,) = _SIZE.unpack_from(data, offset)
+        return decode_record(data[offset : offset + _SIZE.size + size])
+
+    def __iter__(self) -> Iterator[GameRecord]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def close(self) -> None:
+        for data in self._maps:
+            data.close()
+        self._maps.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
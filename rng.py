@@ -0,0 +1,110 @@
+import hashlib
+import random
+import secrets
+from typing import List, Sequence, Tuple, TypeVar, Union
+
+T = TypeVar("T")
+
+# Maps a random byte to a die face. 252 is the largest multiple of 6 below
+# 256, so the four bytes above it are dropped to keep every face equally
+# likely.
+_DIE_TABLE = bytes(byte % 6 + 1 for byte in range(256))
+_REJECTED_BYTES = bytes(range(252, 256))
+
+
+class SeedSequence:
+    """A tree of seeds in the spirit of ``numpy.random.SeedSequence``.
+
+    A sequence is identified by its ``entropy`` and ``spawn_key``; children
+    from ``spawn`` extend the key, so any game of a large parallel run can be
+    replayed from the two values alone.
+    """
+
+    def __init__(self, entropy: Union[int, None] = None, spawn_key: Tuple[int, ...] = ()):
+        self.entropy = secrets.randbits(128) if entropy is None else entropy
+        self.spawn_key = tuple(spawn_key)
+        self.n_children_spawned = 0
+
+    def spawn(self, n_children: int) -> List["SeedSequence"]:
+        start = self.n_children_spawned
+        self.n_children_spawned += n_children
+        return [
+            SeedSequence(self.entropy, self.spawn_key + (i,))
+            for i in range(start, start + n_children)
+        ]
+
+    def generate_state(self, stream: str = "") -> int:
+        """A 256-bit integer that depends on the entropy and the spawn key.
+
+        Different ``stream`` names give independent states for the same
+        sequence.
+        """
+        key = repr((self.entropy, self.spawn_key)).encode()
+        if stream:
+            key += b"/" + stream.encode()
+        return int.from_bytes(hashlib.blake2b(key, digest_size=32).digest(), "little")
+
+    def __repr__(self) -> str:
+        return f"SeedSequence(entropy={self.entropy}, spawn_key={self.spawn_key})"
+
+
+class GameRandom:
+    """Random source owned by a single game.
+
+    Dice come from a buffer filled in bulk, which is several times cheaper
+    than one ``randint`` per die. They are drawn from a stream of their own,
+    so the dice of a game depend on its seed alone and not on how many
+    numbers its policies drew from ``random`` and ``choice``; a game can be
+    replayed from its seed and its decisions (see replay.py).
+    """
+
+    def __init__(
+        self,
+        seed: Union[int, SeedSequence, None] = None,
+        dice_buffer_size: int = 4096,
+    ):
+        if not isinstance(seed, SeedSequence):
+            seed = SeedSequence(seed)
+        self.seed_sequence = seed
+        self.dice_buffer_size = dice_buffer_size
+        self._random = random.Random(seed.generate_state())
+        self.random = self._random.random
+        self._dice_random = random.Random(seed.generate_state("dice"))
+        self._dice = b""
+        self._dice_index = 0
+
+    def spawn(self, n_children: int) -> List["GameRandom"]:
+        return [
+            GameRandom(child, self.dice_buffer_size)
+            for child in self.seed_sequence.spawn(n_children)
+        ]
+
+    def copy(self) -> "GameRandom":
+        """A source that will draw the same numbers as this one from now on."""
+        clone = GameRandom.__new__(GameRandom)
+        clone.seed_sequence = self.seed_sequence
+        clone.dice_buffer_size = self.dice_buffer_size
+        clone._random = random.Random.__new__(random.Random)
+        clone._random.setstate(self._random.getstate())
+        clone.random = clone._random.random
+        clone._dice_random = random.Random.__new__(random.Random)
+        clone._dice_random.setstate(self._dice_random.getstate())
+        clone._dice = self._dice
+        clone._dice_index = self._dice_index
+        return clone
+
+    def _refill_dice(self) -> None:
+        self._dice = self._dice_random.randbytes(self.dice_buffer_size).translate(
+            _DIE_TABLE, _REJECTED_BYTES
+        )
+        self._dice_index = 0
+
+    def roll_die(self) -> int:
+        if self._dice_index >= len(self._dice):
+            self._refill_dice()
+        die = self._dice[self._dice_index]
+        self._dice_index += 1
+        return die
+
+    def choice(self, seq: Sequence[T]) -> T:
+        return seq[int(self._random.random() * len(seq))]
@@ -0,0 +1,770 @@
+"""A local HTTP and WebSocket server hosting many games at once.
+
+    python server.py [--host 127.0.0.1] [--port 8765]
+    python server.py --load-test 1000 [--players 2] [--max-turns 60]
+
+Sessions are created over HTTP and played over a websocket per seat::
+
+    POST   /sessions               {"n_players": 2, "seats": ["remote", "bot"],
+                                    "seed": 1, "max_turns": null}
+                                   -> {"session": id, "tokens": {seat: token}}
+    GET    /sessions               every session and how far it got
+    GET    /sessions/{id}          the game's snapshot
+    GET    /sessions/{id}/metrics  the session's latencies
+    DELETE /sessions/{id}          stop the game and forget it
+    GET    /sessions/{id}/ws?seat=0&token=...   the seat's websocket
+
+"bot" seats are played by ``RandomPolicy`` in the server, "remote" seats by
+whoever holds their token. A session keeps nothing but its
+``MachiKoroGame`` (the state is the ``GameState`` buffer) and plays it with
+``take_turn_async``, awaiting remote seats at their decisions.
+
+On connecting, a seat gets a ``snapshot`` message: the ``GameState``
+buffer (base64 little-endian int64) with its layout. After that it gets
+``diff`` messages with the ``[index, value]`` pairs of the buffer that
+changed since the last message, one after every turn and one before each
+of its ``prompt`` messages. A prompt carries the decision and its options,
+and is answered with ``{"type": "answer", "prompt": id, "option": index}``.
+Reconnecting with the same token, or sending ``{"type": "resync"}``, starts
+over from a snapshot and repeats the pending prompt. The game ends with a
+``game_over`` message holding the winner and the SHA-1 of the final
+buffer, for clients to check the state they rebuilt.
+
+Every session keeps two latency histograms: ``decision``, from a prompt
+being sent to its answer arriving, and ``response``, from an answer
+arriving to the session's next message going out.
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import math
+import random
+import secrets
+import sys
+import time
+import urllib.parse
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from async_game import take_turn_async
+from game import MachiKoroGame
+from policy import PURCHASE, Decision, RandomPolicy
+from state import GameState
+from websocket import WebSocket, WebSocketError, connect, handshake_response
+
+SEAT_KINDS = ("remote", "bot")
+
+
+class LatencyHistogram:
+    """Latencies counted in log-spaced buckets, ``per_decade`` buckets
+    between 1 microsecond and 100 seconds; constant memory and mergeable."""
+
+    def __init__(self, per_decade: int = 10):
+        self.per_decade = per_decade
+        self.counts = [0] * (8 * per_decade + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        index = 0
+        if seconds > 1e-6:
+            index = min(
+                len(self.counts) - 1,
+                math.ceil(math.log10(seconds / 1e-6) * self.per_decade),
+            )
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> float:
+        """The upper edge of the bucket holding the ``q`` quantile."""
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= q * self.count:
+                return min(1e-6 * 10 ** (index / self.per_decade), self.max)
+        return 0.0
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+            "total": self.total,
+            "per_decade": self.per_decade,
+            "counts": self.counts,
+        }
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "LatencyHistogram":
+        histogram = cls(data["per_decade"])
+        histogram.counts = list(data["counts"])
+        histogram.count = data["count"]
+        histogram.total = data["total"]
+        histogram.max = data["max"]
+        return histogram
+
+
+class _Connection:
+    """A seat's websocket and the state its client was last sent."""
+
+    def __init__(self, socket: WebSocket, seat: int):
+        self.socket = socket
+        self.seat = seat
+        self.state: Optional[np.ndarray] = None
+        self.turn = -1
+        self.current_player = -1
+
+
+class _Prompt:
+    def __init__(
+        self, prompt_id: int, decision: Decision, future: "asyncio.Future[int]"
+    ):
+        self.prompt_id = prompt_id
+        self.decision = decision
+        self.future = future
+        self.sent_at = time.perf_counter()
+
+
+class _RemoteSeat:
+    """The ``AsyncPolicy`` of a seat played over a websocket."""
+
+    def __init__(self, session: "GameSession", seat: int):
+        self.session = session
+        self.seat = seat
+        self.prompt: Optional[_Prompt] = None
+
+    async def choose(self, decision: Decision) -> Any:
+        session = self.session
+        session.n_prompts += 1
+        prompt = self.prompt = _Prompt(
+            session.n_prompts, decision, asyncio.get_running_loop().create_future()
+        )
+        await session.send_prompt(self.seat)
+        try:
+            index = await prompt.future
+        finally:
+            self.prompt = None
+        return decision.options[index]
+
+
+class GameSession:
+    """One game, its seats and their connections."""
+
+    def __init__(
+        self,
+        session_id: str,
+        n_players: int,
+        seats: Sequence[str],
+        seed: Optional[int] = None,
+        max_turns: Optional[int] = None,
+    ):
+        if not 2 <= n_players <= 5:
+            raise ValueError(f"n_players must be between 2 and 5, got {n_players}")
+        if len(seats) != n_players or any(kind not in SEAT_KINDS for kind in seats):
+            raise ValueError(f"seats must be {n_players} of {SEAT_KINDS}, got {seats}")
+        self.session_id = session_id
+        self.game = MachiKoroGame(n_players, seed=seed)
+        self.max_turns = max_turns
+        self.seats = tuple(seats)
+        self.tokens = {
+            seat: secrets.token_urlsafe(12)
+            for seat, kind in enumerate(seats)
+            if kind == "remote"
+        }
+        self.remote = {seat: _RemoteSeat(self, seat) for seat in self.tokens}
+        self.agents = [
+            self.remote[seat] if seat in self.remote else RandomPolicy()
+            for seat in range(n_players)
+        ]
+        self.connections: Dict[int, _Connection] = {}
+        self.metrics = {"decision": LatencyHistogram(), "response": LatencyHistogram()}
+        self.n_prompts = 0
+        self.winner: Optional[int] = None
+        self.finished = False
+        self.task: Optional["asyncio.Task[None]"] = None
+        self._answered_at: Optional[float] = None
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "session": self.session_id,
+            "n_players": self.game.n_players,
+            "seats": self.seats,
+            "turn": self.game.current_turn,
+            "connected": sorted(self.connections),
+            "finished": self.finished,
+            "winner": self.winner,
+        }
+
+    def snapshot_json(self) -> Dict[str, Any]:
+        game = self.game
+        return {
+            "type": "snapshot",
+            "session": self.session_id,
+            "n_players": game.n_players,
+            "layout": GameState.layout(game.n_players),
+            "state": base64.b64encode(self._state_bytes()).decode(),
+            "turn": game.current_turn,
+            "current_player": game.current_player,
+        }
+
+    def _state_bytes(self) -> bytes:
+        return self.game.state.buffer.astype("<i8").tobytes()
+
+    def state_hash(self) -> str:
+        return hashlib.sha1(self._state_bytes()).hexdigest()
+
+    async def run(self) -> None:
+        game = self.game
+        try:
+            while True:
+                is_game_over, winner = game.is_game_over()
+                if is_game_over or (
+                    self.max_turns is not None and game.current_turn >= self.max_turns
+                ):
+                    break
+                await take_turn_async(game, self.agents)
+                for seat in list(self.connections):
+                    await self.send_update(seat)
+            self.winner = winner if is_game_over else -1
+            self.finished = True
+            message = json.dumps(
+                {
+                    "type": "game_over",
+                    "winner": self.winner,
+                    "turn": game.current_turn,
+                    "state_hash": self.state_hash(),
+                }
+            )
+            for seat in list(self.connections):
+                await self.send_update(seat)
+                await self._send(seat, message)
+        finally:
+            for connection in list(self.connections.values()):
+                await connection.socket.close()
+
+    async def _send(self, seat: int, message: str) -> None:
+        connection = self.connections.get(seat)
+        if connection is None:
+            return
+        if self._answered_at is not None:
+            self.metrics["response"].add(time.perf_counter() - self._answered_at)
+            self._answered_at = None
+        try:
+            await connection.socket.send(message)
+        except ConnectionError:
+            self._drop(connection)
+
+    def _drop(self, connection: _Connection) -> None:
+        if self.connections.get(connection.seat) is connection:
+            del self.connections[connection.seat]
+
+    async def send_update(self, seat: int) -> None:
+        """Send the seat what changed since its last message, if anything."""
+        connection = self.connections.get(seat)
+        if connection is None:
+            return
+        game = self.game
+        buffer = game.state.buffer
+        (changed,) = np.nonzero(buffer != connection.state)
+        if (
+            not len(changed)
+            and connection.turn == game.current_turn
+            and connection.current_player == game.current_player
+        ):
+            return
+        connection.state = buffer.copy()
+        connection.turn = game.current_turn
+        connection.current_player = game.current_player
+        changes = np.stack([changed, buffer[changed]], axis=1).tolist()
+        message = {
+            "type": "diff",
+            "turn": game.current_turn,
+            "current_player": game.current_player,
+            "changes": changes,
+        }
+        await self._send(seat, json.dumps(message))
+
+    async def send_prompt(self, seat: int) -> None:
+        prompt = self.remote[seat].prompt
+        if prompt is None or seat not in self.connections:
+            return
+        await self.send_update(seat)
+        decision = prompt.decision
+        prompt.sent_at = time.perf_counter()
+        message = {
+            "type": "prompt",
+            "prompt": prompt.prompt_id,
+            "kind": decision.kind,
+            "player": decision.player_id,
+            "options": list(decision.options),
+            "card": decision.card,
+            "roll": decision.roll,
+            "is_double": decision.is_double,
+        }
+        await self._send(seat, json.dumps(message))
+
+    async def resync(self, seat: int) -> None:
+        connection = self.connections[seat]
+        connection.state = self.game.state.buffer.copy()
+        connection.turn = self.game.current_turn
+        connection.current_player = self.game.current_player
+        await self._send(seat, json.dumps(self.snapshot_json()))
+        await self.send_prompt(seat)
+
+    async def serve(self, socket: WebSocket, seat: int) -> None:
+        """Play ``seat`` over ``socket`` until either side closes it."""
+        previous = self.connections.get(seat)
+        connection = self.connections[seat] = _Connection(socket, seat)
+        try:
+            if previous is not None:
+                await previous.socket.close()
+            await self.resync(seat)
+            while not self.finished:
+                text = await socket.receive()
+                if text is None:
+                    break
+                error = self._answer(seat, text)
+                if error == "resync":
+                    await self.resync(seat)
+                elif error is not None:
+                    message = json.dumps({"type": "error", "message": error})
+                    await self._send(seat, message)
+        finally:
+            self._drop(connection)
+
+    def _answer(self, seat: int, text: str) -> Optional[str]:
+        try:
+            message = json.loads(text)
+            kind = message["type"]
+        except (ValueError, KeyError, TypeError):
+            return "messages must be JSON objects with a type"
+        if kind == "resync":
+            return "resync"
+        if kind != "answer":
+            return f"unknown message type {kind!r}"
+        prompt = self.remote[seat].prompt
+        if prompt is None or message.get("prompt") != prompt.prompt_id:
+            return "no such prompt is waiting"
+        option = message.get("option")
+        n_options = len(prompt.decision.options)
+        if not isinstance(option, int) or not 0 <= option < n_options:
+            return f"option must be an index into the {n_options} options"
+        if prompt.future.done():
+            return "the prompt was already answered"
+        now = time.perf_counter()
+        self.metrics["decision"].add(now - prompt.sent_at)
+        self._answered_at = now
+        prompt.future.set_result(option)
+        return None
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+_REASONS = {
+    200: "OK",
+    201: "Created",
+    400: "Bad Request",
+    403: "Forbidden",
+    404: "Not Found",
+}
+
+
+async def _read_request(
+    reader: asyncio.StreamReader,
+) -> Tuple[str, str, Dict[str, List[str]], Dict[str, str], bytes]:
+    head = await reader.readuntil(b"\r\n\r\n")
+    request_line, *header_lines = head.decode("latin1").split("\r\n")
+    method, target, _ = request_line.split(" ", 2)
+    headers = {}
+    for line in header_lines:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+    body = b""
+    if "content-length" in headers:
+        body = await reader.readexactly(int(headers["content-length"]))
+    url = urllib.parse.urlsplit(target)
+    return method, url.path, urllib.parse.parse_qs(url.query), headers, body
+
+
+def _response(status: int, payload: Any) -> bytes:
+    body = json.dumps(payload).encode()
+    return (
+        f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        "Connection: close\r\n\r\n"
+    ).encode() + body
+
+
+class GameServer:
+    """Serves ``GameSession`` objects on ``host:port`` (0 picks a free port)."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.sessions: Dict[str, GameSession] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._n_sessions = 0
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(
+            self._handle, self.host, self.port, backlog=4096
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        for session in self.sessions.values():
+            if session.task is not None:
+                session.task.cancel()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    def create_session(
+        self,
+        n_players: int,
+        seats: Sequence[str],
+        seed: Optional[int] = None,
+        max_turns: Optional[int] = None,
+    ) -> GameSession:
+        self._n_sessions += 1
+        session_id = f"{self._n_sessions}-{secrets.token_hex(3)}"
+        session = GameSession(session_id, n_players, seats, seed, max_turns)
+        self.sessions[session_id] = session
+        session.task = asyncio.get_running_loop().create_task(session.run())
+        return session
+
+    def _session(self, session_id: str) -> GameSession:
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise HttpError(404, f"no session {session_id}")
+        return session
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            try:
+                method, path, query, headers, body = await _read_request(reader)
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+                return
+            parts = [part for part in path.split("/") if part]
+            try:
+                if parts[-1:] == ["ws"] and len(parts) == 3 and method == "GET":
+                    await self._websocket(reader, writer, parts[1], query, headers)
+                    return
+                status, payload = self._route(method, parts, body)
+            except HttpError as error:
+                status, payload = error.status, {"error": str(error)}
+            writer.write(_response(status, payload))
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+        finally:
+            writer.close()
+
+    def _route(self, method: str, parts: List[str], body: bytes) -> Tuple[int, Any]:
+        if parts == ["sessions"] and method == "GET":
+            return 200, [session.summary() for session in self.sessions.values()]
+        if parts == ["sessions"] and method == "POST":
+            try:
+                options = json.loads(body or b"{}")
+                n_players = int(options.get("n_players", 2))
+                seats = options.get("seats", ["remote"] * n_players)
+                session = self.create_session(
+                    n_players, seats, options.get("seed"), options.get("max_turns")
+                )
+            except (ValueError, TypeError, AttributeError) as error:
+                raise HttpError(400, str(error))
+            return 201, {"session": session.session_id, "tokens": session.tokens}
+        if len(parts) == 2 and parts[0] == "sessions":
+            session = self._session(parts[1])
+            if method == "GET":
+                return 200, {**session.snapshot_json(), **session.summary()}
+            if method == "DELETE":
+                if session.task is not None:
+                    session.task.cancel()
+                del self.sessions[session.session_id]
+                return 200, session.summary()
+        if len(parts) == 3 and parts[0] == "sessions" and parts[2] == "metrics":
+            session = self._session(parts[1])
+            return 200, {name: hist.to_json() for name, hist in session.metrics.items()}
+        raise HttpError(404, f"no route for {method} /{'/'.join(parts)}")
+
+    async def _websocket(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        session_id: str,
+        query: Dict[str, List[str]],
+        headers: Dict[str, str],
+    ) -> None:
+        session = self._session(session_id)
+        try:
+            seat = int(query["seat"][0])
+            token = query["token"][0]
+        except (KeyError, ValueError):
+            raise HttpError(400, "seat and token are required")
+        if not secrets.compare_digest(session.tokens.get(seat, ""), token):
+            raise HttpError(403, f"wrong token for seat {seat}")
+        try:
+            writer.write(handshake_response(headers))
+        except WebSocketError as error:
+            raise HttpError(400, str(error))
+        await writer.drain()
+        await session.serve(WebSocket(reader, writer, mask=False), seat)
+
+
+async def http_json(
+    host: str, port: int, method: str, path: str, payload: Any = None
+) -> Tuple[int, Any]:
+    """A one-off HTTP request with a JSON body; returns the status and the
+    decoded response."""
+    reader, writer = await asyncio.open_connection(host, port)
+    body = b"" if payload is None else json.dumps(payload).encode()
+    writer.write(
+        (
+            f"{method} {path} HTTP/1.1\r\nHost: {host}:{port}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+        ).encode()
+        + body
+    )
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, response_body = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(response_body)
+
+
+class BotClient:
+    """A remote seat played at random over a websocket, rebuilding the game
+    state from the server's snapshot and diffs.
+
+    ``reconnect_every`` drops the connection after that many prompts, before
+    answering, and reconnects. ``latency`` times each answer until the next
+    message from the server.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        session_id: str,
+        seat: int,
+        token: str,
+        seed: Optional[int] = None,
+        reconnect_every: Optional[int] = None,
+    ):
+        self.path = f"/sessions/{session_id}/ws?seat={seat}&token={token}"
+        self.host = host
+        self.port = port
+        self.reconnect_every = reconnect_every
+        self.random = random.Random(seed)
+        self.state: Optional[np.ndarray] = None
+        self.latency = LatencyHistogram()
+        self.n_prompts = 0
+        self.n_reconnects = 0
+        self.winner: Optional[int] = None
+        self.in_sync: Optional[bool] = None
+
+    def _choose(self, message: Dict[str, Any]) -> int:
+        n_options = len(message["options"])
+        if message["kind"] == PURCHASE and n_options > 1:
+            # buy something when possible, like RandomPolicy
+            return self.random.randrange(n_options - 1)
+        return self.random.randrange(n_options)
+
+    async def run(self) -> None:
+        while self.winner is None:
+            socket = await connect(self.host, self.port, self.path)
+            try:
+                if await self._play(socket):
+                    self.n_reconnects += 1
+            finally:
+                await socket.close()
+
+    async def _play(self, socket: WebSocket) -> bool:
+        """Play until the game ends (False) or it is time to reconnect (True)."""
+        answered_at = None
+        while True:
+            text = await socket.receive()
+            if text is None:
+                raise ConnectionError("the server closed the connection")
+            if answered_at is not None:
+                self.latency.add(time.perf_counter() - answered_at)
+                answered_at = None
+            message = json.loads(text)
+            kind = message["type"]
+            if kind == "snapshot":
+                self.state = np.frombuffer(
+                    base64.b64decode(message["state"]), dtype="<i8"
+                ).copy()
+            elif kind == "diff":
+                if message["changes"]:
+                    indices, values = zip(*message["changes"])
+                    self.state[list(indices)] = values
+            elif kind == "prompt":
+                self.n_prompts += 1
+                if self.reconnect_every and self.n_prompts % self.reconnect_every == 0:
+                    return True
+                answer = {
+                    "type": "answer",
+                    "prompt": message["prompt"],
+                    "option": self._choose(message),
+                }
+                answered_at = time.perf_counter()
+                await socket.send(json.dumps(answer))
+            elif kind == "game_over":
+                self.winner = message["winner"]
+                digest = hashlib.sha1(self.state.astype("<i8").tobytes()).hexdigest()
+                self.in_sync = digest == message["state_hash"]
+                return False
+            elif kind == "error":
+                raise RuntimeError(message["message"])
+
+
+def _brief(histogram: LatencyHistogram) -> Dict[str, float]:
+    summary = histogram.to_json()
+    return {key: summary[key] for key in ("count", "mean", "p50", "p99", "max")}
+
+
+async def load_test(
+    n_clients: int = 1000,
+    players: int = 2,
+    max_turns: Optional[int] = 60,
+    host: str = "127.0.0.1",
+    port: Optional[int] = None,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """Play ``n_clients`` bot clients in sessions of ``players`` remote seats
+    against a server at ``host:port``, or one started here when ``port`` is
+    None, and report throughput and latencies."""
+    server = None
+    if port is None:
+        server = GameServer(host)
+        await server.start()
+        port = server.port
+    try:
+        n_sessions = math.ceil(n_clients / players)
+        started = time.perf_counter()
+        created = await asyncio.gather(
+            *(
+                http_json(
+                    host,
+                    port,
+                    "POST",
+                    "/sessions",
+                    {
+                        "n_players": players,
+                        # bots fill the last session's spare seats
+                        "seats": [
+                            "remote" if index * players + seat < n_clients else "bot"
+                            for seat in range(players)
+                        ],
+                        "seed": seed + index,
+                        "max_turns": max_turns,
+                    },
+                )
+                for index in range(n_sessions)
+            )
+        )
+        clients = [
+            BotClient(
+                host, port, response["session"], int(seat), token, seed=seed + index
+            )
+            for index, (_, response) in enumerate(created)
+            for seat, token in response["tokens"].items()
+        ]
+        await asyncio.gather(*(client.run() for client in clients))
+        elapsed = time.perf_counter() - started
+
+        latency = LatencyHistogram()
+        for client in clients:
+            latency.merge(client.latency)
+        server_latency = {name: LatencyHistogram() for name in ("decision", "response")}
+        for _, response in created:
+            _, metrics = await http_json(
+                host, port, "GET", f"/sessions/{response['session']}/metrics"
+            )
+            for name, histogram in server_latency.items():
+                histogram.merge(LatencyHistogram.from_json(metrics[name]))
+        n_decisions = sum(client.n_prompts for client in clients)
+        return {
+            "clients": len(clients),
+            "sessions": n_sessions,
+            "elapsed": elapsed,
+            "decisions": n_decisions,
+            "decisions_per_second": n_decisions / elapsed,
+            "out_of_sync": sum(not client.in_sync for client in clients),
+            "client_latency": _brief(latency),
+            "server_latency": {
+                name: _brief(histogram) for name, histogram in server_latency.items()
+            },
+        }
+    finally:
+        if server is not None:
+            await server.close()
+
+
+async def _serve_forever(host: str, port: int) -> None:
+    server = GameServer(host, port)
+    await server.start()
+    print(f"serving on http://{host}:{server.port}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--load-test", type=int, metavar="CLIENTS")
+    parser.add_argument("--players", type=int, default=2)
+    parser.add_argument("--max-turns", type=int, default=60)
+    args = parser.parse_args(argv)
+    if args.load_test:
+        report = asyncio.run(
+            load_test(args.load_test, args.players, args.max_turns, args.host)
+        )
+        print(json.dumps(report, indent=2))
+        return 1 if report["out_of_sync"] else 0
+    try:
+        asyncio.run(_serve_forever(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,323 @@
+"""Play many independent games on a process pool.
+
+Workers play chunks of games and send back one small ``GameSummary`` per
+game; ``simulate_many`` folds them into a ``TournamentStats`` as they arrive,
+so memory does not grow with the number of games. Given a ``GameProfiler``,
+workers profile their games and their profilers are merged into it.
+"""
+
+import multiprocessing
+import os
+from typing import Any, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from frozendict import frozendict
+
+from constants import card_id_dict, starting_buildings_dict
+from game import LANDMARK_IDS, MachiKoroGame
+from policy import MOVE_BUILDING, TAKE_BUILDING, Decision
+from profiler import GameProfiler
+from rng import SeedSequence
+from state import N_CARDS
+
+# first_owned counts; turns past LAST_TURN are stored as LAST_TURN
+NEVER_OWNED = 0xFFFFFFFF
+LAST_TURN = NEVER_OWNED - 1
+
+
+class GameSummary(NamedTuple):
+    """What is left of one game once it is over.
+
+    ``landmarks`` holds one bitmask per player, bit ``i`` standing for
+    ``LANDMARK_IDS[i]``. ``purchases`` holds ``n_players * N_CARDS`` uint32
+    counts, player by player, of the cards bought during the game.
+
+    ``first_owned`` holds ``n_players * N_CARDS`` uint32 counts of the
+    player's own turns taken when they first owned each card, 0 for the
+    starting cards and ``NEVER_OWNED`` for cards they never had.
+    ``purchase_order[player_id]`` holds the card ids the player bought, in
+    order.
+    """
+
+    game_index: int
+    winner: int
+    turns: int
+    landmarks: Tuple[int, ...]
+    purchases: bytes
+    first_owned: bytes
+    purchase_order: Tuple[bytes, ...]
+
+    def purchase_counts(self, player_id: int) -> List[int]:
+        counts = np.frombuffer(self.purchases, dtype=np.uint32)
+        return counts[player_id * N_CARDS : (player_id + 1) * N_CARDS].tolist()
+
+    def first_owned_turns(self) -> np.ndarray:
+        """``first_owned`` as an array of shape ``(n_players, N_CARDS)``."""
+        return np.frombuffer(self.first_owned, dtype=np.uint32).reshape(-1, N_CARDS)
+
+
+class TournamentStats:
+    """Running totals over game summaries; ``merge`` combines two of them."""
+
+    def __init__(self, n_players: int):
+        self.n_players = n_players
+        self.n_games = 0
+        self.wins = [0] * n_players
+        self.total_turns = 0
+        self.min_turns: Optional[int] = None
+        self.max_turns: Optional[int] = None
+        # landmarks_built[player_id][i] counts games that ended with the
+        # player owning LANDMARK_IDS[i]
+        self.landmarks_built = [[0] * len(LANDMARK_IDS) for _ in range(n_players)]
+        self.purchases = [[0] * N_CARDS for _ in range(n_players)]
+        self.winner_purchases = [0] * N_CARDS
+
+    def add(self, summary: GameSummary) -> None:
+        self.n_games += 1
+        self.wins[summary.winner] += 1
+        self.total_turns += summary.turns
+        if self.min_turns is None or summary.turns < self.min_turns:
+            self.min_turns = summary.turns
+        if self.max_turns is None or summary.turns > self.max_turns:
+            self.max_turns = summary.turns
+        for player_id in range(self.n_players):
+            landmarks = summary.landmarks[player_id]
+            built = self.landmarks_built[player_id]
+            for i in range(len(LANDMARK_IDS)):
+                built[i] += (landmarks >> i) & 1
+            totals = self.purchases[player_id]
+            for card_id, count in enumerate(summary.purchase_counts(player_id)):
+                totals[card_id] += count
+        winner_counts = summary.purchase_counts(summary.winner)
+        for card_id, count in enumerate(winner_counts):
+            self.winner_purchases[card_id] += count
+
+    def merge(self, other: "TournamentStats") -> None:
+        if other.n_players != self.n_players:
+            raise ValueError(
+                f"cannot merge stats for {other.n_players} players into {self.n_players}"
+            )
+        self.n_games += other.n_games
+        self.total_turns += other.total_turns
+        for turns in (other.min_turns, other.max_turns):
+            if turns is None:
+                continue
+            if self.min_turns is None or turns < self.min_turns:
+                self.min_turns = turns
+            if self.max_turns is None or turns > self.max_turns:
+                self.max_turns = turns
+        for player_id in range(self.n_players):
+            self.wins[player_id] += other.wins[player_id]
+            for i, count in enumerate(other.landmarks_built[player_id]):
+                self.landmarks_built[player_id][i] += count
+            for card_id, count in enumerate(other.purchases[player_id]):
+                self.purchases[player_id][card_id] += count
+        for card_id, count in enumerate(other.winner_purchases):
+            self.winner_purchases[card_id] += count
+
+    @property
+    def mean_turns(self) -> float:
+        return self.total_turns / self.n_games if self.n_games else 0.0
+
+    @property
+    def win_rates(self) -> List[float]:
+        return [wins / self.n_games if self.n_games else 0.0 for wins in self.wins]
+
+
+class _TradeWatcher:
+    """Notes turns where buildings changed hands, the only way to get one
+    other than buying it."""
+
+    def __init__(self):
+        self.traded = False
+
+    def record(self, decision: Decision, choice: Any) -> None:
+        if decision.kind == MOVE_BUILDING or decision.kind == TAKE_BUILDING:
+            self.traded = True
+
+    def end_turn(self) -> None:
+        pass
+
+
+def play_summarized_game(
+    game_index: int,
+    n_players: int,
+    seed: SeedSequence,
+    starting_buildings: frozendict = starting_buildings_dict,
+    starting_major_establishments: tuple = (),
+    profiler: Optional[GameProfiler] = None,
+) -> GameSummary:
+    game = MachiKoroGame(
+        n_players,
+        starting_buildings=starting_buildings,
+        starting_major_establishments=starting_major_establishments,
+        seed=seed,
+        profiler=profiler,
+    )
+    # lists of ints: a long game can buy a demolished landmark again and again
+    purchases = [0] * (n_players * N_CARDS)
+    purchase_order = [bytearray() for _ in range(n_players)]
+    first_owned = [NEVER_OWNED] * (n_players * N_CARDS)
+    turns_taken = [0] * n_players
+    state = game.state
+    game.recorder = trades = _TradeWatcher()
+
+    def note_new_cards() -> None:
+        held = (state.working + state.on_renovation + state.owned) > 0
+        for player_id, card_id in zip(*np.nonzero(held)):
+            index = player_id * N_CARDS + card_id
+            if first_owned[index] == NEVER_OWNED:
+                first_owned[index] = min(turns_taken[player_id], LAST_TURN)
+
+    note_new_cards()
+    is_game_over, winner = game.is_game_over()
+    while not is_game_over:
+        player_id = game.current_player
+        purchase = game.take_turn()
+        turns_taken[player_id] += 1
+        if purchase is not None:
+            card_id = card_id_dict[purchase]
+            purchases[player_id * N_CARDS + card_id] += 1
+            purchase_order[player_id].append(card_id)
+            index = player_id * N_CARDS + card_id
+            if first_owned[index] == NEVER_OWNED:
+                first_owned[index] = min(turns_taken[player_id], LAST_TURN)
+        if trades.traded:
+            trades.traded = False
+            note_new_cards()
+        is_game_over, winner = game.is_game_over()
+
+    owned = game.state.owned
+    landmarks = tuple(
+        sum(
+            1 << i
+            for i, card_id in enumerate(LANDMARK_IDS)
+            if owned[player_id, card_id]
+        )
+        for player_id in range(n_players)
+    )
+    return GameSummary(
+        game_index,
+        winner,
+        game.current_turn,
+        landmarks,
+        np.array(purchases, dtype=np.uint32).tobytes(),
+        np.array(first_owned, dtype=np.uint32).tobytes(),
+        tuple(bytes(order) for order in purchase_order),
+    )
+
+
+def play_chunk(
+    task: Tuple[int, int, int, int, frozendict, tuple, bool],
+) -> Tuple[List[GameSummary], Optional[GameProfiler]]:
+    entropy, start, stop, n_players, starting_buildings, starting_majors, profile = task
+    profiler = GameProfiler() if profile else None
+    summaries = [
+        play_summarized_game(
+            game_index,
+            n_players,
+            # keyed by the game index, so results do not depend on chunking
+            SeedSequence(entropy, (game_index,)),
+            starting_buildings,
+            starting_majors,
+            profiler,
+        )
+        for game_index in range(start, stop)
+    ]
+    return summaries, profiler
+
+
+def chunk_tasks(
+    n_games: int,
+    n_players: int,
+    workers: int,
+    starting_buildings: frozendict,
+    starting_major_establishments: tuple,
+    seed: Optional[int],
+    chunk_size: Optional[int],
+    profile: bool = False,
+) -> Iterator[Tuple[int, int, int, int, frozendict, tuple, bool]]:
+    """The tasks for ``play_chunk`` that play ``n_games`` games."""
+    entropy = SeedSequence(seed).entropy
+    if chunk_size is None:
+        chunk_size = max(1, min(256, n_games // (4 * workers)))
+    for start in range(0, n_games, chunk_size):
+        yield (
+            entropy,
+            start,
+            min(start + chunk_size, n_games),
+            n_players,
+            starting_buildings,
+            starting_major_establishments,
+            profile,
+        )
+
+
+def iter_summaries(
+    n_games: int,
+    n_players: int,
+    workers: Optional[int] = None,
+    starting_buildings: frozendict = starting_buildings_dict,
+    starting_major_establishments: tuple = (),
+    seed: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+    profiler: Optional[GameProfiler] = None,
+) -> Iterator[GameSummary]:
+    """Yield a summary for each of ``n_games`` games, in completion order.
+
+    Game ``i`` is seeded with ``SeedSequence(seed, (i,))``, so any game can be
+    replayed alone from its ``game_index``. ``workers=1`` plays in this
+    process. ``profiler`` collects the timings of the games played.
+    """
+    workers = workers or os.cpu_count() or 1
+    tasks = chunk_tasks(
+        n_games,
+        n_players,
+        workers,
+        starting_buildings,
+        starting_major_establishments,
+        seed,
+        chunk_size,
+        profiler is not None,
+    )
+    if workers == 1:
+        yield from _merged_chunks(map(play_chunk, tasks), profiler)
+        return
+    with multiprocessing.Pool(workers) as pool:
+        yield from _merged_chunks(pool.imap_unordered(play_chunk, tasks), profiler)
+
+
+def _merged_chunks(
+    chunks: Iterator[Tuple[List[GameSummary], Optional[GameProfiler]]],
+    profiler: Optional[GameProfiler],
+) -> Iterator[GameSummary]:
+    for summaries, chunk_profiler in chunks:
+        if chunk_profiler is not None:
+            profiler.merge(chunk_profiler)
+        yield from summaries
+
+
+def simulate_many(
+    n_games: int,
+    n_players: int,
+    workers: Optional[int] = None,
+    starting_buildings: frozendict = starting_buildings_dict,
+    starting_major_establishments: tuple = (),
+    seed: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+    profiler: Optional[GameProfiler] = None,
+) -> TournamentStats:
+    """Play ``n_games`` games over ``workers`` processes and aggregate them."""
+    stats = TournamentStats(n_players)
+    for summary in iter_summaries(
+        n_games,
+        n_players,
+        workers=workers,
+        starting_buildings=starting_buildings,
+        starting_major_establishments=starting_major_establishments,
+        seed=seed,
+        chunk_size=chunk_size,
+        profiler=profiler,
+    ):
+        stats.add(summary)
+    return stats
@@ -0,0 +1,512 @@
+from functools import lru_cache, partial
+from typing import Any, Callable, Dict, Iterator, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from constants import (
+    building_cost_dict,
+    card_id_dict,
+    cards_tuple,
+    establishments_tuple,
+    landmarks_tuple,
+    major_establishments_tuple,
+    primary_industry_dict,
+    restaurants_tuple,
+    secondary_industry_dict,
+)
+
+N_CARDS = len(cards_tuple)
+N_ESTABLISHMENTS = len(establishments_tuple)
+
+# The icons cards count, as columns of GameState.icons. ICON_IDS[card_id] is
+# the column an establishment counts towards, -1 if none.
+ICONS = ("wheat", "cow", "gear", "bread", "restaurant")
+WHEAT, COW, GEAR, BREAD, RESTAURANT = range(len(ICONS))
+_CARD_ICONS = {
+    **primary_industry_dict,
+    **secondary_industry_dict,
+    **{card: "restaurant" for card in restaurants_tuple},
+}
+ICON_IDS = tuple(
+    ICONS.index(_CARD_ICONS[card]) if _CARD_ICONS[card] in ICONS else -1
+    for card in establishments_tuple
+)
+
+# Bit i of GameState.landmark_bits is LANDMARKS_BY_COST[i], so the lowest set
+# bit is the cheapest landmark built. LANDMARK_BITS[card_id] is 0 for cards
+# that are not landmarks.
+LANDMARKS_BY_COST = tuple(sorted(landmarks_tuple, key=building_cost_dict.get))
+LANDMARK_BITS = tuple(
+    1 << LANDMARKS_BY_COST.index(card) if card in landmarks_tuple else 0
+    for card in cards_tuple
+)
+ALL_LANDMARK_BITS = (1 << len(landmarks_tuple)) - 1
+
+# Fields of GameState with a bit per card; they come last, after the features
+CARD_BITMASKS = ("on_sale_bits", "owned_bits")
+
+# AFFORDABLE_BITS[coins] has bit card_id set for the cards that cost at most
+# ``coins``, up to MAX_COST which affords everything.
+_COSTS = tuple(building_cost_dict[card] for card in cards_tuple)
+MAX_COST = max(_COSTS)
+AFFORDABLE_BITS = tuple(
+    sum(1 << card_id for card_id, cost in enumerate(_COSTS) if cost <= coins)
+    for coins in range(MAX_COST + 1)
+)
+
+
+def _size(shape: Tuple[int, ...]) -> int:
+    size = 1
+    for dim in shape:
+        size *= dim
+    return size
+
+
+class GameState:
+    """Dense array storage for everything that changes during a game.
+
+    All arrays are int64 views into one contiguous ``buffer``, so the whole
+    state can be copied or stacked in a single operation. Rows are player ids
+    and columns are card ids from ``card_id_dict``:
+
+    * ``coins``, ``is_first_turn``, ``tech_startups``: shape ``(n_players,)``
+    * ``market``: shape ``(N_CARDS,)``, cards left for sale
+    * ``working``, ``on_renovation``: shape ``(n_players, N_CARDS)``, only the
+      establishment columns are ever non-zero
+    * ``owned``: shape ``(n_players, N_CARDS)``, 0/1 flags for major
+      establishments and landmarks
+    * ``icons``: shape ``(n_players, len(ICONS))``, working and renovated
+      establishments per icon. ``MachiKoroGame`` and the views keep it up to
+      date; call ``recount_icons`` after writing the other arrays directly.
+    * ``landmark_bits``, ``n_landmarks``: shape ``(n_players,)``, the landmarks
+      built as a bitmask over ``LANDMARKS_BY_COST`` and their number, kept
+      like ``icons``; ``recount_landmarks`` rebuilds them.
+    * ``on_sale_bits``: shape ``(1,)``, and ``owned_bits``: shape
+      ``(n_players,)``, bit ``card_id`` set when the market has the card and
+      when the player owns it; ``recount_purchase_bits`` rebuilds them. These
+      ``CARD_BITMASKS`` come last and are too wide for features, so the
+      first ``n_features`` values of ``buffer`` are what a model should see.
+
+    ``buffer`` may be a zeroed row of a larger array, e.g. to keep the states
+    of many games side by side.
+    """
+
+    coins: np.ndarray
+    is_first_turn: np.ndarray
+    tech_startups: np.ndarray
+    market: np.ndarray
+    working: np.ndarray
+    on_renovation: np.ndarray
+    owned: np.ndarray
+    icons: np.ndarray
+    landmark_bits: np.ndarray
+    n_landmarks: np.ndarray
+    on_sale_bits: np.ndarray
+    owned_bits: np.ndarray
+
+    def __init__(self, n_players: int, buffer: Optional[np.ndarray] = None):
+        self.n_players = n_players
+        size = self.size(n_players)
+        if buffer is None:
+            buffer = np.zeros(size, np.int64)
+        elif buffer.shape != (size,) or buffer.dtype != np.int64:
+            raise ValueError(f"buffer must be int64 of shape ({size},)")
+        self.buffer = buffer
+        for name, start, stop, shape in _field_slices(n_players):
+            setattr(self, name, buffer[start:stop].reshape(shape))
+
+    @staticmethod
+    def layout(n_players: int) -> Dict[str, Tuple[int, Tuple[int, ...]]]:
+        """``{field: (offset, shape)}`` of each array within ``buffer``."""
+        shapes = {
+            "coins": (n_players,),
+            "is_first_turn": (n_players,),
+            "tech_startups": (n_players,),
+            "market": (N_CARDS,),
+            "working": (n_players, N_CARDS),
+            "on_renovation": (n_players, N_CARDS),
+            "owned": (n_players, N_CARDS),
+            "icons": (n_players, len(ICONS)),
+            "landmark_bits": (n_players,),
+            "n_landmarks": (n_players,),
+            "on_sale_bits": (1,),
+            "owned_bits": (n_players,),
+        }
+        layout = {}
+        offset = 0
+        for name, shape in shapes.items():
+            layout[name] = (offset, shape)
+            offset += _size(shape)
+        return layout
+
+    @staticmethod
+    def size(n_players: int) -> int:
+        return _field_slices(n_players)[-1][2]
+
+    @staticmethod
+    def n_features(n_players: int) -> int:
+        """Length of the leading part of ``buffer`` that a model should see:
+        every field before the ``CARD_BITMASKS``.
+
+        ``landmark_bits`` is a bitmask too but stays a feature: it is below
+        ``2 ** len(landmarks_tuple)``, which float32 and int16 features hold
+        exactly, while the card bitmasks reach ``2 ** (N_CARDS - 1)``.
+        """
+        return next(
+            start
+            for name, start, _, _ in _field_slices(n_players)
+            if name in CARD_BITMASKS
+        )
+
+    def copy(self) -> "GameState":
+        """A state with its own copy of ``buffer``."""
+        return GameState(self.n_players, self.buffer.copy())
+
+    def recount_icons(self) -> None:
+        """Rebuild ``icons`` from ``working`` and ``on_renovation``."""
+        self.icons[...] = 0
+        for card_id, icon in enumerate(ICON_IDS):
+            if icon >= 0:
+                self.icons[:, icon] += (
+                    self.working[:, card_id] + self.on_renovation[:, card_id]
+                )
+
+    def set_establishment(
+        self, player_id: int, card_id: int, working: int, on_renovation: int
+    ) -> None:
+        """Set a player's copies of an establishment, keeping ``icons`` in step."""
+        icon = ICON_IDS[card_id]
+        if icon >= 0:
+            self.icons[player_id, icon] += (
+                working
+                + on_renovation
+                - self.working[player_id, card_id]
+                - self.on_renovation[player_id, card_id]
+            )
+        self.working[player_id, card_id] = working
+        self.on_renovation[player_id, card_id] = on_renovation
+
+    def recount_landmarks(self) -> None:
+        """Rebuild ``landmark_bits`` and ``n_landmarks`` from ``owned``."""
+        for player_id in range(self.n_players):
+            bits = 0
+            for card_id, bit in enumerate(LANDMARK_BITS):
+                if self.owned[player_id, card_id]:
+                    bits |= bit
+            self.landmark_bits[player_id] = bits
+            self.n_landmarks[player_id] = bits.bit_count()
+
+    def set_owned(self, player_id: int, card_id: int, is_owned: int) -> None:
+        """Set a major establishment or landmark flag, keeping the landmark
+        counters and ``owned_bits`` in step."""
+        bit = LANDMARK_BITS[card_id]
+        if bit and bool(self.owned[player_id, card_id]) != bool(is_owned):
+            self.landmark_bits[player_id] ^= bit
+            self.n_landmarks[player_id] += 1 if is_owned else -1
+        self.owned[player_id, card_id] = is_owned
+        if is_owned:
+            self.owned_bits[player_id] |= 1 << card_id
+        else:
+            self.owned_bits[player_id] &= ~(1 << card_id)
+
+    def set_market(self, card_id: int, count: int) -> None:
+        """Set the cards left for sale, keeping ``on_sale_bits`` in step."""
+        self.market[card_id] = count
+        if count > 0:
+            self.on_sale_bits[0] |= 1 << card_id
+        else:
+            self.on_sale_bits[0] &= ~(1 << card_id)
+
+    def recount_purchase_bits(self) -> None:
+        """Rebuild ``on_sale_bits`` and ``owned_bits`` from ``market`` and ``owned``."""
+        self.on_sale_bits[0] = sum(
+            1 << card_id for card_id in range(N_CARDS) if self.market[card_id] > 0
+        )
+        for player_id in range(self.n_players):
+            self.owned_bits[player_id] = sum(
+                1 << card_id
+                for card_id in range(N_CARDS)
+                if self.owned[player_id, card_id]
+            )
+
+    def recount(self) -> None:
+        """Rebuild every derived array after writing the others directly."""
+        self.recount_icons()
+        self.recount_landmarks()
+        self.recount_purchase_bits()
+
+    @property
+    def landmarks(self) -> np.ndarray:
+        """Landmark flags, shape ``(n_players, len(landmarks_tuple))``."""
+        start = card_id_dict[landmarks_tuple[0]]
+        return self.owned[:, start : start + len(landmarks_tuple)]
+
+    @property
+    def major_establishments(self) -> np.ndarray:
+        """Major establishment flags, shape ``(n_players, len(major_establishments_tuple))``."""
+        start = card_id_dict[major_establishments_tuple[0]]
+        return self.owned[:, start : start + len(major_establishments_tuple)]
+
+
+@lru_cache(maxsize=None)
+def _field_slices(n_players: int) -> Tuple[Tuple[str, int, int, Tuple[int, ...]], ...]:
+    return tuple(
+        (name, offset, offset + _size(shape), shape)
+        for name, (offset, shape) in GameState.layout(n_players).items()
+    )
+
+
+def _validated_count(value: Any, field: str) -> int:
+    if isinstance(value, bool) or not isinstance(value, (int, np.integer)):
+        raise TypeError(f"{field} must be an int, got {type(value).__name__}")
+    if value < 0:
+        raise ValueError(f"{field} must be >= 0, got {value}")
+    return int(value)
+
+
+def _validated_flag(value: Any, field: str) -> int:
+    if not isinstance(value, (bool, np.bool_)):
+        raise TypeError(f"{field} must be a bool, got {type(value).__name__}")
+    return int(value)
+
+
+class EstablishmentView:
+    """Live ``(working, on_renovation)`` pair of one player's establishment."""
+
+    __slots__ = ("_state", "_player_id", "_card_id")
+
+    def __init__(self, state: GameState, player_id: int, card_id: int):
+        self._state = state
+        self._player_id = player_id
+        self._card_id = card_id
+
+    @property
+    def working(self) -> int:
+        return int(self._state.working[self._player_id, self._card_id])
+
+    @working.setter
+    def working(self, value: int) -> None:
+        self._state.set_establishment(
+            self._player_id,
+            self._card_id,
+            _validated_count(value, "working"),
+            self.on_renovation,
+        )
+
+    @property
+    def on_renovation(self) -> int:
+        return int(self._state.on_renovation[self._player_id, self._card_id])
+
+    @on_renovation.setter
+    def on_renovation(self, value: int) -> None:
+        self._state.set_establishment(
+            self._player_id,
+            self._card_id,
+            self.working,
+            _validated_count(value, "on_renovation"),
+        )
+
+    def __eq__(self, other: object) -> bool:
+        if not hasattr(other, "working") or not hasattr(other, "on_renovation"):
+            return NotImplemented
+        return (self.working, self.on_renovation) == (
+            getattr(other, "working"),
+            getattr(other, "on_renovation"),
+        )
+
+    def __repr__(self) -> str:
+        return f"EstablishmentView(working={self.working}, on_renovation={self.on_renovation})"
+
+
+class EstablishmentsView(Mapping[str, EstablishmentView]):
+    """Dict-like view of the establishments a player currently holds.
+
+    Establishments with no working and no renovated copies are absent, the
+    same way ``clean_empty_cards`` used to pop them from the old dict.
+    """
+
+    __slots__ = ("_state", "_player_id")
+
+    def __init__(self, state: GameState, player_id: int):
+        self._state = state
+        self._player_id = player_id
+
+    def _card_id(self, name: str) -> int:
+        card_id = card_id_dict.get(name, N_ESTABLISHMENTS)
+        if card_id >= N_ESTABLISHMENTS:
+            raise KeyError(name)
+        return card_id
+
+    def _is_held(self, card_id: int) -> bool:
+        return bool(
+            self._state.working[self._player_id, card_id]
+            or self._state.on_renovation[self._player_id, card_id]
+        )
+
+    def __getitem__(self, name: str) -> EstablishmentView:
+        card_id = self._card_id(name)
+        if not self._is_held(card_id):
+            raise KeyError(name)
+        return EstablishmentView(self._state, self._player_id, card_id)
+
+    def __setitem__(self, name: str, counts: Any) -> None:
+        card_id = self._card_id(name)
+        working = _validated_count(counts.working, "working")
+        on_renovation = _validated_count(counts.on_renovation, "on_renovation")
+        self._state.set_establishment(self._player_id, card_id, working, on_renovation)
+
+    def pop(self, name: str) -> EstablishmentView:
+        view = self[name]
+        self._state.set_establishment(self._player_id, view._card_id, 0, 0)
+        return view
+
+    def __iter__(self) -> Iterator[str]:
+        for card_id in range(N_ESTABLISHMENTS):
+            if self._is_held(card_id):
+                yield cards_tuple[card_id]
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return repr(dict(self.items()))
+
+
+class ArrayRowView(Mapping[Any, Any]):
+    """Dict-like view mapping fixed keys to cells of a 1-D int array.
+
+    ``setter``, if given, is called with the column and the validated value
+    instead of writing the cell directly.
+    """
+
+    __slots__ = ("_keys", "_index", "_row", "_cast", "_validate", "_setter")
+
+    def __init__(
+        self,
+        keys: Sequence[Any],
+        index: Mapping[Any, int],
+        row: np.ndarray,
+        cast: Callable[[Any], Any] = int,
+        validate: Callable[[Any, str], int] = _validated_count,
+        setter: Optional[Callable[[int, int], None]] = None,
+    ):
+        self._keys = tuple(keys)
+        self._index = {key: index[key] for key in self._keys}
+        self._row = row
+        self._cast = cast
+        self._validate = validate
+        self._setter = setter
+
+    def __getitem__(self, key: Any) -> Any:
+        return self._cast(self._row[self._index[key]])
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        value = self._validate(value, str(key))
+        if self._setter is None:
+            self._row[self._index[key]] = value
+        else:
+            self._setter(self._index[key], value)
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self._keys)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __repr__(self) -> str:
+        values = self._row.tolist()
+        return repr({key: self._cast(values[i]) for key, i in self._index.items()})
+
+
+class PlayerView:
+    """Read/write view of one player with the attributes of ``models.Player``."""
+
+    __slots__ = (
+        "_state",
+        "id",
+        "landmarks",
+        "major_establishments",
+        "establishments",
+    )
+
+    def __init__(self, state: GameState, player_id: int):
+        self._state = state
+        self.id = player_id
+        self.landmarks = ArrayRowView(
+            landmarks_tuple,
+            card_id_dict,
+            state.owned[player_id],
+            cast=bool,
+            validate=_validated_flag,
+            setter=partial(state.set_owned, player_id),
+        )
+        self.major_establishments = ArrayRowView(
+            major_establishments_tuple,
+            card_id_dict,
+            state.owned[player_id],
+            cast=bool,
+            validate=_validated_flag,
+            setter=partial(state.set_owned, player_id),
+        )
+        self.establishments = EstablishmentsView(state, player_id)
+
+    @property
+    def coins(self) -> int:
+        return int(self._state.coins[self.id])
+
+    @coins.setter
+    def coins(self, value: int) -> None:
+        self._state.coins[self.id] = _validated_count(value, "coins")
+
+    @property
+    def is_first_turn(self) -> bool:
+        return bool(self._state.is_first_turn[self.id])
+
+    @is_first_turn.setter
+    def is_first_turn(self, value: bool) -> None:
+        self._state.is_first_turn[self.id] = _validated_flag(value, "is_first_turn")
+
+    def to_model(self) -> Any:
+        """Copy the player into a validated ``models.Player``."""
+        from models import EstablishmentCount, Player
+
+        return Player(
+            id=self.id,
+            coins=self.coins,
+            major_establishments=dict(self.major_establishments),
+            landmarks=dict(self.landmarks),
+            establishments={
+                name: EstablishmentCount(
+                    working=view.working, on_renovation=view.on_renovation
+                )
+                for name, view in self.establishments.items()
+            },
+            is_first_turn=self.is_first_turn,
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"PlayerView(id={self.id}, coins={self.coins}, "
+            f"landmarks={self.landmarks!r}, establishments={self.establishments!r})"
+        )
+
+
+class PlayersView(Mapping[int, PlayerView]):
+    """``{player_id: PlayerView}`` over a ``GameState``."""
+
+    __slots__ = ("_views",)
+
+    def __init__(self, state: GameState):
+        self._views: Dict[int, PlayerView] = {
+            player_id: PlayerView(state, player_id)
+            for player_id in range(state.n_players)
+        }
+
+    def __getitem__(self, player_id: int) -> PlayerView:
+        return self._views[player_id]
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._views)
+
+    def __len__(self) -> int:
+        return len(self._views)
@@ -0,0 +1,223 @@
+"""Streaming statistics over game summaries, in constant memory.
+
+``StrategyStats`` folds ``GameSummary`` objects in as games finish and
+keeps only fixed-size counters, so it costs the same for a thousand games as
+for a hundred million. It tracks the win rate of players who owned each
+card by their ``T``-th turn, what players bought at each position of their
+purchase order, a histogram of game lengths and the win rate of each seat.
+Counters add up, so the stats of workers ``merge`` exactly, see
+``collect_strategy_stats``.
+
+Rates come as ``Estimate`` objects with a Wilson score interval, which
+stays sensible for rare cards and rates close to 0 or 1.
+"""
+
+import math
+import multiprocessing
+import os
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from frozendict import frozendict
+
+from constants import cards_tuple, starting_buildings_dict
+from simulate import GameSummary, chunk_tasks, play_chunk
+from state import N_CARDS
+
+# 95% two-sided
+Z_95 = 1.959963984540054
+
+
+class Estimate(NamedTuple):
+    """A rate measured over ``n`` trials and its confidence interval."""
+
+    value: float
+    low: float
+    high: float
+    n: int
+
+
+def wilson_interval(successes: int, trials: int, z: float = Z_95) -> Estimate:
+    if trials == 0:
+        return Estimate(0.0, 0.0, 1.0, 0)
+    rate = successes / trials
+    denominator = 1 + z * z / trials
+    center = (rate + z * z / (2 * trials)) / denominator
+    margin = (
+        z * math.sqrt(rate * (1 - rate) / trials + z * z / (4 * trials * trials))
+    ) / denominator
+    return Estimate(rate, max(0.0, center - margin), min(1.0, center + margin), trials)
+
+
+class StrategyStats:
+    """Online counters over the summaries of ``n_players`` games.
+
+    ``by_turns`` are the turns ``T`` at which card ownership is looked at,
+    counted in the player's own turns. ``order_depth`` purchases of each
+    player are tallied by position. Games longer than ``max_turns`` share
+    the histogram's last bin.
+    """
+
+    def __init__(
+        self,
+        n_players: int,
+        by_turns: Sequence[int] = (5, 10, 15, 20),
+        order_depth: int = 16,
+        max_turns: int = 1000,
+    ):
+        self.n_players = n_players
+        self.by_turns = tuple(by_turns)
+        self.order_depth = order_depth
+        self.max_turns = max_turns
+        self.n_games = 0
+        self.seat_wins = np.zeros(n_players, dtype=np.int64)
+        # owners[t, card_id] counts players that owned the card by their
+        # by_turns[t]-th turn, owner_wins those of them who won
+        self.owners = np.zeros((len(self.by_turns), N_CARDS), dtype=np.int64)
+        self.owner_wins = np.zeros((len(self.by_turns), N_CARDS), dtype=np.int64)
+        # purchase_order[k, card_id] counts k-th purchases of the card
+        self.purchase_order = np.zeros((order_depth, N_CARDS), dtype=np.int64)
+        self.winner_purchase_order = np.zeros((order_depth, N_CARDS), dtype=np.int64)
+        self.length_histogram = np.zeros(max_turns + 1, dtype=np.int64)
+        # exact, for the mean and variance of game lengths
+        self.total_turns = 0
+        self.total_squared_turns = 0
+        self._turns = np.array(self.by_turns, dtype=np.int64)[:, None, None]
+        self._positions = np.arange(order_depth)
+
+    def add(self, summary: GameSummary) -> None:
+        winner = summary.winner
+        self.n_games += 1
+        self.seat_wins[winner] += 1
+        turns = summary.turns
+        self.length_histogram[min(turns, self.max_turns)] += 1
+        self.total_turns += turns
+        self.total_squared_turns += turns * turns
+
+        owned = summary.first_owned_turns() <= self._turns
+        self.owners += owned.sum(axis=1)
+        self.owner_wins += owned[:, winner]
+
+        for player_id, order in enumerate(summary.purchase_order):
+            card_ids = np.frombuffer(order[: self.order_depth], dtype=np.uint8)
+            positions = self._positions[: len(card_ids)]
+            self.purchase_order[positions, card_ids] += 1
+            if player_id == winner:
+                self.winner_purchase_order[positions, card_ids] += 1
+
+    def merge(self, other: "StrategyStats") -> None:
+        if (other.n_players, other.by_turns, other.order_depth, other.max_turns) != (
+            self.n_players,
+            self.by_turns,
+            self.order_depth,
+            self.max_turns,
+        ):
+            raise ValueError("cannot merge stats collected with other settings")
+        self.n_games += other.n_games
+        self.seat_wins += other.seat_wins
+        self.owners += other.owners
+        self.owner_wins += other.owner_wins
+        self.purchase_order += other.purchase_order
+        self.winner_purchase_order += other.winner_purchase_order
+        self.length_histogram += other.length_histogram
+        self.total_turns += other.total_turns
+        self.total_squared_turns += other.total_squared_turns
+
+    def seat_win_rates(self) -> List[Estimate]:
+        return [wilson_interval(int(wins), self.n_games) for wins in self.seat_wins]
+
+    def first_player_advantage(self) -> Estimate:
+        """How much more often the first player wins than a fair ``1 / n_players``."""
+        first = wilson_interval(int(self.seat_wins[0]), self.n_games)
+        fair = 1 / self.n_players
+        return Estimate(first.value - fair, first.low - fair, first.high - fair, first.n)
+
+    def card_win_rates(self, by_turn: int) -> Dict[str, Estimate]:
+        """The win rate of players who owned each card by their ``by_turn``-th
+        turn, ``by_turn`` being one of ``by_turns``; cards nobody owned are
+        left out."""
+        t = self.by_turns.index(by_turn)
+        return {
+            cards_tuple[card_id]: wilson_interval(
+                int(self.owner_wins[t, card_id]), int(self.owners[t, card_id])
+            )
+            for card_id in range(N_CARDS)
+            if self.owners[t, card_id]
+        }
+
+    def purchase_frequencies(self, position: int, winners: bool = False) -> Dict[str, float]:
+        """How often each card is a player's ``position``-th purchase (from 0),
+        among players who made that many purchases."""
+        counts = (self.winner_purchase_order if winners else self.purchase_order)[position]
+        total = counts.sum()
+        return {
+            cards_tuple[card_id]: count / total
+            for card_id, count in enumerate(counts.tolist())
+            if count
+        }
+
+    @property
+    def mean_turns(self) -> float:
+        return self.total_turns / self.n_games if self.n_games else 0.0
+
+    def mean_turns_interval(self, z: float = Z_95) -> Tuple[float, float]:
+        if self.n_games < 2:
+            return (self.mean_turns, self.mean_turns)
+        n = self.n_games
+        variance = (self.total_squared_turns - self.total_turns**2 / n) / (n - 1)
+        margin = z * math.sqrt(max(variance, 0.0) / n)
+        return (self.mean_turns - margin, self.mean_turns + margin)
+
+    def turns_quantile(self, q: float) -> int:
+        """The smallest length at least a ``q`` share of games did not exceed;
+        ``max_turns`` stands for longer games."""
+        cumulative = np.cumsum(self.length_histogram)
+        return int(np.searchsorted(cumulative, q * self.n_games))
+
+
+def _stats_chunk(task: Tuple[tuple, tuple]) -> StrategyStats:
+    chunk_task, settings = task
+    stats = StrategyStats(chunk_task[3], *settings)
+    summaries, _ = play_chunk(chunk_task)
+    for summary in summaries:
+        stats.add(summary)
+    return stats
+
+
+def collect_strategy_stats(
+    n_games: int,
+    n_players: int,
+    workers: Optional[int] = None,
+    starting_buildings: frozendict = starting_buildings_dict,
+    starting_major_establishments: tuple = (),
+    seed: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+    by_turns: Sequence[int] = (5, 10, 15, 20),
+    order_depth: int = 16,
+    max_turns: int = 1000,
+) -> StrategyStats:
+    """Play games as ``simulate_many`` does; every chunk is folded into
+    ``StrategyStats`` in its worker and only the counters come back."""
+    workers = workers or os.cpu_count() or 1
+    settings = (tuple(by_turns), order_depth, max_turns)
+    tasks = (
+        (task, settings)
+        for task in chunk_tasks(
+            n_games,
+            n_players,
+            workers,
+            starting_buildings,
+            starting_major_establishments,
+            seed,
+            chunk_size,
+        )
+    )
+    stats = StrategyStats(n_players, *settings)
+    if workers == 1:
+        for task in tasks:
+            stats.merge(_stats_chunk(task))
+        return stats
+    with multiprocessing.Pool(workers) as pool:
+        for chunk_stats in pool.imap_unordered(_stats_chunk, tasks):
+            stats.merge(chunk_stats)
+    return stats
@@ -1,12 +1,88 @@
+import asyncio
+import time
+import tracemalloc
+
+import numpy as np
+import pytest
 from frozendict import frozendict
 
+from async_game import play_games_async, take_turn_async
+from batched import STATE_FIELDS, BatchedMachiKoroGame
+from benchmark import (
+    ENGINE_MODULES,
+    bench_imports,
+    compare,
+    import_cost,
+    run_benchmarks,
+    to_json,
+)
+from broker import InferenceBroker, play_games_brokered
 from constants import (
+    building_cost_dict,
+    card_id_dict,
+    cards_tuple,
+    establishments_tuple,
+    landmarks_tuple,
     major_establishments_tuple,
     primary_industry_dict,
     restaurants_tuple,
     secondary_industry_dict,
 )
-from game import MachiKoroGame
+from dataset import (
+    KIND_IDS,
+    DatasetWriter,
+    _npy_header,
+    _RowRecorder,
+    generate_dataset,
+    open_dataset,
+    play_game_rows,
+    row_dtype,
+    seat_order,
+)
+from env import PASS_ACTION, MachiKoroEnv, MachiKoroVectorEnv
+from events import (
+    BinaryEventWriter,
+    EventRecorder,
+    IncomeEvent,
+    JsonlEventWriter,
+    PurchaseEvent,
+    StealEvent,
+    _BufferedFileSink,
+    read_binary_events,
+    read_jsonl_events,
+)
+from game import LANDMARK_IDS, MachiKoroGame, play_games_batched
+from income import OUTCOME_ROLLS, income_distribution
+from mcts import MCTSPolicy, search
+from models import EstablishmentCount, Player
+from policy import DECISION_KINDS, PURCHASE, TARGET, Decision, RandomPolicy
+from profiler import GameProfiler
+from replay import (
+    GameRecorder,
+    ReplayCheckpoints,
+    ReplayPolicy,
+    ReplayReader,
+    ReplayWriter,
+)
+from rng import GameRandom, SeedSequence
+from server import BotClient, GameServer, http_json, load_test
+from simulate import (
+    NEVER_OWNED,
+    TournamentStats,
+    iter_summaries,
+    play_summarized_game,
+    simulate_many,
+)
+from state import CARD_BITMASKS, GameState
+from stats import StrategyStats, collect_strategy_stats, wilson_interval
+from websocket import (
+    CLOSE,
+    TEXT,
+    WebSocketError,
+    connect,
+    encode_frame,
+    read_frame,
+)
 
 
 def test_reverse_order_2_0():
@@ -180,3 +256,1089 @@ def test_game_5_all_buildings():
             starting_major_establishments=starting_major_establishments,
         )
         game.play_game()
+
+
+def test_players_view_reads_and_writes_state():
+    game = MachiKoroGame(n_players=2)
+    player = game.players[0]
+    assert player.coins == 3
+    assert player.establishments["wheat_field"] == EstablishmentCount(
+        working=1, on_renovation=0
+    )
+    assert "ranch" not in player.establishments
+    assert not any(player.landmarks.values())
+
+    player.establishments["wheat_field"].working += 2
+    player.establishments["ranch"] = EstablishmentCount(working=0, on_renovation=1)
+    player.landmarks["harbor"] = True
+    player.coins -= 1
+    assert game.state.working[0, card_id_dict["wheat_field"]] == 3
+    assert game.state.on_renovation[0, card_id_dict["ranch"]] == 1
+    assert game.state.owned[0, card_id_dict["harbor"]] == 1
+    assert game.state.coins[0] == 2
+
+    player.establishments.pop("ranch")
+    assert list(player.establishments) == ["wheat_field", "bakery"]
+    assert player.to_model().establishments["wheat_field"].working == 3
+
+
+def test_state_layout_tiles_the_buffer():
+    for n_players in range(2, 6):
+        offset = 0
+        for name, (start, shape) in GameState.layout(n_players).items():
+            assert start == offset, name
+            offset += int(np.prod(shape))
+        assert GameState.size(n_players) == offset
+        layout = GameState.layout(n_players)
+        assert list(layout)[-len(CARD_BITMASKS) :] == list(CARD_BITMASKS)
+        assert GameState.n_features(n_players) == layout[CARD_BITMASKS[0]][0]
+
+
+def test_players_view_rejects_negative_counts():
+    game = MachiKoroGame(n_players=2)
+    with pytest.raises(ValueError):
+        game.players[1].coins = -1
+    with pytest.raises(ValueError):
+        game.players[1].establishments["bakery"].working -= 2
+    assert game.players[1].establishments["bakery"].working == 1
+
+
+def test_batched_activation_matches_game():
+    # cards that draw random targets or dice are left out
+    random_cards = {"tuna_boat", "moving_company", "renovation_company", "business_center"}
+    starting_establishments = frozendict(
+        {
+            key: (2, 1)
+            for key in list(primary_industry_dict.keys())
+            + list(secondary_industry_dict.keys())
+            + list(restaurants_tuple)
+            if key not in random_cards
+        }
+    )
+    starting_major_establishments = tuple(
+        key for key in major_establishments_tuple if key not in random_cards
+    )
+    for current_player_id in range(3):
+        for roll in range(1, 15):
+            game = MachiKoroGame(
+                n_players=3,
+                starting_buildings=starting_establishments,
+                starting_major_establishments=starting_major_establishments,
+            )
+            for player_id, coins in enumerate((0, 7, 12)):
+                game.players[player_id].coins = coins
+                game.players[player_id].landmarks["harbor"] = True
+            game.players[1].landmarks["shopping_mall"] = True
+            batched = BatchedMachiKoroGame(n_games=2, n_players=3)
+            batched.load_game(1, game)
+
+            game.activate_cards(current_player_id, roll)
+            batched.activate_cards(
+                np.array([0, current_player_id]),
+                np.array([0, roll]),
+                np.array([False, True]),
+            )
+            exported = batched.export_game(1)
+            for name in STATE_FIELDS:
+                assert (getattr(exported.state, name) == getattr(game.state, name)).all(), (
+                    current_player_id,
+                    roll,
+                    name,
+                )
+
+
+def test_batched_games_finish():
+    batched = BatchedMachiKoroGame(n_games=64, n_players=4, seed=0)
+    batched.play_games(64)
+    assert batched.games_finished >= 64
+    assert batched.wins.sum() == batched.games_finished
+    assert (batched.coins >= 0).all()
+    assert (batched.working >= 0).all() and (batched.on_renovation >= 0).all()
+
+
+def test_events_account_for_every_coin():
+    starting_establishments = frozendict(
+        {
+            key: (1, 1)
+            for key in list(primary_industry_dict.keys())
+            + list(secondary_industry_dict.keys())
+            + list(restaurants_tuple)
+        }
+    )
+    for _ in range(10):
+        recorder = EventRecorder()
+        game = MachiKoroGame(
+            n_players=3,
+            starting_buildings=starting_establishments,
+            starting_major_establishments=major_establishments_tuple,
+            events=recorder,
+        )
+        game.play_game()
+        expected_coins = [3] * 3
+        for event in recorder.events:
+            if isinstance(event, IncomeEvent):
+                expected_coins[event.player_id] += event.coins
+            elif isinstance(event, StealEvent):
+                expected_coins[event.from_player_id] -= event.coins
+                expected_coins[event.to_player_id] += event.coins
+            elif isinstance(event, PurchaseEvent):
+                expected_coins[event.player_id] -= event.cost
+        for player_id in range(3):
+            expected_coins[player_id] -= game.tech_startups[player_id]
+            assert game.players[player_id].coins == expected_coins[player_id]
+        (game_over,) = recorder.of_kind("game_over")
+        assert recorder.events[-1] == game_over
+        assert len(recorder.of_kind("landmark_built")) >= len(LANDMARK_IDS)
+
+
+def test_event_writers_round_trip(tmp_path):
+    recorder = EventRecorder()
+    game = MachiKoroGame(n_players=2, events=recorder)
+    game.play_game()
+    with JsonlEventWriter(tmp_path / "events.jsonl", buffer_size=256) as jsonl:
+        with BinaryEventWriter(tmp_path / "events.bin", buffer_size=256) as binary:
+            for event in recorder.events:
+                jsonl.emit(event)
+                binary.emit(event)
+    assert list(read_jsonl_events(tmp_path / "events.jsonl")) == recorder.events
+    assert list(read_binary_events(tmp_path / "events.bin")) == recorder.events
+
+    class NoEncoding(_BufferedFileSink):
+        pass
+
+    with pytest.raises(TypeError):
+        NoEncoding(tmp_path / "never.bin")
+    assert not (tmp_path / "never.bin").exists()
+
+
+def test_seeded_games_are_reproducible():
+    def play(seed):
+        recorder = EventRecorder()
+        MachiKoroGame(n_players=4, events=recorder, seed=seed).play_game()
+        return recorder.events
+
+    assert play(7) == play(7)
+    assert play(7) != play(8)
+
+    children = SeedSequence(123).spawn(3)
+    first_run = [play(child) for child in children]
+    child = children[2]
+    assert play(SeedSequence(child.entropy, child.spawn_key)) == first_run[2]
+    assert first_run[0] != first_run[1]
+
+
+def test_game_random_dice_are_uniform():
+    rng = GameRandom(0, dice_buffer_size=64)
+    rolls = [rng.roll_die() for _ in range(60000)]
+    assert set(rolls) == {1, 2, 3, 4, 5, 6}
+    for face in range(1, 7):
+        assert abs(rolls.count(face) - 10000) < 500
+
+
+def test_renovated_establishments_reopen_when_rolled():
+    game = MachiKoroGame(n_players=2, seed=0)
+    game.state.working[1, card_id_dict["wheat_field"]] = 1
+    game.state.on_renovation[1, card_id_dict["wheat_field"]] = 2
+    game.activate_cards(0, 5)
+    assert game.players[1].establishments["wheat_field"].on_renovation == 2
+    game.activate_cards(0, 1)
+    # only the working copy pays, the renovated ones reopen
+    assert game.players[1].coins == 4
+    assert game.players[1].establishments["wheat_field"].working == 3
+    assert game.players[1].establishments["wheat_field"].on_renovation == 0
+
+
+def test_simulate_many_is_independent_of_workers_and_chunks():
+    in_process = simulate_many(n_games=24, n_players=3, workers=1, seed=5)
+    pooled = simulate_many(n_games=24, n_players=3, workers=2, seed=5, chunk_size=5)
+    assert in_process.n_games == pooled.n_games == 24
+    assert in_process.wins == pooled.wins
+    assert in_process.total_turns == pooled.total_turns
+    assert in_process.purchases == pooled.purchases
+    assert sum(map(sum, in_process.landmarks_built)) >= 24 * len(LANDMARK_IDS)
+
+    halves = TournamentStats(n_players=3)
+    for start in (0, 12):
+        half = TournamentStats(n_players=3)
+        for summary in iter_summaries(n_games=24, n_players=3, workers=1, seed=5):
+            if start <= summary.game_index < start + 12:
+                half.add(summary)
+        halves.merge(half)
+    assert halves.__dict__ == in_process.__dict__
+
+
+def test_game_summary_replays_from_its_index():
+    (summary,) = [
+        summary
+        for summary in iter_summaries(n_games=3, n_players=2, workers=1, seed=9)
+        if summary.game_index == 2
+    ]
+    assert play_summarized_game(2, 2, SeedSequence(9, (2,))) == summary
+
+
+def test_env_mask_matches_possible_purchases():
+    env = MachiKoroEnv(n_players=3, agent_id=1)
+    observation, info = env.reset(seed=3)
+    assert observation.dtype == np.float32
+    assert observation.shape == env.observation_space.shape
+    rng = np.random.default_rng(0)
+    terminated = truncated = False
+    while not (terminated or truncated):
+        mask = env.action_masks()
+        possible = env.game.get_possible_purchases(1)
+        assert [cards_tuple[i] for i in np.flatnonzero(mask[:-1])] == possible
+        assert mask[PASS_ACTION] and info["action_mask"] is mask
+        assert (observation == env.game.state.buffer[: len(observation)]).all()
+        action = rng.choice(np.flatnonzero(mask))
+        next_observation, reward, terminated, truncated, info = env.step(action)
+        assert next_observation is observation
+    assert reward in (-1.0, 1.0)
+
+    # the mask is filled in place, without new arrays
+    env.reset(seed=4)
+    assert (env.game.purchase_mask(1) == env.action_masks()[:-1]).all()
+    tracemalloc.start()
+    for _ in range(100):
+        env._update_mask()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert peak < 1024
+
+
+def test_env_plays_disallowed_actions_as_pass():
+    env = MachiKoroEnv(n_players=2)
+    env.reset(seed=0)
+    disallowed = int(np.flatnonzero(~env.action_masks())[0])
+    market_before = env.game.state.market.copy()
+    owned_before = env.game.state.owned.copy()
+    env.step(disallowed)
+    assert env.game.state.market[disallowed] == market_before[disallowed]
+    assert env.game.state.owned[0, disallowed] == owned_before[0, disallowed]
+
+
+def test_vector_env_steps_and_autoresets():
+    envs = MachiKoroVectorEnv(num_envs=4, n_players=2)
+    observations, infos = envs.reset(seed=1)
+    assert observations.shape == (4, GameState.n_features(2))
+    rng = np.random.default_rng(0)
+    finished = 0
+    for _ in range(300):
+        masks = envs.action_masks()
+        for game, mask in zip(envs.games, masks):
+            possible = game.get_possible_purchases(0)
+            assert [cards_tuple[i] for i in np.flatnonzero(mask[:-1])] == possible
+        actions = np.array([rng.choice(np.flatnonzero(mask)) for mask in masks])
+        observations, rewards, terminations, truncations, infos = envs.step(actions)
+        n_features = observations.shape[1]
+        for index, game in enumerate(envs.games):
+            assert (observations[index] == game.state.buffer[:n_features]).all()
+        finished += int(terminations.sum())
+        assert (infos["_final_obs"] == terminations | truncations).all()
+        expected_rewards = np.where(infos["winner"] == 0, 1.0, -1.0)
+        assert (rewards[terminations] == expected_rewards[terminations]).all()
+    assert finished > 0
+
+
+class RecordingPolicy(RandomPolicy):
+    def __init__(self):
+        self.decisions = []
+
+    def choose(self, decision):
+        self.decisions.append(decision)
+        return super().choose(decision)
+
+
+class CountingBatchPolicy(RandomPolicy):
+    def __init__(self):
+        self.batch_sizes = []
+
+    def choose_batch(self, decisions):
+        self.batch_sizes.append(len(decisions))
+        return super().choose_batch(decisions)
+
+
+def test_policies_get_every_decision_with_a_read_only_view():
+    policies = [RecordingPolicy() for _ in range(3)]
+    game = MachiKoroGame(
+        3,
+        starting_buildings=frozendict(
+            {
+                key: (1, 1)
+                for key in list(primary_industry_dict)
+                + list(secondary_industry_dict)
+                + list(restaurants_tuple)
+            }
+        ),
+        starting_major_establishments=major_establishments_tuple,
+        seed=2,
+        policies=policies,
+    )
+    game.play_game()
+    for player_id, policy in enumerate(policies):
+        kinds = {decision.kind for decision in policy.decisions}
+        assert {PURCHASE, TARGET} <= kinds <= set(DECISION_KINDS)
+        for decision in policy.decisions:
+            assert decision.player_id == player_id
+            assert decision.view is game.view
+        targets = [d.options for d in policy.decisions if d.kind == TARGET]
+        assert all(player_id not in options for options in targets)
+    with pytest.raises(ValueError):
+        game.view.coins[0] = 100
+
+
+def test_illegal_choices_are_rejected():
+    class Stubborn(RandomPolicy):
+        def choose(self, decision):
+            return "airport" if decision.kind == PURCHASE else super().choose(decision)
+
+    game = MachiKoroGame(2, seed=0, policies=[Stubborn(), Stubborn()])
+    with pytest.raises(ValueError):
+        game.take_turn()
+
+
+def test_batched_policy_answers_many_games_per_call():
+    games = [MachiKoroGame(2, seed=seed) for seed in range(16)]
+    policy = CountingBatchPolicy()
+    winners = play_games_batched(games, policy)
+    for game, winner in zip(games, winners):
+        assert game.is_game_over() == (True, winner)
+    assert policy.batch_sizes[0] == 16
+    assert len(policy.batch_sizes) < sum(policy.batch_sizes) / 4
+
+
+def test_snapshot_restore_returns_to_the_same_state():
+    game = MachiKoroGame(3, seed=4)
+    for _ in range(20):
+        game.take_turn()
+    snapshot = game.snapshot()
+    buffer = game.state.buffer.copy()
+    player, turn = game.current_player, game.current_turn
+    for _ in range(20):
+        game.take_turn()
+    game.restore(snapshot)
+    assert (game.state.buffer == buffer).all()
+    assert (game.current_player, game.current_turn) == (player, turn)
+    game.start_turn()
+    game.restore(snapshot)
+    with pytest.raises(RuntimeError):
+        game.finish_turn(None)
+
+
+def test_clone_with_copied_rng_replays_the_original():
+    game = MachiKoroGame(4, seed=8)
+    for _ in range(10):
+        game.take_turn()
+    clone = game.clone(game.rng.copy())
+    game.play_game()
+    clone.play_game()
+    assert clone.state.buffer is not game.state.buffer
+    assert (clone.state.buffer == game.state.buffer).all()
+    assert clone.current_turn == game.current_turn
+    assert clone.players[0].coins == game.players[0].coins
+
+
+def _purchase_decision(game):
+    turn = game.play_turn()
+    decision = next(turn)
+    while decision.kind != PURCHASE:
+        decision = turn.send(game._choose(decision))
+    return decision
+
+
+def test_mcts_search_leaves_the_game_untouched():
+    game = MachiKoroGame(3, seed=5)
+    for _ in range(12):
+        game.take_turn()
+    decision = _purchase_decision(game)
+    buffer = game.state.buffer.copy()
+    policy = MCTSPolicy(iterations=30, max_rollout_turns=20, seed=1)
+    stats = policy.search(decision)
+    assert (game.state.buffer == buffer).all()
+    assert set(stats) == set(decision.options)
+    assert sum(visits for visits, _ in stats.values()) == 30
+    assert policy.choose(decision) in decision.options
+
+
+def test_mcts_root_parallel_search_sums_workers():
+    game = MachiKoroGame(2, seed=6)
+    for _ in range(8):
+        game.take_turn()
+    decision = _purchase_decision(game)
+    with MCTSPolicy(iterations=20, max_rollout_turns=10, workers=2, seed=2) as policy:
+        stats = policy.search(decision)
+    assert sum(visits for visits, _ in stats.values()) == 20
+
+
+def test_mcts_workers_search_the_game_as_it_was_set_up():
+    game, _ = _all_buildings_game(3, None)
+    for _ in range(6):
+        game.take_turn()
+    decision = _purchase_decision(game)
+    with MCTSPolicy(iterations=20, max_rollout_turns=10, workers=2, seed=2) as policy:
+        stats = policy.search(decision)
+    # what each worker searches, from the seeds the policy hands out
+    seeds = SeedSequence(2)
+    seeds.spawn(1)
+    expected = {}
+    for seed in seeds.spawn(2):
+        worker_stats = search(
+            game.clone(), decision, 10, max_rollout_turns=10, rng=GameRandom(seed)
+        )
+        for option, (visits, value) in worker_stats.items():
+            total_visits, total_value = expected.get(option, (0, 0.0))
+            expected[option] = (total_visits + visits, total_value + value)
+    assert stats == expected
+
+
+def test_counters_follow_purchases_trades_and_demolitions():
+    for seed in range(5):
+        game = MachiKoroGame(
+            3,
+            starting_buildings=frozendict(
+                {
+                    key: (1, 1)
+                    for key in list(primary_industry_dict)
+                    + list(secondary_industry_dict)
+                    + list(restaurants_tuple)
+                }
+            ),
+            starting_major_establishments=major_establishments_tuple,
+            seed=seed,
+        )
+        for _ in range(60):
+            game.take_turn()
+            icons = game.state.icons.copy()
+            game.state.recount_icons()
+            assert (game.state.icons == icons).all()
+            landmark_bits = game.state.landmark_bits.copy()
+            n_landmarks = game.state.n_landmarks.copy()
+            game.state.recount_landmarks()
+            assert (game.state.landmark_bits == landmark_bits).all()
+            assert (game.state.n_landmarks == n_landmarks).all()
+            purchase_bits = [game.purchase_bits(i) for i in range(3)]
+            game.state.recount_purchase_bits()
+            assert [game.purchase_bits(i) for i in range(3)] == purchase_bits
+
+
+def test_establishment_views_update_icon_counters():
+    game = MachiKoroGame(2)
+    establishments = game.players[0].establishments
+    establishments["ranch"] = EstablishmentCount(working=2, on_renovation=1)
+    establishments["wheat_field"].on_renovation = 2
+    establishments.pop("bakery")
+    assert game.state.icons[0].tolist() == [3, 3, 0, 0, 0]
+
+
+def test_landmark_views_update_landmark_counters():
+    game = MachiKoroGame(2)
+    landmarks = game.players[1].landmarks
+    for card in landmarks_tuple:
+        landmarks[card] = True
+    assert game.count_landmarks(1) == len(landmarks_tuple)
+    assert game.is_game_over() == (True, 1)
+    landmarks["harbor"] = False
+    landmarks["harbor"] = False
+    assert game.count_landmarks(1) == len(landmarks_tuple) - 1
+    assert game.is_game_over() == (False, -1)
+
+
+def test_purchase_bits_follow_the_market_views():
+    game = MachiKoroGame(2)
+    game.players[0].coins = 30
+    assert game.purchase_mask(0).tolist() == [
+        card in game.get_possible_purchases(0) for card in cards_tuple
+    ]
+    game.market["airport"] = 0
+    game.players[0].major_establishments["stadium"] = True
+    possible = game.get_possible_purchases(0)
+    assert "airport" not in possible and "stadium" not in possible
+    game.market["airport"] = 1
+    assert "airport" in game.get_possible_purchases(0)
+
+
+def test_income_distribution_matches_activate_cards():
+    for seed in range(20):
+        game = MachiKoroGame(3, seed=seed)
+        for _ in range(5 * seed):
+            game.take_turn()
+        distribution = income_distribution(game.state)
+        for roller in range(3):
+            assert distribution.probabilities[0, roller].sum() == pytest.approx(1)
+            for outcome, roll in enumerate(OUTCOME_ROLLS.tolist()[:12]):
+                if game.state.working[roller, card_id_dict["moving_company"]]:
+                    continue
+                fork = game.clone(game.rng.copy())
+                fork.activate_cards(roller, roll)
+                fork.state.coins[roller] = max(fork.state.coins[roller], 1)
+                deltas = fork.state.coins - game.state.coins
+                assert deltas.tolist() == distribution.deltas[0, roller, outcome].tolist()
+
+
+def test_income_distribution_dice_choices():
+    game = MachiKoroGame(2, starting_buildings=frozendict({"mine": (1, 0)}))
+    game.state.is_first_turn[:] = 0
+    game.state.coins[:] = 10
+    distribution = income_distribution(game.state, 0, ("train_station", None))
+    assert distribution.num_dice[:, 0].tolist() == [2, 1]
+    assert distribution.expected()[:, 0, 0] == pytest.approx([5 * 4 / 36, 0])
+    game.state.coins[0] = 22
+    distribution = income_distribution(game.state, 0, ("radio_tower",))
+    # one die never rolls a 9, so there is nothing to reroll for
+    assert not distribution.rerolls.any()
+
+
+def test_income_distribution_is_a_point_mass_on_a_first_turn():
+    game = MachiKoroGame(4)
+    distribution = income_distribution(game.view, 0, game.get_possible_purchases(0))
+    rolls = OUTCOME_ROLLS[distribution.probabilities.argmax(axis=-1)]
+    assert (rolls == 0).all()
+    expected = distribution.expected()
+    assert (expected[:, 1:] == 0).all()
+    # only the city hall coin, for purchases that spend every coin
+    costs = [building_cost_dict[card] for card in distribution.purchases]
+    assert expected[:, 0, 0].tolist() == [float(cost == 3) for cost in costs]
+
+
+def _record_games(n_games, coins=True, seed=0):
+    records = []
+    for seed in range(seed, seed + n_games):
+        game = MachiKoroGame(
+            3,
+            seed=seed,
+            starting_major_establishments=("tech_startup", "business_center"),
+        )
+        recorder = GameRecorder(game, coins=coins)
+        game.play_game()
+        records.append(recorder.game_record())
+    return records
+
+
+def test_replay_shards_round_trip(tmp_path):
+    records = _record_games(5)
+    records[1] = records[1]._replace(coins=None)
+    with ReplayWriter(tmp_path, games_per_shard=2) as writer:
+        for record in records:
+            writer.write(record)
+    assert len(list(tmp_path.glob("*.bin"))) == 3
+    with ReplayReader(tmp_path) as reader:
+        assert len(reader) == 5
+        assert reader[-1].seed.spawn_key == records[-1].seed.spawn_key
+        for record, read in zip(records, reader):
+            assert read._replace(coins=None) == record._replace(coins=None)
+            if record.coins is None:
+                assert read.coins is None
+            else:
+                assert (read.coins == record.coins).all()
+
+
+def test_replay_writer_numbers_shards_after_the_highest(tmp_path):
+    records = _record_games(2)
+    for number in (0, 2):
+        (tmp_path / f"replays-{number:05d}.bin").write_bytes(b"kept")
+    (tmp_path / "replays-old.bin").write_bytes(b"kept")
+    with ReplayWriter(tmp_path) as writer:
+        writer.write(records[0])
+    assert (tmp_path / "replays-00002.bin").read_bytes() == b"kept"
+    assert (tmp_path / "replays-00003.idx").exists()
+    with ReplayWriter(tmp_path) as writer:
+        writer._n_shards = 3
+        with pytest.raises(FileExistsError):
+            writer.write(records[1])
+
+
+def test_recorded_decisions_replay_the_game():
+    for record in _record_games(3):
+        policy = ReplayPolicy(record.decisions)
+        game = MachiKoroGame(
+            record.n_players,
+            seed=record.seed,
+            starting_buildings=record.starting_buildings,
+            starting_major_establishments=record.starting_major_establishments,
+            policies=[policy] * record.n_players,
+        )
+        coins = []
+        while not game.is_game_over()[0]:
+            game.take_turn()
+            coins.append(game.state.coins.tolist())
+        assert game.is_game_over() == (True, record.winner)
+        assert coins == record.coins.tolist()
+        assert policy.position == len(record.decisions)
+
+
+def test_replay_fast_forwards_to_a_turn():
+    (record,) = _record_games(1)
+    game = MachiKoroGame.replay(record, until_turn=40)
+    assert game.current_turn == 40
+    assert game.state.coins.tolist() == record.coins[39].tolist()
+    game.take_turn()
+    assert game.state.coins.tolist() == record.coins[40].tolist()
+    assert MachiKoroGame.replay(record).is_game_over() == (True, record.winner)
+
+
+def test_replay_starts_from_checkpoints():
+    (record,) = _record_games(1)
+    checkpoints = ReplayCheckpoints(record, every=25)
+    end = MachiKoroGame.replay(record, checkpoints=checkpoints)
+    assert len(checkpoints) == record.turns // 25
+    for turn in (0, 24, 25, 60, record.turns):
+        game = MachiKoroGame.replay(record, until_turn=turn, checkpoints=checkpoints)
+        expected = MachiKoroGame.replay(record, until_turn=turn)
+        assert game.snapshot() == expected.snapshot()
+    assert game.snapshot() == end.snapshot()
+    with pytest.raises(ValueError):
+        (other,) = _record_games(1, seed=1)
+        MachiKoroGame.replay(other, checkpoints=checkpoints)
+
+
+def test_benchmarks_compare_against_a_baseline():
+    results = run_benchmarks(scale=0.01, rounds=1, player_counts=(2,))
+    names = {result.name for result in results}
+    assert {"play_game/all_buildings/2p", "take_turn/default/2p"} <= names
+    assert {f"card/{card}" for card in major_establishments_tuple} <= names
+    assert all(result.rate > 0 for result in results)
+    baseline = to_json(results)
+    assert compare(results, baseline) == []
+    slower = [result._replace(rate=result.rate / 2) for result in results[:3]]
+    assert [regression.name for regression in compare(slower, baseline)] == list(
+        baseline["results"]
+    )[:3]
+
+
+def test_engine_imports_without_optional_dependencies():
+    results = bench_imports(ENGINE_MODULES + ("env",), rounds=1)
+    assert all(result.rate > 0 for result in results)
+    assert {result.name: result.loaded for result in results if result.loaded} == {
+        "import/env": ("gymnasium",)
+    }
+    assert import_cost("game")[1] == []
+    import game
+
+    assert game.Player is Player
+    with pytest.raises(AttributeError):
+        game.Validator
+
+
+def test_profiler_times_every_phase_and_card():
+    profiler = GameProfiler()
+    game = MachiKoroGame(
+        4,
+        starting_buildings=frozendict({card: (1, 1) for card in establishments_tuple}),
+        starting_major_establishments=major_establishments_tuple,
+        seed=3,
+        profiler=profiler,
+    )
+    game.play_game()
+    turns = game.current_turn
+    assert profiler.phases["end_turn"][0] == turns
+    assert profiler.phases["purchase_options"][0] == turns
+    # first turns skip the roll and the activations
+    assert profiler.phases["roll"][0] == profiler.phases["red"][0] == turns - 4
+    assert profiler.phases["reroll"][0] <= turns - 4
+    assert profiler.cards["wheat_field"][0] > 0
+    assert all(nanoseconds >= 0 for _, nanoseconds in profiler.phases.values())
+    # forks are not profiled
+    assert game.clone().profiler is None
+    assert "end_turn" in profiler.report()
+
+
+def test_profiler_times_resumed_turns_from_their_start():
+    profiler = GameProfiler()
+    game = MachiKoroGame(2, seed=1, profiler=profiler)
+    for _ in range(4):
+        game.take_turn()
+    decision = _purchase_decision(game)
+    snapshot = game.snapshot()
+    time.sleep(0.05)
+    purchase = profiler.phases["purchase"][1]
+    game.restore(snapshot)
+    turn = game.resume_turn(decision, decision.options[-1])
+    with pytest.raises(StopIteration):
+        pending = next(turn)
+        while True:
+            pending = turn.send(game._choose(pending))
+    assert profiler.phases["purchase"][1] - purchase < 25_000_000
+
+
+def test_profilers_merge_across_workers():
+    in_process, pooled = GameProfiler(), GameProfiler()
+    simulate_many(n_games=12, n_players=3, workers=1, seed=5, profiler=in_process)
+    simulate_many(n_games=12, n_players=3, workers=2, seed=5, profiler=pooled)
+    calls = {phase: counters[0] for phase, counters in in_process.phases.items()}
+    assert calls == {phase: counters[0] for phase, counters in pooled.phases.items()}
+    assert {card: c[0] for card, c in in_process.cards.items()} == {
+        card: c[0] for card, c in pooled.cards.items()
+    }
+
+
+def test_summaries_keep_first_ownership_and_purchase_order():
+    summary = play_summarized_game(0, 3, SeedSequence(4, (0,)))
+    first_owned = summary.first_owned_turns()
+    for player_id in range(3):
+        order = summary.purchase_order[player_id]
+        assert sorted(order) == [
+            card_id
+            for card_id, count in enumerate(summary.purchase_counts(player_id))
+            for _ in range(count)
+        ]
+        assert first_owned[player_id, card_id_dict["wheat_field"]] == 0
+        for card_id in order:
+            assert first_owned[player_id, card_id] < NEVER_OWNED
+    assert (first_owned[summary.winner, LANDMARK_IDS] < NEVER_OWNED).all()
+
+
+def test_summaries_count_past_a_byte(monkeypatch):
+    # a long game buying the same card every turn, as one can with a
+    # landmark that keeps being demolished
+    def take_turn(game):
+        game.current_turn += 1
+        game.current_player = (game.current_player + 1) % game.n_players
+        return "wheat_field"
+
+    monkeypatch.setattr(MachiKoroGame, "take_turn", take_turn)
+    monkeypatch.setattr(
+        MachiKoroGame, "is_game_over", lambda game: (game.current_turn >= 600, 1)
+    )
+    summary = play_summarized_game(0, 2, SeedSequence(1, (0,)))
+    wheat_field = card_id_dict["wheat_field"]
+    assert summary.purchase_counts(0)[wheat_field] == 300
+    assert summary.purchase_counts(1)[wheat_field] == 300
+
+
+def test_strategy_stats_merge_and_intervals():
+    pooled = collect_strategy_stats(
+        n_games=20, n_players=2, workers=2, seed=7, chunk_size=3, by_turns=(5, 10)
+    )
+    stats = StrategyStats(2, by_turns=(5, 10))
+    for summary in iter_summaries(n_games=20, n_players=2, workers=1, seed=7):
+        stats.add(summary)
+    for name, value in vars(stats).items():
+        assert np.array_equal(value, getattr(pooled, name)), name
+    assert stats.n_games == 20 and stats.length_histogram.sum() == 20
+    assert sum(rate.value for rate in stats.seat_win_rates()) == pytest.approx(1)
+    # everyone starts with a wheat field and the winners built every landmark
+    assert stats.card_win_rates(5)["wheat_field"].value == 0.5
+    assert sum(stats.purchase_frequencies(0).values()) == pytest.approx(1)
+    low, high = stats.mean_turns_interval()
+    assert low <= stats.mean_turns <= high
+    assert stats.turns_quantile(0) <= stats.turns_quantile(1) <= stats.max_turns
+    estimate = wilson_interval(0, 10)
+    assert estimate.value == 0 and estimate.low == 0 < estimate.high < 0.35
+    with pytest.raises(ValueError):
+        stats.merge(StrategyStats(2))
+
+
+def test_dataset_rows_see_the_game_from_the_deciding_seat():
+    state = GameState(3)
+    state.coins[:] = (5, 6, 7)
+    state.working[:, 0] = (1, 2, 3)
+    order = seat_order(3)
+    seen_by_1 = GameState(3, state.buffer[np.concatenate([order[1], [0] * 4])])
+    assert seen_by_1.coins.tolist() == [6, 7, 5]
+    assert seen_by_1.working[:, 0].tolist() == [2, 3, 1]
+
+    rows = play_game_rows(0, 3, SeedSequence(2, (0,)))
+    purchases = rows[rows["kind"] == KIND_IDS[PURCHASE]]
+    assert len(purchases) and (purchases["state"][:, 0] > 0).all()
+    winner = rows["player"][rows["won"] == 1]
+    assert len(set(winner.tolist())) == 1
+    assert (rows["won"] == (rows["player"] == winner[0])).all()
+
+
+def test_dataset_shard_headers_hold_any_row_count(tmp_path):
+    for n_players in (2, 5):
+        dtype = row_dtype(n_players)
+        sizes = {len(_npy_header(dtype, n)) for n in (0, 9, 10**6, 2**63 - 1)}
+        assert len(sizes) == 1 and sizes.pop() % 64 == 0
+    rows = np.zeros(150_000, row_dtype(2))
+    rows["game"] = np.arange(len(rows))
+    with DatasetWriter(tmp_path, 2, rows_per_shard=100_000) as writer:
+        writer.write(rows)
+    shards = open_dataset(tmp_path)
+    assert [len(shard) for shard in shards] == [100_000, 50_000]
+    assert (np.concatenate(shards)["game"] == rows["game"]).all()
+
+    game = MachiKoroGame(2, seed=1)
+    recorder = _RowRecorder(game, 0)
+    game.state.coins[0] = 40_000
+    recorder.record(Decision(PURCHASE, 0, ("wheat_field", None), game.view), None)
+    with pytest.raises(ValueError, match="state"):
+        recorder.rows(0)
+
+
+def test_dataset_shards_are_memory_mapped_npy_files(tmp_path):
+    rows = np.zeros(25, row_dtype(2))
+    rows["game"] = np.arange(25)
+    with DatasetWriter(tmp_path / "a", 2, rows_per_shard=10, buffer_rows=4) as writer:
+        writer.write(rows[:7])
+        writer.write(rows[7:])
+        with pytest.raises(ValueError):
+            writer.write(np.zeros(1, row_dtype(3)))
+    shards = open_dataset(tmp_path / "a")
+    assert [len(shard) for shard in shards] == [10, 10, 5]
+    assert isinstance(shards[0], np.memmap)
+    assert np.concatenate(shards)["game"].tolist() == list(range(25))
+    (tmp_path / "a" / "selfplay-00001.npy").unlink()
+    with DatasetWriter(tmp_path / "a", 2) as writer:
+        writer.write(rows[:3])
+    shards = open_dataset(tmp_path / "a")
+    assert [len(shard) for shard in shards] == [10, 5, 3]
+
+    n_rows = generate_dataset(tmp_path / "pooled", 6, 2, workers=2, seed=3, batch_rows=50)
+    pooled = np.concatenate(open_dataset(tmp_path / "pooled"))
+    generate_dataset(tmp_path / "in_process", 6, 2, workers=1, seed=3)
+    in_process = np.concatenate(open_dataset(tmp_path / "in_process"))
+    assert len(pooled) == len(in_process) == n_rows
+    assert (pooled[np.argsort(pooled["game"], kind="stable")] == in_process).all()
+
+
+class _CountingPolicy(RandomPolicy):
+    def __init__(self):
+        self.batch_sizes = []
+
+    def choose_batch(self, decisions):
+        self.batch_sizes.append(len(decisions))
+        return super().choose_batch(decisions)
+
+
+def test_broker_batches_decisions_across_game_threads():
+    def new_games():
+        return [MachiKoroGame(3, seed=SeedSequence(8, (i,))) for i in range(12)]
+
+    winners = []
+    for game in new_games():
+        game.play_game()
+        winners.append(game.is_game_over()[1])
+    policy = _CountingPolicy()
+    # the same games as played alone: each draws from its own random source
+    assert play_games_brokered(new_games(), policy, max_batch=8, max_wait=1) == winners
+    assert max(policy.batch_sizes) == 8
+    assert sum(policy.batch_sizes) / len(policy.batch_sizes) > 4
+    assert play_games_brokered(new_games(), policy, max_turns=5) == [-1] * 12
+    # the games past max_threads wait for a thread to finish its game
+    capped = _CountingPolicy()
+    assert play_games_brokered(new_games(), capped, max_wait=1, max_threads=3) == winners
+    assert max(capped.batch_sizes) == 3
+
+
+def test_broker_routes_results_and_errors():
+    class Failing:
+        def choose_batch(self, decisions):
+            raise KeyError("model")
+
+    game = MachiKoroGame(2, seed=1)
+    decision = Decision(PURCHASE, 0, ("wheat_field", None), game.view)
+    with InferenceBroker(_CountingPolicy(), max_wait=0) as broker:
+        assert broker.submit(decision).result() == "wheat_field"
+        assert broker.n_decisions == 1
+    with pytest.raises(RuntimeError):
+        broker.choose(decision)
+    with InferenceBroker(Failing()) as broker:
+        with pytest.raises(KeyError):
+            broker.choose(decision)
+
+
+class _MiddleOption:
+    def choose(self, decision):
+        return decision.options[len(decision.options) // 2]
+
+
+class _StubAgent:
+    """A local stand-in for a remote agent: answers like ``_MiddleOption``
+    after giving the event loop a turn."""
+
+    def __init__(self):
+        self.kinds = set()
+
+    async def choose(self, decision):
+        self.kinds.add(decision.kind)
+        await asyncio.sleep(0)
+        return _MiddleOption().choose(decision)
+
+
+def _all_buildings_game(seed, policies):
+    game = MachiKoroGame(
+        4,
+        starting_buildings=frozendict({card: (1, 1) for card in establishments_tuple}),
+        starting_major_establishments=major_establishments_tuple,
+        events=EventRecorder(),
+        seed=seed,
+        policies=policies,
+    )
+    return game, GameRecorder(game)
+
+
+def test_async_games_match_the_sync_engine():
+    agent = _StubAgent()
+    played = []
+    for seed in range(8):
+        sync = _all_buildings_game(seed, [_MiddleOption(), RandomPolicy()] * 2)
+        sync[0].play_game()
+        played.append((sync, _all_buildings_game(seed, [agent, RandomPolicy()] * 2)))
+    winners = asyncio.run(
+        play_games_async([game for _, (game, _) in played], max_concurrency=5)
+    )
+    # activation decisions are awaited by playing the turn again
+    assert {TARGET, "take_building", "give_building"} <= agent.kinds
+    for ((sync, sync_recorder), (game, recorder)), winner in zip(played, winners):
+        assert game.snapshot() == sync.snapshot()
+        assert game.is_game_over() == (True, winner)
+        assert game.events.events == sync.events.events
+        assert recorder.game_record() == sync_recorder.game_record()
+
+
+class _LoggedPolicy:
+    """Logs the index of every option ``policy`` takes, for ``ReplayPolicy``."""
+
+    def __init__(self, policy):
+        self.policy = policy
+        self.log = bytearray()
+
+    def choose(self, decision):
+        choice = self.policy.choose(decision)
+        self.log.append(decision.options.index(choice))
+        return choice
+
+
+def test_async_games_ask_stateful_sync_agents_once():
+    agent = _StubAgent()
+    for seed in range(4):
+        logged = _LoggedPolicy(RandomPolicy())
+        sync, _ = _all_buildings_game(seed, [_MiddleOption(), logged] * 2)
+        sync.play_game()
+        replay = ReplayPolicy(bytes(logged.log))
+        game, _ = _all_buildings_game(seed, [agent, replay] * 2)
+        asyncio.run(play_games_async([game]))
+        assert replay.position == len(logged.log)
+        assert game.snapshot() == sync.snapshot()
+        assert game.events.events == sync.events.events
+    assert {TARGET, "take_building", "give_building"} <= agent.kinds
+
+
+def test_async_turn_with_local_agents_takes_the_sync_path():
+    game = MachiKoroGame(2, seed=4)
+    sync = MachiKoroGame(2, seed=4)
+    for _ in range(20):
+        assert asyncio.run(take_turn_async(game)) == sync.take_turn()
+    assert game.snapshot() == sync.snapshot()
+
+    class Bad:
+        async def choose(self, decision):
+            return "no such option"
+
+    with pytest.raises(ValueError):
+        asyncio.run(take_turn_async(game, [Bad(), Bad()]))
+
+    class Never:
+        """Never buys anything."""
+
+        def __init__(self):
+            self.calls = 0
+
+        def choose(self, decision):
+            self.calls += 1
+            return decision.options[-1]
+
+    # sync agents given for the turn stand in for the game's policies
+    never = Never()
+    policies = game.policies
+    for _ in range(4):
+        assert asyncio.run(take_turn_async(game, [never, never])) is None
+    assert never.calls >= 4 and game.policies is policies
+
+
+def test_async_games_time_only_the_turns_that_get_through():
+    def new_game(seed, profiler):
+        return MachiKoroGame(
+            4,
+            starting_buildings=frozendict({card: (1, 1) for card in establishments_tuple}),
+            starting_major_establishments=major_establishments_tuple,
+            seed=seed,
+            policies=[_MiddleOption(), RandomPolicy()] * 2,
+            profiler=profiler,
+        )
+
+    sync_profiler, async_profiler = GameProfiler(), GameProfiler()
+    agent = _StubAgent()
+    for seed in range(3):
+        new_game(seed, sync_profiler).play_game()
+        game = new_game(seed, async_profiler)
+        asyncio.run(play_games_async([game], [[agent, RandomPolicy()] * 2]))
+    assert TARGET in agent.kinds
+    for sync, timed in (
+        (sync_profiler.phases, async_profiler.phases),
+        (sync_profiler.cards, async_profiler.cards),
+    ):
+        assert {name: c[0] for name, c in sync.items()} == {
+            name: c[0] for name, c in timed.items()
+        }
+
+
+def test_server_load_test_keeps_clients_in_sync():
+    report = asyncio.run(load_test(n_clients=5, players=2, max_turns=30))
+    assert report["clients"] == 5 and report["sessions"] == 3
+    assert report["out_of_sync"] == 0
+    assert report["decisions"] == report["server_latency"]["decision"]["count"] > 0
+    assert report["client_latency"]["p50"] <= report["client_latency"]["max"]
+
+
+def test_server_sessions_reconnect_from_a_snapshot():
+    async def play():
+        async with GameServer() as server:
+            host, port = server.host, server.port
+            status, created = await http_json(
+                host, port, "POST", "/sessions",
+                {"n_players": 3, "seats": ["bot", "remote", "bot"], "seed": 2},
+            )
+            assert status == 201 and list(created["tokens"]) == ["1"]
+            session_id = created["session"]
+            path = f"/sessions/{session_id}"
+            assert (await http_json(host, port, "GET", path + "x"))[0] == 404
+            refused = await http_json(host, port, "POST", "/sessions", {"seats": ["ai"]})
+            assert refused[0] == 400
+            wrong = BotClient(host, port, session_id, 1, "wrong")
+            with pytest.raises(WebSocketError, match="403"):
+                await wrong.run()
+
+            client = BotClient(
+                host, port, session_id, 1, created["tokens"]["1"], reconnect_every=4
+            )
+            await client.run()
+            session = server.sessions[session_id]
+            status, snapshot = await http_json(host, port, "GET", path)
+            _, metrics = await http_json(host, port, "GET", path + "/metrics")
+            _, sessions = await http_json(host, port, "GET", "/sessions")
+        return client, session, snapshot, metrics, sessions
+
+    client, session, snapshot, metrics, sessions = asyncio.run(play())
+    assert client.n_reconnects == client.n_prompts // 4 > 0
+    assert client.in_sync and client.winner == session.winner >= 0
+    assert (client.state == session.game.state.buffer).all()
+    assert snapshot["finished"] and snapshot["turn"] == session.game.current_turn
+    assert metrics["decision"]["count"] == client.n_prompts - client.n_reconnects
+    assert [summary["session"] for summary in sessions] == [session.session_id]
+
+
+def test_server_closes_websockets_that_break_the_protocol():
+    async def close_code(frame_header):
+        async with GameServer() as server:
+            session = server.create_session(2, ["remote", "bot"], seed=1)
+            path = f"/sessions/{session.session_id}/ws?seat=0&token={session.tokens[0]}"
+            socket = await connect(server.host, server.port, path)
+            socket.writer.write(frame_header)
+            await socket.writer.drain()
+            opcode = None
+            while opcode != CLOSE:
+                opcode, payload = await read_frame(socket.reader)
+            await socket.close()
+            for _ in range(100):
+                if 0 not in session.connections:
+                    break
+                await asyncio.sleep(0.01)
+            assert 0 not in session.connections
+            return int.from_bytes(payload, "big")
+
+    # a first fragment, then a frame over MAX_PAYLOAD, then text that is not UTF-8
+    assert asyncio.run(close_code(bytes([TEXT, 0x80 | 1, 0, 0, 0, 0]))) == 1002
+    assert asyncio.run(close_code(encode_frame(TEXT, b"\xff\xfe", True))) == 1007
+    too_big = bytes([0x80 | TEXT, 0x80 | 127]) + (1 << 30).to_bytes(8, "big")
+    assert asyncio.run(close_code(too_big)) == 1009
@@ -0,0 +1,170 @@
+"""Just enough of RFC 6455 for server.py, on asyncio streams.
+
+The opening handshake for both ends and unfragmented frames: text, close,
+ping and pong. Clients mask what they send, servers do not.
+"""
+
+import asyncio
+import base64
+import hashlib
+import os
+import struct
+from typing import Dict, Optional, Tuple
+
+_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+TEXT = 0x1
+CLOSE = 0x8
+PING = 0x9
+PONG = 0xA
+MAX_PAYLOAD = 1 << 20
+
+
+PROTOCOL_ERROR = 1002
+INVALID_PAYLOAD = 1007
+MESSAGE_TOO_BIG = 1009
+
+
+class WebSocketError(Exception):
+    """A handshake or frame that breaks the protocol; ``code`` is the close
+    code to answer it with."""
+
+    def __init__(self, message: str, code: int = PROTOCOL_ERROR):
+        super().__init__(message)
+        self.code = code
+
+
+def accept_key(key: str) -> str:
+    """The ``Sec-WebSocket-Accept`` answer to a client's ``Sec-WebSocket-Key``."""
+    return base64.b64encode(hashlib.sha1(key.encode() + _GUID).digest()).decode()
+
+
+def handshake_response(headers: Dict[str, str]) -> bytes:
+    """The server's ``101`` response to an upgrade request's ``headers``
+    (lower-case names)."""
+    upgrade = headers.get("upgrade", "").lower()
+    if upgrade != "websocket" or "sec-websocket-key" not in headers:
+        raise WebSocketError("not a websocket upgrade request")
+    return (
+        "HTTP/1.1 101 Switching Protocols\r\n"
+        "Upgrade: websocket\r\n"
+        "Connection: Upgrade\r\n"
+        f"Sec-WebSocket-Accept: {accept_key(headers['sec-websocket-key'])}\r\n\r\n"
+    ).encode()
+
+
+def encode_frame(opcode: int, payload: bytes, mask: bool) -> bytes:
+    size = len(payload)
+    if size < 126:
+        header = struct.pack("!BB", 0x80 | opcode, (0x80 if mask else 0) | size)
+    elif size < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, (0x80 if mask else 0) | 126, size)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, (0x80 if mask else 0) | 127, size)
+    if not mask:
+        return header + payload
+    key = os.urandom(4)
+    return header + key + _apply_mask(payload, key)
+
+
+def _apply_mask(payload: bytes, key: bytes) -> bytes:
+    # xor with the key repeated, as one big integer
+    repeated = (key * (len(payload) // 4 + 1))[: len(payload)]
+    masked = int.from_bytes(payload, "big") ^ int.from_bytes(repeated, "big")
+    return masked.to_bytes(len(payload), "big")
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    first, second = await reader.readexactly(2)
+    if not first & 0x80:
+        raise WebSocketError("fragmented frames are not supported")
+    opcode = first & 0x0F
+    size = second & 0x7F
+    if size == 126:
+        (size,) = struct.unpack("!H", await reader.readexactly(2))
+    elif size == 127:
+        (size,) = struct.unpack("!Q", await reader.readexactly(8))
+    if size > MAX_PAYLOAD:
+        raise WebSocketError(f"frame of {size} bytes is too large", MESSAGE_TOO_BIG)
+    key = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(size)
+    if key is not None:
+        payload = _apply_mask(payload, key)
+    return opcode, payload
+
+
+class WebSocket:
+    """A connection after the handshake; ``mask`` is True on the client end."""
+
+    def __init__(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, mask: bool
+    ):
+        self.reader = reader
+        self.writer = writer
+        self.mask = mask
+        self.closed = False
+
+    async def send(self, text: str) -> None:
+        if self.closed:
+            raise ConnectionError("the websocket is closed")
+        self.writer.write(encode_frame(TEXT, text.encode(), self.mask))
+        await self.writer.drain()
+
+    async def receive(self) -> Optional[str]:
+        """The next text message, or None once the connection is closed,
+        which it is after a frame that breaks the protocol."""
+        while not self.closed:
+            try:
+                opcode, payload = await read_frame(self.reader)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                self.closed = True
+                break
+            except WebSocketError as error:
+                await self.close(error.code)
+                break
+            if opcode == TEXT:
+                try:
+                    return payload.decode()
+                except UnicodeDecodeError:
+                    await self.close(INVALID_PAYLOAD)
+                    break
+            if opcode == PING:
+                self.writer.write(encode_frame(PONG, payload, self.mask))
+                await self.writer.drain()
+            elif opcode == CLOSE:
+                await self.close()
+        return None
+
+    async def close(self, code: Optional[int] = None) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        payload = b"" if code is None else struct.pack("!H", code)
+        try:
+            self.writer.write(encode_frame(CLOSE, payload, self.mask))
+            await self.writer.drain()
+        except ConnectionError:
+            pass
+        self.writer.close()
+
+
+async def connect(host: str, port: int, path: str) -> WebSocket:
+    """Open a client websocket to ``ws://host:port/path``."""
+    reader, writer = await asyncio.open_connection(host, port)
+    key = base64.b64encode(os.urandom(16)).decode()
+    writer.write(
+        (
+            f"GET {path} HTTP/1.1\r\n"
+            f"Host: {host}:{port}\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\n"
+            "Sec-WebSocket-Version: 13\r\n\r\n"
+        ).encode()
+    )
+    await writer.drain()
+    response = await reader.readuntil(b"\r\n\r\n")
+    status = response.split(b"\r\n", 1)[0]
+    if status.split()[1:2] != [b"101"] or accept_key(key).encode() not in response:
+        writer.close()
+        raise WebSocketError(f"handshake refused: {status.decode(errors='replace')}")
+    return WebSocket(reader, writer, mask=True)